@@ -14,6 +14,18 @@ a = Analysis(
         ('yandex_music_services.py', '.'),
         ('lyrics_services.py', '.'), 
         ('threading_utils.py', '.'),
+        ('search_engine.py', '.'),
+        ('search_cache.py', '.'),
+        ('url_cache_store.py', '.'),
+        ('preload_scheduler.py', '.'),
+        ('wave_buffer.py', '.'),
+        ('lru_set.py', '.'),
+        ('audio_cache.py', '.'),
+        ('http_pool.py', '.'),
+        ('json_codec.py', '.'),
+        ('library_store.py', '.'),
+        ('library_index.py', '.'),
+        ('library_views.py', '.'),
         ('chromedriver_manager.py', '.'), 
         ('setup_chromedriver.py', '.'), 
         ('chromedriver.exe', '.'),
@@ -22,7 +34,7 @@ a = Analysis(
         ('music_tag_dictionary.json', '.'),
         ('bin\\ffmpeg', 'bin\\ffmpeg')
     ],
-    hiddenimports=['flask_cors', 'yt_dlp', 'selenium', 'webdriver_manager', 'yandex_music', 'soundcloud_services', 'yandex_music_services', 'youtube_services'],
+    hiddenimports=['flask_cors', 'yt_dlp', 'selenium', 'webdriver_manager', 'yandex_music', 'orjson', 'soundcloud_services', 'yandex_music_services', 'youtube_services'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
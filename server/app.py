@@ -9,6 +9,14 @@ import youtube_services
 import soundcloud_services
 import yandex_music_services
 import lyrics_services
+import search_engine
+import audio_cache
+import library_views
+import json_codec
+from http_pool import http_pool
+from search_cache import search_cache
+from library_store import LibraryStore
+from library_index import LibraryIndex, VersionConflict
 # import audio_analysis  # Temporarily disabled
 
 try:
@@ -29,6 +37,7 @@ server_running = True
 
 app = Flask(__name__)
 CORS(app)
+json_codec.init_json(app)
 
 def get_user_data_dir():
     if platform.system() == "Windows":
@@ -82,6 +91,11 @@ sys.stderr = StreamToLogger(logger, logging.ERROR)
 PLAYLISTS_FILE = os.path.join(USER_DATA_DIR, "playlists.json")
 logger.info(f"[P] Playlists file path: {PLAYLISTS_FILE}")
 SAVED_TRACKS_FILE = os.path.join(USER_DATA_DIR, "saved_tracks.json")
+# Плейлисты, избранное и сохраненные треки; JSON-файлы выше переносятся в нее при первом запуске
+LIBRARY_DB_FILE = os.path.join(USER_DATA_DIR, "library.sqlite3")
+library_store = LibraryStore(LIBRARY_DB_FILE)
+# Чтения идут из памяти, записи сбрасываются в library_store в фоне
+library = LibraryIndex(library_store)
 COOKIE_FILE = os.path.join(USER_DATA_DIR, "youtube_cookies.txt")
 
 CACHE_DIR = os.path.join(USER_DATA_DIR, "cache")
@@ -143,193 +157,40 @@ print(f"[FF] Using: {FFMPEG_DIR or 'system ffmpeg'}")
 
 MAX_CACHE_SIZE = 1 * 1024 * 1024 * 1024
 CACHE_EXPIRY = 3600
+URL_REFRESH_INTERVAL = 300
 
 
 def load_playlists():
     try:
-        if os.path.exists(PLAYLISTS_FILE):
-            logger.info(f"[P] Loading playlists from {PLAYLISTS_FILE}")
-            with open(PLAYLISTS_FILE, "r", encoding="utf-8") as f:
-                data = json.load(f)
-                if 'liked_tracks' not in data:
-                    data['liked_tracks'] = []
-                return data
-        else:
-            logger.warning(f"[P] Playlists file not found at {PLAYLISTS_FILE}, creating new.")
-            data = {"playlists": [], "liked_tracks": []}
-            with open(PLAYLISTS_FILE, "w", encoding="utf-8") as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
-            return data
-
-    except PermissionError as e:
-        logger.error(f"[P] Permission denied accessing playlists file at {PLAYLISTS_FILE}: {e}")
-        return {"playlists": [], "liked_tracks": []}
-
+        return library.load_playlists()
     except Exception as e:
-        logger.error(f"[P] Error loading playlists from {PLAYLISTS_FILE}: {e}")
+        logger.error(f"[P] Error loading playlists from {LIBRARY_DB_FILE}: {e}")
         return {"playlists": [], "liked_tracks": []}
 
 def save_playlists(data):
-    max_attempts = 5
-    base_delay = 0.1
-    
-    for attempt in range(max_attempts):
-        try:
-            playlists_dir = os.path.dirname(PLAYLISTS_FILE)
-            os.makedirs(playlists_dir, exist_ok=True)
-            
-            temp_file = f"{PLAYLISTS_FILE}.{time.time()}.temp"
-            
-            with open(temp_file, "w", encoding="utf-8") as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
-                f.flush()
-                os.fsync(f.fileno())
-            
-            try:
-                if os.path.exists(PLAYLISTS_FILE):
-                    backup_file = f"{PLAYLISTS_FILE}.bak"
-                    try:
-                        shutil.copy2(PLAYLISTS_FILE, backup_file)
-                    except Exception as be:
-                        print(f"[P] Backup warning: {be}")
-                
-                if os.path.exists(PLAYLISTS_FILE):
-                    try:
-                        os.remove(PLAYLISTS_FILE)
-                    except Exception as re:
-                        print(f"[P] Warning cleaning target: {re}")
-                
-                shutil.move(temp_file, PLAYLISTS_FILE)
-            except Exception as move_error:
-                print(f"[P] Move error (attempt {attempt+1}): {move_error}")
-                try:
-                    shutil.copy2(temp_file, PLAYLISTS_FILE)
-                    try:
-                        os.remove(temp_file)
-                    except:
-                        pass
-                except Exception as copy_error:
-                    print(f"[P] Copy fallback error: {copy_error}")
-                    raise
-            
-            if os.path.exists(PLAYLISTS_FILE):
-                print(f"[P] Playlists saved successfully, size: {os.path.getsize(PLAYLISTS_FILE)} bytes")
-                logger.info(f"Playlists saved successfully to {PLAYLISTS_FILE}")
-                try:
-                    if os.path.exists(temp_file):
-                        os.remove(temp_file)
-                except:
-                    pass
-                return True
-            else:
-                raise Exception(f"Save succeeded but file {PLAYLISTS_FILE} not found")
-                
-        except Exception as e:
-            delay = base_delay * (2 ** attempt)
-            print(f"[P] Save error (attempt {attempt+1}/{max_attempts}): {e}")
-            logger.error(f"Error saving playlists (attempt {attempt+1}): {e}")
-            
-            if attempt < max_attempts - 1:
-                print(f"[P] Retrying in {delay:.2f} seconds...")
-                time.sleep(delay)
-            else:
-                logger.error(f"Failed to save playlists after {max_attempts} attempts")
-                logger.error(traceback.format_exc())
-                try:
-                    with open(PLAYLISTS_FILE, "w", encoding="utf-8") as f:
-                        json.dump(data, f, ensure_ascii=False, indent=2)
-                    print(f"[P] Emergency direct write successful")
-                    logger.info("Emergency direct write successful")
-                    return True
-                except Exception as final_e:
-                    print(f"[P] Final direct write failed: {final_e}")
-                    logger.error(f"Final direct write failed: {final_e}")
-                return False
-    
-    return False
+    try:
+        library.replace_playlists(data)
+        return True
+    except Exception as e:
+        print(f"[P] Save error: {e}")
+        logger.error(f"Error saving playlists: {e}")
+        logger.error(traceback.format_exc())
+        return False
 
 def load_saved_tracks():
-    if os.path.exists(SAVED_TRACKS_FILE):
-        try:
-            with open(SAVED_TRACKS_FILE, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except Exception as e:
-            print(f"[ST] Load error: {e}")
+    try:
+        return library.load_saved_tracks()
+    except Exception as e:
+        print(f"[ST] Load error: {e}")
     return {"saved_tracks": []}
 
 def save_saved_tracks(data):
-    max_attempts = 5
-    base_delay = 0.1
-    
-    for attempt in range(max_attempts):
-        try:
-            tracks_dir = os.path.dirname(SAVED_TRACKS_FILE)
-            os.makedirs(tracks_dir, exist_ok=True)
-            
-            temp_file = f"{SAVED_TRACKS_FILE}.{time.time()}.temp"
-            
-            with open(temp_file, "w", encoding="utf-8") as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
-                f.flush()
-                os.fsync(f.fileno())
-            
-            try:
-                if os.path.exists(SAVED_TRACKS_FILE):
-                    backup_file = f"{SAVED_TRACKS_FILE}.bak"
-                    try:
-                        shutil.copy2(SAVED_TRACKS_FILE, backup_file)
-                    except Exception as be:
-                        print(f"[ST] Backup warning: {be}")
-                
-                if os.path.exists(SAVED_TRACKS_FILE):
-                    try:
-                        os.remove(SAVED_TRACKS_FILE)
-                    except Exception as re:
-                        print(f"[ST] Warning cleaning target: {re}")
-                
-                shutil.move(temp_file, SAVED_TRACKS_FILE)
-            except Exception as move_error:
-                print(f"[ST] Move error (attempt {attempt+1}): {move_error}")
-                try:
-                    shutil.copy2(temp_file, SAVED_TRACKS_FILE)
-                    try:
-                        os.remove(temp_file)
-                    except:
-                        pass
-                except Exception as copy_error:
-                    print(f"[ST] Copy fallback error: {copy_error}")
-                    raise
-            
-            if os.path.exists(SAVED_TRACKS_FILE):
-                print(f"[ST] Saved tracks saved, size: {os.path.getsize(SAVED_TRACKS_FILE)} bytes")
-                try:
-                    if os.path.exists(temp_file):
-                        os.remove(temp_file)
-                except:
-                    pass
-                return True
-            else:
-                raise Exception(f"Save succeeded but file {SAVED_TRACKS_FILE} not found")
-                
-        except Exception as e:
-            delay = base_delay * (2 ** attempt)
-            print(f"[ST] Save error (attempt {attempt+1}/{max_attempts}): {e}")
-            
-            if attempt < max_attempts - 1:
-                print(f"[ST] Retrying in {delay:.2f} seconds...")
-                time.sleep(delay)
-            else:
-                print(f"[ST] Failed to save tracks after {max_attempts} attempts")
-                try:
-                    with open(SAVED_TRACKS_FILE, "w", encoding="utf-8") as f:
-                        json.dump(data, f, ensure_ascii=False, indent=2)
-                    print(f"[ST] Emergency direct write successful")
-                    return True
-                except Exception as final_e:
-                    print(f"[ST] Final direct write failed: {final_e}")
-                return False
-    
-    return False
+    try:
+        library.replace_saved_tracks(data)
+        return True
+    except Exception as e:
+        print(f"[ST] Save error: {e}")
+        return False
 
 def clean_cache():
     while server_running:
@@ -344,19 +205,22 @@ def clean_cache():
                     'expired': 0,
                     'unused_preloaded': 0,
                     'old_used': 0,
+                    'over_limit': 0,
                     'kept': 0
                 }
                 
+                # Ссылки живут до своего реального expire, а не фиксированный час;
+                # давние записи уходят из памяти раньше, копия на диске остается
                 for k, v in youtube_services.youtube_url_cache.items():
                     age = now - v['timestamp']
                     
-                    if age > CACHE_EXPIRY:
+                    if youtube_services.entry_remaining(v, now) <= youtube_services.URL_EXPIRY_SAFETY_MARGIN:
                         to_remove.append(k)
                         stats['expired'] += 1
-                    elif v.get('preloaded', False) and age > 1800:
+                    elif v.get('preloaded', False) and age > youtube_services.PRELOADED_UNUSED_TTL:
                         to_remove.append(k)
                         stats['unused_preloaded'] += 1
-                    elif v.get('used', False) and age > 7200:
+                    elif v.get('used', False) and age > youtube_services.USED_URL_TTL:
                         to_remove.append(k)
                         stats['old_used'] += 1
                     else:
@@ -365,12 +229,19 @@ def clean_cache():
                 for k in to_remove:
                     del youtube_services.youtube_url_cache[k]
                 
-                total_removed = len(to_remove)
+                stats['over_limit'] = youtube_services.trim_url_cache_locked()
+                stats['kept'] -= stats['over_limit']
+                total_removed = len(to_remove) + stats['over_limit']
+            
+            if youtube_services.url_cache_store is not None:
+                pruned = youtube_services.url_cache_store.prune_expired()
+                if pruned:
+                    print(f"[Cache] Pruned {pruned} expired URLs from disk cache")
             
             if total_removed > 0:
                 print(f"[Cache] Cleanup completed: removed {total_removed} entries "
                       f"(expired: {stats['expired']}, unused preloaded: {stats['unused_preloaded']}, "
-                      f"old used: {stats['old_used']}, kept: {stats['kept']})")
+                      f"old used: {stats['old_used']}, over limit: {stats['over_limit']}, kept: {stats['kept']})")
             
         except Exception as e:
             error_msg = f"[Cache] Error cleaning cache: {e}"
@@ -380,6 +251,47 @@ def clean_cache():
             import traceback
             logger.error(f"Cache cleanup traceback: {traceback.format_exc()}")
 
+def refresh_url_cache():
+    while server_running:
+        try:
+            time.sleep(URL_REFRESH_INTERVAL)
+            youtube_services.refresh_expiring_urls(FFMPEG_DIR, COOKIE_FILE)
+        except Exception as e:
+            print(f"[Cache] Error refreshing URLs: {e}")
+            logger.error(f"URL refresh error: {type(e).__name__}: {str(e)}")
+
+def _search_youtube_provider(query, timeout):
+    return youtube_services.search_youtube(query, FFMPEG_DIR, COOKIE_FILE, timeout=timeout)
+
+def _search_soundcloud_provider(query, timeout):
+    soundcloud_client_id = soundcloud_services.get_soundcloud_client_id(SOUNDCLOUD_SETTINGS_FILE)
+    return soundcloud_services.search_soundcloud(query, soundcloud_client_id, timeout=timeout)
+
+def _search_yandex_music_provider(query, timeout):
+    return yandex_music_services.search_yandex_music(query, timeout=timeout)
+
+SEARCH_LOG_TAGS = {
+    "youtube": "YT",
+    "soundcloud": "SC",
+    "yandex_music": "YM"
+}
+
+federated_search = search_engine.FederatedSearch(max_workers=search_engine.SEARCH_MAX_WORKERS)
+federated_search.register("youtube", _search_youtube_provider, timeout=search_engine.DEFAULT_PROVIDER_TIMEOUTS['youtube'])
+federated_search.register("soundcloud", _search_soundcloud_provider, timeout=search_engine.DEFAULT_PROVIDER_TIMEOUTS['soundcloud'])
+federated_search.register("yandex_music", _search_yandex_music_provider, timeout=search_engine.DEFAULT_PROVIDER_TIMEOUTS['yandex_music'])
+
+def log_search_block(query, block):
+    tag = SEARCH_LOG_TAGS.get(block["provider"], block["provider"])
+    if block["timed_out"]:
+        print(f"[{tag}] '{query}' timed out after {block['elapsed']:.2f}s")
+        logger.warning(f"{block['provider']} search timeout for '{query}'")
+    elif block["error"]:
+        print(f"[{tag}] Error: {block['error']}")
+        logger.error(f"{block['provider']} search error for '{query}': {block['error']}")
+    else:
+        print(f"[{tag}] '{query}' in {block['elapsed']:.2f}s")
+
 @app.route('/api/search', methods=['GET'])
 def search_all():
     query = request.args.get('query', '').strip()
@@ -392,39 +304,63 @@ def search_all():
         "yandex_music": [],
         "vkmusic": []
     }
+    search_meta = {}
     
-    try:
-        start_t = time.time()
-        results["youtube"] = youtube_services.search_youtube(query, FFMPEG_DIR, COOKIE_FILE)
-        print(f"[YT] '{query}' in {time.time()-start_t:.2f}s")
-    except Exception as e:
-        error_msg = f"[YT] Error: {e}"
-        print(error_msg)
-        logger.error(f"YouTube search error for '{query}': {type(e).__name__}: {str(e)}")
-    
-    try:
-        start_s = time.time()
-        soundcloud_client_id = soundcloud_services.get_soundcloud_client_id(SOUNDCLOUD_SETTINGS_FILE)
-        results["soundcloud"] = soundcloud_services.search_soundcloud(query, soundcloud_client_id)
-        print(f"[SC] '{query}' in {time.time()-start_s:.2f}s")
-    except Exception as e:
-        error_msg = f"[SC] Error: {e}"
-        print(error_msg)
-        logger.error(f"SoundCloud search error for '{query}': {type(e).__name__}: {str(e)}")
-    
-    try:
-        start_ym = time.time()
-        results["yandex_music"] = yandex_music_services.search_yandex_music(query)
-        print(f"[YM] '{query}' in {time.time()-start_ym:.2f}s")
-    except Exception as e:
-        error_msg = f"[YM] Error: {e}"
-        print(error_msg)
-        logger.error(f"Yandex Music search error for '{query}': {type(e).__name__}: {str(e)}")
+    start_t = time.time()
+    for block in federated_search.iter_results(query):
+        log_search_block(query, block)
+        results[block["provider"]] = block["results"]
+        search_meta[block["provider"]] = search_engine.block_meta(block)
     
     results["vkmusic"] = []
+    results["search_meta"] = search_meta
+    print(f"[Search] '{query}' done in {time.time()-start_t:.2f}s")
     
     return jsonify(results)
 
+@app.route('/api/search/stream', methods=['GET'])
+def search_all_stream():
+    """Потоковый поиск: блок каждого провайдера отправляется сразу по готовности.
+
+    По умолчанию NDJSON (одна JSON-строка на провайдера), при format=sse -
+    Server-Sent Events. Последнее сообщение имеет type=done.
+    """
+    query = request.args.get('query', '').strip()
+    if not query:
+        return jsonify({"error": "Query parameter is required"}), 400
+
+    use_sse = request.args.get('format', 'ndjson').lower() == 'sse'
+
+    def encode(payload, event):
+        data = json.dumps(payload, ensure_ascii=False)
+        if use_sse:
+            return f"event: {event}\ndata: {data}\n\n"
+        return data + "\n"
+
+    def generate():
+        start_t = time.time()
+        search_meta = {}
+        try:
+            for block in federated_search.iter_results(query):
+                log_search_block(query, block)
+                search_meta[block["provider"]] = search_engine.block_meta(block)
+                yield encode({"type": "results", **block}, "results")
+        except Exception as e:
+            print(f"[Search] Stream error: {e}")
+            yield encode({"type": "error", "error": str(e)}, "error")
+
+        elapsed = round(time.time() - start_t, 3)
+        print(f"[Search] '{query}' streamed in {elapsed:.2f}s")
+        yield encode({"type": "done", "elapsed": elapsed, "search_meta": search_meta}, "done")
+
+    response = Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream' if use_sse else 'application/x-ndjson'
+    )
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
 @app.route('/api/lyrics', methods=['GET'])
 def get_lyrics():
     title = request.args.get('title', '').strip()
@@ -445,12 +381,70 @@ def get_lyrics():
         print(f"[Lyrics] Error: {e}")
         return jsonify({"error": str(e)}), 500
 
+def conditional_library_response(kind, revision, build):
+    """Ответ с ETag; 304, если клиент уже видел эту ревизию.
+
+    revision - дешевая текущая ревизия; снимок данных build() -> (ревизия, ответ)
+    берется только когда тело действительно нужно.
+    """
+    etag = library_views.make_etag(kind, revision, request.query_string)
+    if etag in request.if_none_match:
+        response = Response(status=304)
+    else:
+        try:
+            revision, result = build()
+        except library_views.StaleCursorError as e:
+            return jsonify({"error": str(e)}), 409
+        except library_views.CursorError as e:
+            return jsonify({"error": str(e)}), 400
+        # Библиотека могла измениться после проверки - ETag по ревизии снимка
+        etag = library_views.make_etag(kind, revision, request.query_string)
+        response = json_codec.json_response(result)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['Access-Control-Expose-Headers'] = 'ETag'
+    return response
+
 @app.route('/api/playlists', methods=['GET'])
 def get_playlists():
-    data = load_playlists()
-    if 'liked_tracks' not in data:
-        data['liked_tracks'] = []
-    return jsonify(data)
+    """Плейлисты и лайки.
+
+    Параметры (все необязательные): fields=id,title - проекция треков;
+    include_tracks=0 - плейлисты без треков, только track_count;
+    limit/cursor - страницы плейлистов; liked_limit/liked_cursor - страницы лайков.
+    """
+    def build():
+        revision, data = library.playlists_snapshot()
+        args = request.args
+        fields = library_views.parse_fields(args.get('fields'))
+        include_tracks = args.get('include_tracks', '1').lower() not in ('0', 'false', 'no')
+
+        playlists, next_cursor = library_views.paginate(
+            data.get('playlists', []), revision, args.get('cursor'),
+            library_views.parse_limit(args.get('limit')))
+        liked, liked_next_cursor = library_views.paginate(
+            data.get('liked_tracks', []), revision, args.get('liked_cursor'),
+            library_views.parse_limit(args.get('liked_limit')))
+
+        result_playlists = []
+        for playlist in playlists:
+            tracks = playlist.get('tracks', [])
+            if include_tracks:
+                playlist = dict(playlist, tracks=library_views.project_tracks(tracks, fields))
+            else:
+                playlist = {k: v for k, v in playlist.items() if k != 'tracks'}
+                playlist['track_count'] = len(tracks)
+            result_playlists.append(playlist)
+
+        result = dict(data, playlists=result_playlists,
+                      liked_tracks=library_views.project_tracks(liked, fields))
+        if 'limit' in args:
+            result['next_cursor'] = next_cursor
+        if 'liked_limit' in args:
+            result['liked_next_cursor'] = liked_next_cursor
+        return revision, result
+
+    return conditional_library_response('playlists', library.playlists_revision(), build)
 
 @app.route('/api/playlists/track-chunk', methods=['POST'])
 def save_track_chunk():
@@ -469,17 +463,10 @@ def save_track_chunk():
         total_chunks = data['totalChunks']
         tracks = data['trackChunk']
         
-        playlists_data = load_playlists()
-        
-        for playlist in playlists_data.get('playlists', []):
-            if str(playlist.get('id')) == playlist_id:
-                for track in tracks:
-                    if track not in playlist['tracks']:
-                        playlist['tracks'].append(track)
-                break
-        
-        success = save_playlists(playlists_data)
-        if not success:
+        try:
+            library.append_playlist_tracks(playlist_id, tracks)
+        except Exception as e:
+            print(f"[P] Error appending chunk: {e}")
             return jsonify({"error": "Failed to save playlists"}), 500
         
         return jsonify({
@@ -505,27 +492,13 @@ def update_playlists():
             total_groups = data['total_groups']
             print(f"[P] Received playlist group {group_index+1}/{total_groups}")
             
-            current_data = load_playlists()
-            
             liked_tracks = data.get('liked_tracks', [])
-            current_data['liked_tracks'] = liked_tracks
-            
             new_playlists = data.get('playlists', [])
             
-            existing_ids = [p.get('id') for p in current_data.get('playlists', [])]
-            
-            for new_playlist in new_playlists:
-                new_id = new_playlist.get('id')
-                if new_id in existing_ids:
-                    for i, playlist in enumerate(current_data['playlists']):
-                        if playlist.get('id') == new_id:
-                            current_data['playlists'][i] = new_playlist
-                            break
-                else:
-                    current_data.setdefault('playlists', []).append(new_playlist)
-            
-            success = save_playlists(current_data)
-            if not success:
+            try:
+                library.upsert_playlists(new_playlists, liked_tracks)
+            except Exception as e:
+                print(f"[P] Error saving group: {e}")
                 return jsonify({"error": "Failed to save playlists"}), 500
             
             return jsonify({
@@ -542,6 +515,37 @@ def update_playlists():
         print(f"[P] Error updating playlists: {e}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/playlists/patch', methods=['POST'])
+def patch_playlists():
+    """Точечные правки плейлистов и избранного вместо отправки всей библиотеки.
+
+    Тело: {"ops": [{"op": "add_tracks", "playlist_id": ..., "tracks": [...],
+    "position": 0, "version": 12}, ...]}. Поддерживаются add_tracks,
+    remove_tracks, move_track, rename, create_playlist, delete_playlist и
+    like. При несовпадении version отвечаем 409 и ничего не меняем.
+    """
+    try:
+        data = request.json
+        if not data or not isinstance(data.get('ops'), list):
+            return jsonify({"error": "Ops list is required"}), 400
+        
+        results, versions = library.apply_patch(data['ops'])
+        return jsonify({"success": True, "results": results, "versions": versions})
+    except VersionConflict as e:
+        print(f"[P] {e}")
+        return jsonify({"error": str(e), "target": e.target, "version": e.current}), 409
+    except LookupError as e:
+        return jsonify({"error": str(e)}), 404
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        print(f"[P] Error applying patch: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/playlists/versions', methods=['GET'])
+def get_playlist_versions():
+    return jsonify(library.versions())
+
 @app.route('/api/set-current-track', methods=['POST'])
 def set_current_track():
     try:
@@ -556,6 +560,8 @@ def set_current_track():
             youtube_services.current_playing_track = f"{platform}:{track_id}"
             print(f"[CT] Set: {youtube_services.current_playing_track}")
         
+        youtube_services.notify_current_track(track_id)
+        
         return jsonify({"success": True, "current_track": youtube_services.current_playing_track})
     except Exception as e:
         print(f"[CT] Error: {e}")
@@ -581,14 +587,12 @@ def preload_youtube_tracks():
             return jsonify({"error": "Invalid track_ids format"}), 400
         
         tracks_to_preload = []
-        with youtube_services.youtube_cache_lock:
-            now = time.time()
-            for track_id in track_ids:
-                cached = youtube_services.youtube_url_cache.get(track_id)
-                if not cached or (now - cached['timestamp'] > 3000):
-                    tracks_to_preload.append(track_id)
-                else:
-                    print(f"[Preload] Skip {track_id} - already cached")
+        for track_id in track_ids:
+            # get_cached_url также подхватывает ссылки из дискового кэша
+            if youtube_services.get_cached_url(track_id, min_remaining=youtube_services.URL_REFRESH_WINDOW):
+                print(f"[Preload] Skip {track_id} - already cached")
+            else:
+                tracks_to_preload.append(track_id)
         
         if not tracks_to_preload:
             return jsonify({
@@ -599,18 +603,13 @@ def preload_youtube_tracks():
                 "context": context
             })
         
-        threading.Thread(
-            target=youtube_services.preload_tracks_async,
-            args=(tracks_to_preload, FFMPEG_DIR, COOKIE_FILE, current_track_id, context),
-            daemon=True
-        ).start()
-        
-        print(f"[Preload] Started preloading {len(tracks_to_preload)} tracks for context '{context}': {tracks_to_preload}")
+        queued = youtube_services.schedule_preload(tracks_to_preload, current_track_id, context)
         
         return jsonify({
             "success": True,
-            "message": f"Preloading started for {len(tracks_to_preload)} tracks",
+            "message": f"Preloading queued for {len(tracks_to_preload)} tracks",
             "preloaded": len(tracks_to_preload),
+            "queued": queued,
             "skipped": len(track_ids) - len(tracks_to_preload),
             "context": context
         })
@@ -621,8 +620,20 @@ def preload_youtube_tracks():
 
 @app.route('/api/saved-tracks', methods=['GET'])
 def get_saved_tracks():
-    data = load_saved_tracks()
-    return jsonify(data)
+    """Сохраненные треки; поддерживает fields, limit/cursor и If-None-Match"""
+    def build():
+        revision, data = library.saved_snapshot()
+        args = request.args
+        tracks, next_cursor = library_views.paginate(
+            data.get('saved_tracks', []), revision, args.get('cursor'),
+            library_views.parse_limit(args.get('limit')))
+        fields = library_views.parse_fields(args.get('fields'))
+        result = dict(data, saved_tracks=library_views.project_tracks(tracks, fields))
+        if 'limit' in args:
+            result['next_cursor'] = next_cursor
+        return revision, result
+
+    return conditional_library_response('saved', library.saved_revision(), build)
 
 @app.route('/api/saved-tracks', methods=['POST'])
 def save_track():
@@ -636,19 +647,16 @@ def save_track():
         if 'id' not in track or 'platform' not in track or 'title' not in track:
             return jsonify({"error": "Missing required track fields"}), 400
         
-        saved_data = load_saved_tracks()
-        
-        if any(t.get('id') == track['id'] and t.get('platform') == track['platform'] 
-               for t in saved_data.get('saved_tracks', [])):
-            return jsonify({"success": True, "message": "Track already saved", "saved": True})
-        
         track['saved'] = True
-        saved_data.setdefault('saved_tracks', []).append(track)
-        
-        success = save_saved_tracks(saved_data)
-        if not success:
+        try:
+            added = library.add_saved_track(track)
+        except Exception as e:
+            print(f"[ST] Save error: {e}")
             return jsonify({"error": "Failed to save track"}), 500
         
+        if not added:
+            return jsonify({"success": True, "message": "Track already saved", "saved": True})
+        
         return jsonify({"success": True, "message": "Track saved", "saved": True})
     except Exception as e:
         print(f"[ST] Error: {e}")
@@ -664,19 +672,14 @@ def delete_saved_track():
         track_id = data['id']
         platform = data['platform']
         
-        saved_data = load_saved_tracks()
+        try:
+            removed = library.remove_saved_track(platform, track_id)
+        except Exception as e:
+            print(f"[ST] Delete err: {e}")
+            return jsonify({"error": "Failed to update saved tracks"}), 500
         
-        saved_tracks = saved_data.get('saved_tracks', [])
-        for i, track in enumerate(saved_tracks):
-            if track.get('id') == track_id and track.get('platform') == platform:
-                saved_tracks.pop(i)
-                
-                saved_data['saved_tracks'] = saved_tracks
-                success = save_saved_tracks(saved_data)
-                if not success:
-                    return jsonify({"error": "Failed to update saved tracks"}), 500
-                
-                return jsonify({"success": True, "message": "Track removed"})
+        if removed:
+            return jsonify({"success": True, "message": "Track removed"})
         
         return jsonify({"error": "Track not found"}), 404
     except Exception as e:
@@ -691,12 +694,7 @@ def check_saved_track():
     if not track_id or not platform:
         return jsonify({"error": "Track ID and platform required"}), 400
     
-    saved_data = load_saved_tracks()
-    
-    is_saved = any(t.get('id') == track_id and t.get('platform') == platform
-                   for t in saved_data.get('saved_tracks', []))
-    
-    return jsonify({"is_saved": is_saved})
+    return jsonify({"is_saved": library.is_saved(platform, track_id)})
 
 @app.route('/api/cache/info', methods=['GET'])
 def get_cache_info():
@@ -710,13 +708,17 @@ def get_cache_info():
                 'expired': 0,
                 'preloaded': 0,
                 'used': 0,
-                'fresh': 0
+                'fresh': 0,
+                'expiring_soon': 0
             }
             
             for data in youtube_services.youtube_url_cache.values():
-                age = now - data['timestamp']
+                remaining = youtube_services.entry_remaining(data, now)
+                
+                if remaining < youtube_services.URL_REFRESH_WINDOW:
+                    stats['expiring_soon'] += 1
                 
-                if age > CACHE_EXPIRY:
+                if remaining <= youtube_services.URL_EXPIRY_SAFETY_MARGIN:
                     stats['expired'] += 1
                 elif data.get('preloaded', False):
                     stats['preloaded'] += 1
@@ -737,15 +739,37 @@ def get_cache_info():
             "preloaded_urls": stats['preloaded'],
             "used_urls": stats['used'],
             "fresh_urls": stats['fresh'],
+            "expiring_soon_urls": stats['expiring_soon'],
             "cache_expiry_hours": CACHE_EXPIRY / 3600,
             "next_cleanup_seconds": next_cleanup_seconds,
             "next_cleanup_minutes": next_cleanup_minutes % 60,
-            "next_cleanup_hours": next_cleanup_hours
+            "next_cleanup_hours": next_cleanup_hours,
+            "search_cache": search_cache.stats(),
+            "extraction_strategies": youtube_services.extraction_scheduler.stats(),
+            "preload": youtube_services.preload_scheduler.info() if youtube_services.preload_scheduler else None,
+            "audio_cache": audio_cache.get_audio_cache().stats() if audio_cache.get_audio_cache() else None
         })
     except Exception as e:
         print(f"[Cache] Error getting cache info: {e}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/http/stats', methods=['GET'])
+def get_http_stats():
+    try:
+        return jsonify({"hosts": http_pool.stats()})
+    except Exception as e:
+        print(f"[HTTP] Error getting pool stats: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/library/stats', methods=['GET'])
+def get_library_stats():
+    """Состояние записи библиотеки на диск; flush_failing - база не принимает изменения"""
+    try:
+        return jsonify({"index": library.info(), "journal": library_store.journal_stats()})
+    except Exception as e:
+        print(f"[Library] Error getting stats: {e}")
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/api/youtube/auth-status', methods=['GET'])
 def youtube_auth_status():
     try:
@@ -1051,14 +1075,26 @@ def clear_all_data():
     try:
         logger.info("Starting complete data cleanup...")
         
-        with youtube_services.youtube_cache_lock:
-            cache_size = len(youtube_services.youtube_url_cache)
-            youtube_services.youtube_url_cache.clear()
-            logger.info(f"Cleared URL cache: {cache_size} entries")
+        cache_size = youtube_services.clear_url_cache()
+        logger.info(f"Cleared URL cache: {cache_size} entries")
+        if youtube_services.url_cache_store is not None:
+            # База лежит в CACHE_DIR, который очищается ниже
+            youtube_services.url_cache_store.close()
+        
+        search_cache.clear()
+        if audio_cache.get_audio_cache():
+            audio_cache.get_audio_cache().clear()
+        
+        library.clear()
+        logger.info("Cleared library database")
         
         files_to_remove = [
             PLAYLISTS_FILE,
             SAVED_TRACKS_FILE,
+            PLAYLISTS_FILE + '.migrated',
+            SAVED_TRACKS_FILE + '.migrated',
+            PLAYLISTS_FILE + '.corrupt',
+            SAVED_TRACKS_FILE + '.corrupt',
             COOKIE_FILE,
             SOUNDCLOUD_SETTINGS_FILE,
             YANDEX_MUSIC_SETTINGS_FILE,
@@ -1109,13 +1145,18 @@ def clear_all_data():
 @app.route('/api/cache/clear', methods=['POST'])
 def clear_cache():
     try:
-        with youtube_services.youtube_cache_lock:
-            cache_size = len(youtube_services.youtube_url_cache)
-            youtube_services.youtube_url_cache.clear()
+        cache_size = youtube_services.clear_url_cache()
+        
+        search_cache_size = search_cache.clear()
+        
+        cache = audio_cache.get_audio_cache()
+        audio_tracks = cache.clear() if cache else 0
         
         return jsonify({
             "success": True,
             "cleared_entries": cache_size,
+            "cleared_search_entries": search_cache_size,
+            "cleared_audio_tracks": audio_tracks,
             "message": "URL cache cleared successfully"
         })
     except Exception as e:
@@ -1219,14 +1260,11 @@ def download_local_track():
         title = f"local_{track_id}.mp3"
         
         try:
-            saved_data = load_saved_tracks()
-            for track in saved_data.get('saved_tracks', []):
-                if track.get('id') == track_id and track.get('platform') == 'local':
-                    if track.get('title'):
-                        title = track.get('title')
-                        title = ''.join(c for c in title if c.isalnum() or c in ' ._-')
-                        title = title.strip() + '.mp3'
-                    break
+            track = library.get_saved_track('local', track_id)
+            if track and track.get('title'):
+                title = track.get('title')
+                title = ''.join(c for c in title if c.isalnum() or c in ' ._-')
+                title = title.strip() + '.mp3'
         except:
             pass
         
@@ -1263,8 +1301,7 @@ def save_theme_settings():
         
         settings['themeName'] = theme_name
         
-        with open(settings_path, 'w', encoding='utf-8') as f:
-            json.dump(settings, f, ensure_ascii=False, indent=2)
+        json_codec.dump_file(settings, settings_path)
         
         return jsonify({"success": True})
     except Exception as e:
@@ -1292,8 +1329,7 @@ def save_accent_color():
         settings['accentColor'] = accent_color
         settings['themeName'] = theme_name
         
-        with open(settings_path, 'w', encoding='utf-8') as f:
-            json.dump(settings, f, ensure_ascii=False, indent=2)
+        json_codec.dump_file(settings, settings_path)
         
         return jsonify({"success": True})
     except Exception as e:
@@ -1389,7 +1425,7 @@ def export_all_data():
             "yandex_music_settings": yandex_music_settings
         }
         
-        return jsonify({
+        return json_codec.json_response({
             "success": True,
             "data": export_data
         })
@@ -1425,16 +1461,13 @@ def import_all_data():
         
         if import_data.get('theme_settings'):
             settings_path = os.path.join(SETTINGS_DIR, "theme_settings.json")
-            with open(settings_path, 'w', encoding='utf-8') as f:
-                json.dump(import_data['theme_settings'], f, ensure_ascii=False, indent=2)
+            json_codec.dump_file(import_data['theme_settings'], settings_path)
         
         if import_data.get('soundcloud_settings'):
-            with open(SOUNDCLOUD_SETTINGS_FILE, 'w', encoding='utf-8') as f:
-                json.dump(import_data['soundcloud_settings'], f, ensure_ascii=False, indent=2)
+            json_codec.dump_file(import_data['soundcloud_settings'], SOUNDCLOUD_SETTINGS_FILE)
         
         if import_data.get('yandex_music_settings'):
-            with open(YANDEX_MUSIC_SETTINGS_FILE, 'w', encoding='utf-8') as f:
-                json.dump(import_data['yandex_music_settings'], f, ensure_ascii=False, indent=2)
+            json_codec.dump_file(import_data['yandex_music_settings'], YANDEX_MUSIC_SETTINGS_FILE)
         
         return jsonify({
             "success": True,
@@ -1478,12 +1511,60 @@ def clean_exit():
         server_running = False
         try:
             # Принудительная остановка всех потоков
-            with youtube_services.youtube_cache_lock:
-                youtube_services.youtube_url_cache.clear()
+            # Ссылки на диске сохраняются до следующего запуска
+            if youtube_services.preload_scheduler is not None:
+                youtube_services.preload_scheduler.stop()
+            yandex_music_services.YM_WAVE_BUFFER.stop()
+            federated_search.shutdown()
+            yandex_music_services.save_rotor_state(force=True)
+            youtube_services.clear_url_cache(persistent=False)
+            if youtube_services.url_cache_store is not None:
+                youtube_services.url_cache_store.close()
+            if audio_cache.get_audio_cache():
+                audio_cache.get_audio_cache().close()
+            http_pool.close()
+            library.close()
+            library_store.close()
             print("[Server] Cache cleared on exit")
         except Exception as e:
             print(f"[Server] Error during cleanup: {e}")
 
+server_initialized = False
+
+def init_server():
+    """Подготовка сервера перед app.run: перенос библиотеки из JSON, загрузка
+    индекса, аудиокэш, маршруты сервисов и фоновые потоки.
+
+    Вызывается и при запуске app.py напрямую, и из server_wrapper.py.
+    """
+    global app, server_initialized
+    if server_initialized:
+        return app
+    server_initialized = True
+    
+    logger.info(f"[P] Library database path: {LIBRARY_DB_FILE}")
+    try:
+        library_store.migrate_from_json(PLAYLISTS_FILE, SAVED_TRACKS_FILE)
+        library.load()
+        library.start()
+        counts = library.counts()
+        logger.info(
+            f"[P] Initial load: {counts['playlists']} playlists, "
+            f"{counts['liked']} liked tracks, {counts['saved']} saved tracks"
+        )
+    except Exception as e:
+        logger.error(f"[P] Failed initial load of playlists: {e}")
+    
+    audio_cache.init_audio_cache(CACHE_DIR, MAX_CACHE_SIZE)
+    app = youtube_services.setup_youtube_routes(app, FFMPEG_DIR, COOKIE_FILE, CACHE_DIR, SAVED_DIR, load_saved_tracks)
+    app = soundcloud_services.setup_soundcloud_routes(app, SOUNDCLOUD_SETTINGS_FILE, FFMPEG_DIR)
+    app = yandex_music_services.setup_yandex_music_routes(app, YANDEX_MUSIC_SETTINGS_FILE)
+    # app = audio_analysis.setup_analysis_routes(app, USER_DATA_DIR, load_playlists)  # Temporarily disabled
+    
+    threading.Thread(target=clean_cache, daemon=True).start()
+    threading.Thread(target=refresh_url_cache, daemon=True).start()
+    return app
+
 if __name__ == "__main__":
     try:
         # В Windows PyInstaller signal handlers не работают надежно
@@ -1494,22 +1575,7 @@ if __name__ == "__main__":
             signal.signal(signal.SIGINT, signal_handler)
             signal.signal(signal.SIGTERM, signal_handler)
         
-        logger.info(f"[P] Playlists file path: {PLAYLISTS_FILE}")
-        try:
-            initial = load_playlists()
-            logger.info(
-                f"[P] Initial load: {len(initial.get('playlists', []))} playlists, "
-                f"{len(initial.get('liked_tracks', []))} liked tracks"
-            )
-        except Exception as e:
-            logger.error(f"[P] Failed initial load of playlists: {e}")
-        
-        app = youtube_services.setup_youtube_routes(app, FFMPEG_DIR, COOKIE_FILE, CACHE_DIR, SAVED_DIR, load_saved_tracks)
-        app = soundcloud_services.setup_soundcloud_routes(app, SOUNDCLOUD_SETTINGS_FILE, FFMPEG_DIR)
-        app = yandex_music_services.setup_yandex_music_routes(app, YANDEX_MUSIC_SETTINGS_FILE)
-        # app = audio_analysis.setup_analysis_routes(app, USER_DATA_DIR, load_playlists)  # Temporarily disabled
-        
-        threading.Thread(target=clean_cache, daemon=True).start()
+        app = init_server()
 
         print("[Server] Starting server on port 5000")
         logger.info("Server starting on port 5000")
@@ -8,6 +8,7 @@ import json
 import numpy as np
 from threading import Lock
 from flask import request, jsonify
+import json_codec
 
 ML_AVAILABLE = False
 print("[AI] ML libraries disabled (temporarily removed)")
@@ -81,8 +82,7 @@ class AudioAnalyzer:
             print(f"[AI] Error saving profile: {e}")
         
         try:
-            with open(self.analysis_stats_file, 'w', encoding='utf-8') as f:
-                json.dump(self.analysis_stats, f, ensure_ascii=False, indent=2)
+            json_codec.dump_file(self.analysis_stats, self.analysis_stats_file)
         except Exception as e:
             print(f"[AI] Error saving stats: {e}")
     
@@ -350,7 +350,7 @@ class AudioAnalyzer:
     
     def download_track_for_analysis(self, track):
         try:
-            import requests
+            from http_pool import http_pool
             import youtube_services
             import soundcloud_services
             
@@ -371,7 +371,7 @@ class AudioAnalyzer:
             temp_file = tempfile.NamedTemporaryFile(suffix='.m4a', delete=False)
             temp_file.close()
             
-            response = requests.get(stream_url, stream=True, timeout=60)
+            response = http_pool.get(stream_url, stream=True, timeout=60)
             if response.status_code == 200:
                 with open(temp_file.name, 'wb') as f:
                     for chunk in response.iter_content(chunk_size=8192):
@@ -0,0 +1,498 @@
+import os
+import re
+import json
+import time
+import threading
+from collections import OrderedDict
+import json_codec
+from flask import Response, stream_with_context, jsonify
+
+AUDIO_CACHE_SUBDIR = "audio"
+INDEX_FILE = "index.json"
+READ_CHUNK_SIZE = 64 * 1024
+UPSTREAM_CHUNK_SIZE = 8192
+# Как часто писатель отмечает записанные байты как доступные для чтения
+MARK_EVERY = 256 * 1024
+# Индекс пишется на диск не чаще раза в INDEX_SAVE_INTERVAL секунд
+INDEX_SAVE_INTERVAL = 10
+
+_UNSAFE_NAME_RE = re.compile(r"[^A-Za-z0-9_.-]")
+_CONTENT_RANGE_RE = re.compile(r"bytes\s+(\d+)-(\d+)/(\d+|\*)")
+
+
+def parse_range_header(range_header):
+    """'bytes=100-' -> (100, None); None для мульти-диапазонов и суффиксов"""
+    if not range_header or not range_header.startswith('bytes='):
+        return None
+    spec = range_header[len('bytes='):].strip()
+    if ',' in spec or '-' not in spec:
+        return None
+    start, end = spec.split('-', 1)
+    if not start:
+        return None
+    try:
+        return int(start), (int(end) if end else None)
+    except ValueError:
+        return None
+
+
+def parse_content_range(value):
+    """'bytes 0-99/1000' -> (0, 99, 1000); total=None, если размер неизвестен"""
+    match = _CONTENT_RANGE_RE.match(value or '')
+    if not match:
+        return None
+    total = match.group(3)
+    return int(match.group(1)), int(match.group(2)), (int(total) if total != '*' else None)
+
+
+def _merge_range(ranges, start, end):
+    """Добавить полуинтервал [start, end) в отсортированный список и склеить соседние"""
+    merged = []
+    for s, e in sorted(ranges + [[start, end]]):
+        if merged and s <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], e)
+        else:
+            merged.append([s, e])
+    return merged
+
+
+def _subtract_range(ranges, start, end):
+    """Убрать полуинтервал [start, end) из отсортированного списка диапазонов"""
+    result = []
+    for s, e in ranges:
+        if s < start:
+            result.append([s, min(e, start)])
+        if e > end:
+            result.append([max(s, end), e])
+    return result
+
+
+class _RangeWriter:
+    """Пишет проксируемые байты в разреженный файл трека начиная с offset"""
+
+    def __init__(self, cache, key, path, offset):
+        self._cache = cache
+        self._key = key
+        self._offset = offset
+        self._marked = offset
+        self._pos = offset
+        self._file = open(path, 'r+b', buffering=0)
+        self._file.seek(offset)
+
+    def write(self, chunk):
+        self._file.write(chunk)
+        self._pos += len(chunk)
+        if self._pos - self._marked >= MARK_EVERY:
+            self._cache._mark(self._key, self._marked, self._pos)
+            self._marked = self._pos
+
+    def close(self):
+        try:
+            self._file.close()
+        finally:
+            if self._pos > self._marked:
+                self._cache._mark(self._key, self._marked, self._pos)
+            self._cache._finish_write(self._key)
+
+    def abort(self):
+        """Закрыть без сохранения: апстрим оборвался, записанный диапазон отбрасывается"""
+        self._marked = self._pos
+        self._cache._unmark(self._key, self._offset, self._pos)
+        self.close()
+
+
+class AudioCache:
+    """Дисковый кэш аудио по диапазонам байт.
+
+    Для каждого трека хранится разреженный файл и список уже скачанных
+    диапазонов. Повторные запросы к скачанным участкам отдаются с диска,
+    треки вытесняются по LRU, когда объем превышает max_size. Объем
+    считается по размеру файлов: на NTFS запись с середины файла выделяет
+    место и под еще не скачанное начало.
+    """
+
+    def __init__(self, cache_dir, max_size):
+        self.cache_dir = os.path.join(cache_dir, AUDIO_CACHE_SUBDIR)
+        self.max_size = max_size
+        self._index_path = os.path.join(self.cache_dir, INDEX_FILE)
+        self._entries = OrderedDict()
+        self._writers = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.partial_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._last_index_save = 0
+        self._index_timer = None
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._load_index()
+
+    def _load_index(self):
+        try:
+            with open(self._index_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            print(f"[AudioCache] Error loading index: {e}")
+            return
+
+        for key, entry in sorted(data.items(), key=lambda item: item[1].get('last_access', 0)):
+            if os.path.exists(os.path.join(self.cache_dir, entry.get('file', ''))):
+                self._entries[key] = entry
+        print(f"[AudioCache] Loaded {len(self._entries)} tracks, {self._used_bytes() / 1024 / 1024:.1f}MB")
+
+    def _schedule_save_index(self):
+        """Сохранить индекс сейчас или одним отложенным сохранением"""
+        with self._lock:
+            delay = self._last_index_save + INDEX_SAVE_INTERVAL - time.time()
+            if delay > 0:
+                if self._index_timer is None:
+                    self._index_timer = threading.Timer(delay, self._save_index)
+                    self._index_timer.daemon = True
+                    self._index_timer.start()
+                return
+        self._save_index()
+
+    def _save_index(self):
+        with self._lock:
+            if self._index_timer is not None:
+                self._index_timer.cancel()
+                self._index_timer = None
+            self._last_index_save = time.time()
+            data = json_codec.dumps(dict(self._entries))
+        temp_path = self._index_path + '.tmp'
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                f.write(data)
+            os.replace(temp_path, self._index_path)
+        except Exception as e:
+            print(f"[AudioCache] Error saving index: {e}")
+
+    def _entry_bytes(self, entry):
+        """Место, занятое файлом трека на диске"""
+        try:
+            return os.path.getsize(self._path(entry))
+        except OSError:
+            return sum(e - s for s, e in entry['ranges'])
+
+    def _used_bytes(self):
+        return sum(self._entry_bytes(entry) for entry in self._entries.values())
+
+    def count(self, name):
+        """Увеличить счетчик статистики (hits, partial_hits, misses)"""
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def _path(self, entry):
+        return os.path.join(self.cache_dir, entry['file'])
+
+    def lookup(self, key):
+        """Копия метаданных трека (total, mimetype, ranges) или None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            entry['last_access'] = time.time()
+            self._entries.move_to_end(key)
+            return {'total': entry['total'], 'mimetype': entry.get('mimetype'), 'ranges': [list(r) for r in entry['ranges']]}
+
+    def covered_until(self, key, start):
+        """Конец непрерывного скачанного участка, начинающегося с start"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry:
+                for s, e in entry['ranges']:
+                    if s <= start < e:
+                        return e
+        return start
+
+    def read_range(self, key, start, end):
+        """Генератор байт [start, end) из файла трека"""
+        with self._lock:
+            entry = self._entries.get(key)
+            path = self._path(entry) if entry else None
+        if not path:
+            return
+
+        with open(path, 'rb') as f:
+            f.seek(start)
+            remaining = end - start
+            while remaining > 0:
+                chunk = f.read(min(READ_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+    def begin_write(self, key, offset, total, mimetype=None):
+        """Открыть запись с offset; None, если размер трека неизвестен или слишком велик"""
+        if not total or total > self.max_size:
+            return None
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry['total'] != total:
+                # Апстрим отдал другой файл (например, другой формат) - старые байты невалидны
+                print(f"[AudioCache] Size changed for {key}: {entry['total']} -> {total}, resetting")
+                self._remove_locked(key)
+                entry = None
+            if entry is None:
+                entry = {
+                    'file': _UNSAFE_NAME_RE.sub('_', key) + '.part',
+                    'total': total,
+                    'mimetype': mimetype,
+                    'ranges': [],
+                    'last_access': time.time()
+                }
+                self._entries[key] = entry
+                # Файл создается под блокировкой, писатели открывают его только на дозапись
+                os.makedirs(self.cache_dir, exist_ok=True)
+                open(self._path(entry), 'ab').close()
+            self._entries.move_to_end(key)
+            self._writers[key] = self._writers.get(key, 0) + 1
+            path = self._path(entry)
+
+        try:
+            return _RangeWriter(self, key, path, offset)
+        except Exception as e:
+            print(f"[AudioCache] Cannot open {path} for writing: {e}")
+            self._finish_write(key)
+            return None
+
+    def _mark(self, key, start, end):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry['ranges'] = _merge_range(entry['ranges'], start, min(end, entry['total']))
+
+    def _unmark(self, key, start, end):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry['ranges'] = _subtract_range(entry['ranges'], start, end)
+
+    def _finish_write(self, key):
+        with self._lock:
+            count = self._writers.get(key, 0) - 1
+            if count > 0:
+                self._writers[key] = count
+            else:
+                self._writers.pop(key, None)
+        self.evict()
+        self._schedule_save_index()
+
+    def _remove_locked(self, key):
+        entry = self._entries.pop(key, None)
+        if entry:
+            try:
+                os.remove(self._path(entry))
+            except OSError:
+                pass
+
+    def evict(self):
+        with self._lock:
+            used = self._used_bytes()
+            for key in list(self._entries.keys()):
+                if used <= self.max_size:
+                    break
+                if key in self._writers:
+                    continue
+                used -= self._entry_bytes(self._entries[key])
+                self._remove_locked(key)
+                self.evictions += 1
+                print(f"[AudioCache] Evicted {key}")
+
+    def clear(self):
+        with self._lock:
+            removed = len(self._entries)
+            for key in [k for k in self._entries if k not in self._writers]:
+                self._remove_locked(key)
+        self._save_index()
+        return removed
+
+    def close(self):
+        """Записать отложенные изменения индекса"""
+        with self._lock:
+            pending = self._index_timer is not None
+        if pending:
+            self._save_index()
+
+    def stats(self):
+        with self._lock:
+            complete = sum(
+                1 for entry in self._entries.values()
+                if entry['ranges'] == [[0, entry['total']]]
+            )
+            return {
+                'tracks': len(self._entries),
+                'complete_tracks': complete,
+                'used_bytes': self._used_bytes(),
+                'max_bytes': self.max_size,
+                'hits': self.hits,
+                'partial_hits': self.partial_hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
+
+
+audio_cache = None
+
+
+def init_audio_cache(cache_dir, max_size):
+    global audio_cache
+    audio_cache = AudioCache(cache_dir, max_size)
+    return audio_cache
+
+
+def get_audio_cache():
+    return audio_cache
+
+
+def _tee(upstream, open_writer, tag):
+    """Проксировать тело апстрима, сохраняя его в кэш.
+
+    open_writer() вызывается только при старте генератора: если клиент
+    отключился до чтения тела, запись в кэш не открывается вовсе.
+    """
+    writer = None
+    try:
+        writer = open_writer() if open_writer else None
+        for chunk in upstream.iter_content(chunk_size=UPSTREAM_CHUNK_SIZE):
+            if chunk:
+                if writer:
+                    writer.write(chunk)
+                yield chunk
+    except Exception as e:
+        # Обрыв апстрима: клиент должен увидеть ошибку, а не тихо обрезанное тело
+        print(f"[{tag}] Stream error: {e}")
+        if writer:
+            writer.abort()
+            writer = None
+        raise
+    finally:
+        upstream.close()
+        if writer:
+            writer.close()
+
+
+def _stream_response(generator, status, mimetype, headers, upstream=None):
+    response = Response(stream_with_context(generator), status=status, mimetype=mimetype)
+    if upstream is not None:
+        # Клиент мог отключиться до чтения тела - соединение закрывается и тогда
+        response.call_on_close(upstream.close)
+    for name, value in headers.items():
+        response.headers[name] = value
+    response.headers['Accept-Ranges'] = 'bytes'
+    return response
+
+
+def serve_audio(key, range_header, open_upstream, mimetype, tag="AudioCache",
+                missing_error=("No direct audio URL found", 500), use_cache=True):
+    """Отдать аудио с учетом дискового кэша.
+
+    open_upstream(range_value) -> requests.Response (stream=True) вызывается
+    только когда нужных байт нет на диске. Скачанные байты сохраняются в кэш.
+    Если open_upstream вернул None, отвечаем missing_error (сообщение, код).
+    use_cache=False - чистое потоковое проксирование без диска.
+    """
+    cache = audio_cache if use_cache else None
+    requested = parse_range_header(range_header)
+
+    if cache is None or (range_header and requested is None):
+        return _proxy_upstream(None, None, range_header, open_upstream, mimetype, tag, missing_error)
+
+    start, end = requested or (0, None)
+    entry = cache.lookup(key)
+
+    if entry is None:
+        cache.count('misses')
+        return _proxy_upstream(cache, key, range_header, open_upstream, mimetype, tag, missing_error)
+
+    total = entry['total']
+    if start >= total:
+        return Response(status=416, headers={'Content-Range': f'bytes */{total}'})
+    end = total - 1 if end is None else min(end, total - 1)
+
+    mimetype = entry['mimetype'] or mimetype
+    covered_end = min(cache.covered_until(key, start), end + 1)
+    upstream = None
+    if covered_end > end:
+        cache.count('hits')
+        print(f"[{tag}] Disk hit {key}: {start}-{end}")
+        body = cache.read_range(key, start, end + 1)
+    else:
+        # Апстрим открываем до отправки заголовков: если он не отдаст ровно
+        # недостающий диапазон, отвечаем обычным проксированием, а не обрезанным телом
+        upstream = _open_missing_range(key, covered_end, end, total, open_upstream, tag)
+        if upstream is None:
+            return _proxy_upstream(cache, key, range_header, open_upstream, mimetype, tag, missing_error)
+        if covered_end > start:
+            cache.count('partial_hits')
+            print(f"[{tag}] Partial disk hit {key}: {start}-{covered_end - 1} local, rest upstream")
+        else:
+            cache.count('misses')
+        body = _local_then_upstream(cache, key, start, covered_end, total, upstream, mimetype, tag)
+
+    headers = {'Content-Length': str(end - start + 1)}
+    status = 200
+    if range_header:
+        status = 206
+        headers['Content-Range'] = f'bytes {start}-{end}/{total}'
+    return _stream_response(body, status, mimetype, headers, upstream)
+
+
+def _open_missing_range(key, start, end, total, open_upstream, tag):
+    """Открыть апстрим на [start, end]; None, если он отдает не ровно этот диапазон"""
+    upstream = open_upstream(f'bytes={start}-{end}')
+    if upstream is None or upstream.status_code != 206:
+        print(f"[{tag}] Upstream refused range for {key}: {getattr(upstream, 'status_code', None)}")
+        if upstream is not None:
+            upstream.close()
+        return None
+
+    content_range = parse_content_range(upstream.headers.get('Content-Range'))
+    if not content_range or content_range[:2] != (start, end) or content_range[2] not in (None, total):
+        print(f"[{tag}] Unexpected Content-Range for {key}: {upstream.headers.get('Content-Range')}")
+        upstream.close()
+        return None
+    return upstream
+
+
+def _local_then_upstream(cache, key, start, covered_end, total, upstream, mimetype, tag):
+    try:
+        if covered_end > start:
+            yield from cache.read_range(key, start, covered_end)
+    except BaseException:
+        upstream.close()
+        raise
+
+    yield from _tee(upstream, lambda: cache.begin_write(key, covered_end, total, mimetype), tag)
+
+
+def _proxy_upstream(cache, key, range_header, open_upstream, mimetype, tag, missing_error):
+    upstream = open_upstream(range_header)
+    if upstream is None:
+        return jsonify({"error": missing_error[0]}), missing_error[1]
+    if upstream.status_code not in [200, 206]:
+        print(f"[{tag}] Proxy error: {upstream.status_code}")
+        upstream.close()
+        return jsonify({"error": f"Upstream error: {upstream.status_code}"}), 500
+
+    open_writer = None
+    if cache is not None:
+        if upstream.status_code == 206:
+            content_range = parse_content_range(upstream.headers.get('Content-Range'))
+            if content_range:
+                open_writer = lambda: cache.begin_write(key, content_range[0], content_range[2], mimetype)
+        else:
+            length = upstream.headers.get('Content-Length')
+            if length and length.isdigit():
+                open_writer = lambda: cache.begin_write(key, 0, int(length), mimetype)
+
+    headers = {
+        header: upstream.headers[header]
+        for header in ['Content-Length', 'Content-Range']
+        if header in upstream.headers
+    }
+    return _stream_response(_tee(upstream, open_writer, tag), upstream.status_code, mimetype, headers, upstream)
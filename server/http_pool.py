@@ -0,0 +1,176 @@
+import time
+import threading
+import ipaddress
+import urllib.parse
+from collections import OrderedDict
+from http.cookiejar import DefaultCookiePolicy
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Размер пула keep-alive соединений на один хост
+POOL_MAXSIZE = 10
+# Для хостов, через которые идет проксирование аудио, пул больше
+HOST_POOL_SIZES = {
+    'googlevideo.com': 16,
+    'api-v2.soundcloud.com': 16,
+}
+# Сколько хостов одной группы держат свои пулы соединений внутри сессии
+# (CDN вроде googlevideo.com отдают аудио с постоянно меняющихся поддоменов)
+HOSTS_PER_SESSION = 8
+# Предел числа сессий; самая давно не использованная закрывается
+MAX_SESSIONS = 32
+RETRIES = 2
+BACKOFF_FACTOR = 0.3
+RETRY_STATUSES = (500, 502, 503, 504)
+# (connect, read); read - таймаут ожидания очередного блока, а не всего ответа
+DEFAULT_TIMEOUT = (5, 30)
+
+
+class HttpPool:
+    """Общие keep-alive сессии requests, по одной на группу хостов.
+
+    Группа - суффикс из HOST_POOL_SIZES или домен второго уровня, так что
+    меняющиеся поддомены CDN не плодят новые сессии.
+
+    Повторы с backoff делаются только для идемпотентных методов и ошибок
+    соединения, поэтому POST (например, фидбек ротора) не дублируется.
+    Cookies между вызовами не сохраняются, как и при прямых requests.get.
+    """
+
+    def __init__(self, pool_maxsize=POOL_MAXSIZE, retries=RETRIES,
+                 backoff_factor=BACKOFF_FACTOR, timeout=DEFAULT_TIMEOUT, host_pool_sizes=None):
+        self.pool_maxsize = pool_maxsize
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.timeout = timeout
+        self.host_pool_sizes = dict(HOST_POOL_SIZES)
+        if host_pool_sizes:
+            self.host_pool_sizes.update(host_pool_sizes)
+        self._sessions = OrderedDict()
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def _pool_size(self, host):
+        for suffix, size in self.host_pool_sizes.items():
+            if host == suffix or host.endswith('.' + suffix):
+                return size
+        return self.pool_maxsize
+
+    def _pool_key(self, host):
+        for suffix in self.host_pool_sizes:
+            if host == suffix or host.endswith('.' + suffix):
+                return suffix
+        try:
+            ipaddress.ip_address(host)
+            return host
+        except ValueError:
+            return '.'.join(host.split('.')[-2:])
+
+    def _create_session(self, host):
+        retry = Retry(
+            total=self.retries,
+            connect=self.retries,
+            read=self.retries,
+            status=self.retries,
+            backoff_factor=self.backoff_factor,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=frozenset(['GET', 'HEAD', 'OPTIONS']),
+            raise_on_status=False,
+            respect_retry_after_header=True
+        )
+        adapter = HTTPAdapter(pool_connections=HOSTS_PER_SESSION, pool_maxsize=self._pool_size(host), max_retries=retry)
+
+        session = requests.Session()
+        session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    def session_for(self, url):
+        key = self._pool_key(urllib.parse.urlsplit(url).hostname or '')
+        evicted = []
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is None:
+                session = self._create_session(key)
+                self._sessions[key] = session
+                self._stats[key] = {'requests': 0, 'errors': 0, 'total_time': 0.0}
+                while len(self._sessions) > MAX_SESSIONS:
+                    old_key, old_session = self._sessions.popitem(last=False)
+                    self._stats.pop(old_key, None)
+                    evicted.append(old_session)
+            else:
+                self._sessions.move_to_end(key)
+        for old_session in evicted:
+            old_session.close()
+        return key, session
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        host, session = self.session_for(url)
+
+        start = time.time()
+        try:
+            return session.request(method, url, **kwargs)
+        except Exception:
+            with self._lock:
+                if host in self._stats:
+                    self._stats[host]['errors'] += 1
+            raise
+        finally:
+            with self._lock:
+                stats = self._stats.get(host)
+                if stats is not None:
+                    stats['requests'] += 1
+                    stats['total_time'] += time.time() - start
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def head(self, url, **kwargs):
+        return self.request('HEAD', url, **kwargs)
+
+    def stats(self):
+        """Статистика по группам хостов: запросы, ошибки, средняя задержка и соединения пула"""
+        result = {}
+        with self._lock:
+            items = list(self._sessions.items())
+            counters = {host: dict(stats) for host, stats in self._stats.items()}
+
+        for host, session in items:
+            stats = counters.get(host)
+            if stats is None:
+                continue
+            connections = 0
+            pooled_requests = 0
+            for adapter in set(session.adapters.values()):
+                pools = adapter.poolmanager.pools
+                for key in pools.keys():
+                    pool = pools.get(key)
+                    if pool is not None:
+                        connections += pool.num_connections
+                        pooled_requests += pool.num_requests
+
+            result[host] = {
+                'requests': stats['requests'],
+                'errors': stats['errors'],
+                'avg_latency': round(stats['total_time'] / stats['requests'], 3) if stats['requests'] else 0.0,
+                'pool_maxsize': self._pool_size(host),
+                'connections_opened': connections,
+                'connection_reuse': round(1 - connections / pooled_requests, 3) if pooled_requests else 0.0
+            }
+        return result
+
+    def close(self):
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+        for session in sessions:
+            session.close()
+
+
+http_pool = HttpPool()
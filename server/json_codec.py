@@ -0,0 +1,142 @@
+import os
+import json
+import uuid
+import tempfile
+import decimal
+import datetime
+import dataclasses
+from flask import Response
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    orjson = None
+    ORJSON_AVAILABLE = False
+
+BACKEND = 'orjson' if ORJSON_AVAILABLE else 'json'
+
+# Списки длиннее порога отдаются потоком, пачками по STREAM_BATCH элементов
+STREAM_THRESHOLD = 2000
+STREAM_BATCH = 500
+
+if ORJSON_AVAILABLE:
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+
+def _default(value):
+    """Типы, которые понимает jsonify Flask, но не понимает json/orjson"""
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    if isinstance(value, (decimal.Decimal, uuid.UUID)):
+        return str(value)
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        return dataclasses.asdict(value)
+    if isinstance(value, (set, frozenset, tuple)):
+        return list(value)
+    if hasattr(value, '__html__'):
+        return str(value.__html__())
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps_bytes(value):
+    """Компактный JSON в UTF-8"""
+    if ORJSON_AVAILABLE:
+        try:
+            return orjson.dumps(value, default=_default, option=_ORJSON_OPTIONS)
+        except TypeError:
+            # orjson строже к ключам и вложенности - добиваем стандартным модулем
+            pass
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'), default=_default).encode('utf-8')
+
+
+def dumps(value):
+    return dumps_bytes(value).decode('utf-8')
+
+
+def loads(data):
+    if ORJSON_AVAILABLE:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def load_file(path):
+    with open(path, 'rb') as f:
+        return loads(f.read())
+
+
+def dump_file(value, path):
+    """Записать JSON компактно и атомарно (через временный файл)"""
+    data = dumps_bytes(value)
+    # Уникальный временный файл в той же папке: параллельные записи одного
+    # файла не портят друг другу данные, а os.replace остается атомарным
+    directory, name = os.path.split(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(prefix=name + '.', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+def _is_large(value):
+    if isinstance(value, list):
+        return len(value) >= STREAM_THRESHOLD
+    if isinstance(value, dict):
+        return any(_is_large(v) for v in value.values() if isinstance(v, (list, dict)))
+    return False
+
+
+def iter_encode(value, batch=STREAM_BATCH):
+    """Кодировать по частям: большие списки идут пачками, а не одной строкой"""
+    if isinstance(value, list) and _is_large(value):
+        yield b'['
+        for start in range(0, len(value), batch):
+            if start:
+                yield b','
+            yield dumps_bytes(value[start:start + batch])[1:-1]
+        yield b']'
+    elif isinstance(value, dict) and _is_large(value):
+        yield b'{'
+        for i, (key, item) in enumerate(value.items()):
+            yield (b',' if i else b'') + dumps_bytes(str(key)) + b':'
+            yield from iter_encode(item, batch)
+        yield b'}'
+    else:
+        yield dumps_bytes(value)
+
+
+def json_response(value, status=200):
+    """Ответ JSON; крупные списки треков отдаются потоком"""
+    if _is_large(value):
+        return Response(iter_encode(value), status=status, mimetype='application/json')
+    return Response(dumps_bytes(value), status=status, mimetype='application/json')
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """JSON-провайдер Flask: jsonify и request.json через выбранный кодировщик"""
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return dumps(obj)
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps_bytes(obj), mimetype=self.mimetype)
+
+
+def init_json(app):
+    app.json = FastJSONProvider(app)
+    print(f"[JSON] Using {BACKEND} encoder")
@@ -0,0 +1,689 @@
+import time
+import uuid
+import threading
+from collections import OrderedDict, Counter
+
+# Пауза без изменений, после которой накопленные операции пишутся в базу
+FLUSH_DELAY = 0.5
+# Максимальная задержка записи при непрерывном потоке изменений
+FLUSH_MAX_DELAY = 3.0
+# Повтор неудачной записи: пауза удваивается от FLUSH_RETRY_DELAY до FLUSH_RETRY_MAX_DELAY
+FLUSH_RETRY_DELAY = 1.0
+FLUSH_RETRY_MAX_DELAY = 60.0
+# После стольких неудач подряд очередь заменяется полной перезаписью базы
+# из памяти: операции не теряются, а очередь не растет
+FLUSH_REWRITE_AFTER = 5
+
+SAVED_TRACK_OPS = ('replace_saved_tracks', 'add_saved_track', 'remove_saved_track')
+
+
+LIKED_TARGET = 'liked'
+
+
+def track_key(track):
+    return str(track.get('platform', '')), str(track.get('id', ''))
+
+
+class VersionConflict(Exception):
+    """Клиент редактировал устаревшую версию плейлиста или избранного"""
+
+    def __init__(self, target, expected, current):
+        super().__init__(f"Version conflict for {target}: expected {expected}, current {current}")
+        self.target = target
+        self.expected = expected
+        self.current = current
+
+
+PATCH_OPS = ('add_tracks', 'remove_tracks', 'move_track', 'rename',
+             'create_playlist', 'delete_playlist', 'like')
+
+
+def _require(op, field):
+    if op.get(field) is None:
+        raise ValueError(f"Operation '{op.get('op')}' requires '{field}'")
+    return op[field]
+
+
+def _is_position(value):
+    # bool - подкласс int, но true/false позицией не считаются
+    return type(value) is int and value >= 0
+
+
+def _is_track_list(value):
+    return isinstance(value, list) and all(isinstance(track, dict) for track in value)
+
+
+def _check_position(position, upper):
+    """Позиция в [0, upper); иначе ValueError"""
+    if not _is_position(position) or position >= upper:
+        raise ValueError(f"Invalid position {position!r}")
+
+
+def _validate_op(op):
+    """Проверить форму операции до применения любой из них; ValueError при ошибке"""
+    if not isinstance(op, dict):
+        raise ValueError("Each operation must be an object")
+    name = op.get('op')
+    if name not in PATCH_OPS:
+        raise ValueError(f"Unknown operation: {name}")
+
+    if name == 'like':
+        if not isinstance(_require(op, 'track'), dict):
+            raise ValueError("Operation 'like' requires a track object")
+        if 'liked' in op and not isinstance(op['liked'], bool):
+            raise ValueError("'liked' must be a boolean")
+        return
+    if name == 'create_playlist':
+        playlist = _require(op, 'playlist')
+        if not isinstance(playlist, dict) or playlist.get('id') is None:
+            raise ValueError("Operation 'create_playlist' requires a playlist object with 'id'")
+        if not _is_track_list(playlist.get('tracks') or []):
+            raise ValueError("Playlist tracks must be a list of track objects")
+        return
+
+    _require(op, 'playlist_id')
+    tracks = _require(op, 'tracks') if name == 'add_tracks' else op.get('tracks')
+    if tracks is not None and not _is_track_list(tracks):
+        raise ValueError(f"Operation '{name}' requires 'tracks' to be a list of track objects")
+
+    if name == 'add_tracks' and 'position' in op and not _is_position(op['position']):
+        raise ValueError(f"Invalid position {op['position']!r}")
+    if name == 'remove_tracks':
+        positions = op.get('positions')
+        if positions is not None and (not isinstance(positions, list) or not all(_is_position(p) for p in positions)):
+            raise ValueError("'positions' must be a list of non-negative integers")
+    if name == 'move_track':
+        for field in ('from', 'to'):
+            if not _is_position(_require(op, field)):
+                raise ValueError(f"Invalid position {op[field]!r}")
+    if name == 'rename' and not isinstance(_require(op, 'name'), str):
+        raise ValueError("'name' must be a string")
+
+
+class LibraryIndex:
+    """Резидентная копия библиотеки с хэш-индексами по (platform, id).
+
+    Чтения и проверки обслуживаются из памяти. Изменения применяются сразу
+    в памяти и ставятся в очередь; фоновый поток сбрасывает очередь в
+    LibraryStore одной транзакцией, когда правки затихают (debounce).
+    """
+
+    def __init__(self, store, flush_delay=FLUSH_DELAY, flush_max_delay=FLUSH_MAX_DELAY):
+        self.store = store
+        self.flush_delay = flush_delay
+        self.flush_max_delay = flush_max_delay
+
+        self._lock = threading.RLock()
+        self._cond = threading.Condition(self._lock)
+        # Запись очереди в базу и очистка базы не должны перекрываться
+        self._flush_lock = threading.Lock()
+        self._failed_flushes = 0
+        self._retry_at = 0
+        self._last_flush_error = None
+        self._pending = []
+        self._first_pending_at = None
+        self._last_pending_at = None
+        self._running = False
+        self._flusher = None
+        self._loaded = False
+
+        self._playlists = OrderedDict()
+        self._playlist_keys = {}
+        self._playlists_extra = {}
+        self._liked = []
+        self._liked_keys = Counter()
+        self._saved = []
+        self._saved_keys = Counter()
+        self._saved_extra = {}
+
+        # Версии для оптимистичной блокировки: общий счетчик и номер
+        # последнего изменения каждого плейлиста и списка избранного
+        self._version_seq = 0
+        self._playlist_versions = {}
+        self._liked_version = 0
+        # Ревизии для ETag; epoch меняется при каждом запуске сервера
+        self._epoch = uuid.uuid4().hex[:8]
+        self._saved_revision = 0
+
+        self.stats = {'flushes': 0, 'flushed_ops': 0, 'flush_errors': 0, 'full_rewrites': 0}
+
+    # --- загрузка и сброс на диск ---
+
+    def load(self):
+        playlists_data = self.store.load_playlists()
+        saved_data = self.store.load_saved_tracks()
+        versions = self.store.get_meta('versions', {})
+        with self._lock:
+            self._set_playlists_locked(playlists_data)
+            self._set_saved_locked(saved_data)
+            self._version_seq = versions.get('seq', 0)
+            self._liked_version = versions.get('liked', 0)
+            self._playlist_versions = {
+                pid: versions.get('playlists', {}).get(pid, 0) for pid in self._playlists
+            }
+            self._loaded = True
+        print(f"[Library] Index loaded: {len(self._playlists)} playlists, "
+              f"{len(self._liked)} liked, {len(self._saved)} saved")
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self.load()
+
+    def start(self):
+        with self._lock:
+            if self._running:
+                return
+            self._running = True
+            self._flusher = threading.Thread(target=self._flush_loop, name="library-flusher", daemon=True)
+            self._flusher.start()
+
+    def _enqueue(self, name, *args):
+        if not self._running:
+            self.start()
+        now = time.time()
+        self._pending.append((name, args))
+        if self._first_pending_at is None:
+            self._first_pending_at = now
+        self._last_pending_at = now
+        self._cond.notify_all()
+
+    def _flush_loop(self):
+        while True:
+            with self._lock:
+                while self._running and not self._pending:
+                    self._cond.wait()
+                if not self._running:
+                    return
+
+                now = time.time()
+                quiet_until = self._last_pending_at + self.flush_delay
+                deadline = self._first_pending_at + self.flush_max_delay
+                wait_time = max(min(quiet_until, deadline), self._retry_at) - now
+                if wait_time > 0:
+                    self._cond.wait(wait_time)
+                    continue
+
+            self.flush()
+
+    def flush(self):
+        """Записать накопленные операции одной транзакцией"""
+        with self._flush_lock:
+            with self._lock:
+                ops = self._pending
+                self._pending = []
+                self._first_pending_at = None
+                self._last_pending_at = None
+            if not ops:
+                return 0
+
+            try:
+                self.store.apply_batch(ops)
+            except Exception as e:
+                with self._lock:
+                    self.stats['flush_errors'] += 1
+                    self._failed_flushes += 1
+                    self._last_flush_error = str(e)
+                    if self._failed_flushes >= FLUSH_REWRITE_AFTER:
+                        # Операции уже применены в памяти: вместо растущей очереди
+                        # пишем весь снимок; позиционные правки не разойдутся с базой
+                        ops = self._full_rewrite_ops_locked()
+                        self._pending = []
+                    # Возвращаем операции в начало очереди, порядок важен
+                    self._pending = ops + self._pending
+                    delay = min(FLUSH_RETRY_DELAY * 2 ** (self._failed_flushes - 1), FLUSH_RETRY_MAX_DELAY)
+                    now = time.time()
+                    self._retry_at = now + delay
+                    self._first_pending_at = self._last_pending_at = now
+                print(f"[Library] Flush of {len(ops)} ops failed "
+                      f"({self._failed_flushes} in a row, retry in {delay:.0f}s): {e}")
+                return 0
+
+            with self._lock:
+                if self._failed_flushes:
+                    print(f"[Library] Flush recovered after {self._failed_flushes} failures")
+                self._failed_flushes = 0
+                self._retry_at = 0
+                self._last_flush_error = None
+                self.stats['flushes'] += 1
+                self.stats['flushed_ops'] += len(ops)
+        print(f"[Library] Flushed {len(ops)} ops")
+
+        try:
+            self.store.maybe_checkpoint()
+        except Exception as e:
+            print(f"[Library] Journal compaction failed: {e}")
+        return len(ops)
+
+    def _full_rewrite_ops_locked(self):
+        """Операции, переписывающие базу целиком из состояния в памяти"""
+        self.stats['full_rewrites'] += 1
+        return [
+            ('replace_playlists', (self.load_playlists(),)),
+            ('replace_saved_tracks', (self.load_saved_tracks(),)),
+            ('set_meta', ('versions', self._versions_meta_locked())),
+        ]
+
+    def info(self):
+        """Состояние записи на диск: очередь и последняя ошибка"""
+        with self._lock:
+            return {
+                'pending_ops': len(self._pending),
+                'flush_failing': self._failed_flushes > 0,
+                'failed_flushes': self._failed_flushes,
+                'last_flush_error': self._last_flush_error,
+                **self.stats
+            }
+
+    def close(self):
+        with self._lock:
+            self._running = False
+            self._cond.notify_all()
+        self.flush()
+
+    # --- плейлисты и избранное ---
+
+    def _set_playlists_locked(self, data):
+        self._playlists = OrderedDict()
+        self._playlist_keys = {}
+        for playlist in data.get('playlists') or []:
+            self._put_playlist_locked(playlist)
+        self._liked = list(data.get('liked_tracks') or [])
+        self._liked_keys = Counter(track_key(t) for t in self._liked)
+        self._playlists_extra = {k: v for k, v in data.items() if k not in ('playlists', 'liked_tracks')}
+
+    def _put_playlist_locked(self, playlist):
+        playlist_id = str(playlist.get('id'))
+        playlist = dict(playlist)
+        playlist['tracks'] = list(playlist.get('tracks') or [])
+        self._playlists[playlist_id] = playlist
+        self._playlist_keys[playlist_id] = Counter(track_key(t) for t in playlist['tracks'])
+
+    def load_playlists(self):
+        self._ensure_loaded()
+        with self._lock:
+            return {
+                **self._playlists_extra,
+                "playlists": [dict(p, tracks=list(p['tracks'])) for p in self._playlists.values()],
+                "liked_tracks": list(self._liked)
+            }
+
+    def replace_playlists(self, data):
+        self._ensure_loaded()
+        with self._lock:
+            self._set_playlists_locked(data)
+            # Полная замена перекрывает все еще не записанные правки плейлистов
+            self._pending = [op for op in self._pending if op[0] in SAVED_TRACK_OPS]
+            self._enqueue('replace_playlists', data)
+            self._playlist_versions = {}
+            self._bump_locked(list(self._playlists) + [LIKED_TARGET])
+        return True
+
+    def upsert_playlists(self, playlists, liked_tracks=None):
+        self._ensure_loaded()
+        with self._lock:
+            for playlist in playlists:
+                self._put_playlist_locked(playlist)
+            if liked_tracks is not None:
+                self._liked = list(liked_tracks)
+                self._liked_keys = Counter(track_key(t) for t in self._liked)
+            self._enqueue('upsert_playlists', playlists, liked_tracks)
+            targets = [str(p.get('id')) for p in playlists]
+            self._bump_locked(targets + ([LIKED_TARGET] if liked_tracks is not None else []))
+        return True
+
+    def append_playlist_tracks(self, playlist_id, tracks):
+        """Число добавленных треков или None, если плейлиста нет"""
+        self._ensure_loaded()
+        playlist_id = str(playlist_id)
+        with self._lock:
+            playlist = self._playlists.get(playlist_id)
+            if playlist is None:
+                return None
+
+            keys = self._playlist_keys[playlist_id]
+            added = []
+            for track in tracks:
+                key = track_key(track)
+                # Полное сравнение нужно только если такой (platform, id) уже есть
+                if keys[key] and track in playlist['tracks']:
+                    continue
+                playlist['tracks'].append(track)
+                keys[key] += 1
+                added.append(track)
+
+            if added:
+                self._enqueue('append_playlist_tracks', playlist_id, added)
+                self._bump_locked([playlist_id])
+            return len(added)
+
+    def has_playlist_track(self, playlist_id, platform, track_id):
+        self._ensure_loaded()
+        with self._lock:
+            keys = self._playlist_keys.get(str(playlist_id))
+            return bool(keys and keys[(str(platform), str(track_id))])
+
+    def is_liked(self, platform, track_id):
+        self._ensure_loaded()
+        with self._lock:
+            return self._liked_keys[(str(platform), str(track_id))] > 0
+
+    # --- версии и delta API ---
+
+    def _current_version_locked(self, target):
+        if target == LIKED_TARGET:
+            return self._liked_version
+        return self._playlist_versions.get(target, 0)
+
+    def _versions_locked(self, targets=None):
+        playlists = {
+            pid: version for pid, version in self._playlist_versions.items()
+            if targets is None or pid in targets
+        }
+        result = {"playlists": playlists}
+        if targets is None or LIKED_TARGET in targets:
+            result[LIKED_TARGET] = self._liked_version
+        return result
+
+    def _bump_locked(self, targets):
+        for target in targets:
+            self._version_seq += 1
+            if target == LIKED_TARGET:
+                self._liked_version = self._version_seq
+            elif target in self._playlists:
+                self._playlist_versions[target] = self._version_seq
+            else:
+                self._playlist_versions.pop(target, None)
+        self._enqueue('set_meta', 'versions', self._versions_meta_locked())
+
+    def _versions_meta_locked(self):
+        return {
+            'seq': self._version_seq,
+            'liked': self._liked_version,
+            'playlists': dict(self._playlist_versions)
+        }
+
+    def playlists_revision(self):
+        """Текущая ревизия плейлистов без копирования данных"""
+        self._ensure_loaded()
+        with self._lock:
+            return f"{self._epoch}.{self._version_seq}"
+
+    def saved_revision(self):
+        self._ensure_loaded()
+        with self._lock:
+            return f"{self._epoch}.{self._saved_revision}"
+
+    def playlists_snapshot(self):
+        """(ревизия, документ плейлистов) - согласованная пара для ETag"""
+        self._ensure_loaded()
+        with self._lock:
+            return f"{self._epoch}.{self._version_seq}", self.load_playlists()
+
+    def saved_snapshot(self):
+        self._ensure_loaded()
+        with self._lock:
+            return f"{self._epoch}.{self._saved_revision}", self.load_saved_tracks()
+
+    def versions(self):
+        self._ensure_loaded()
+        with self._lock:
+            return self._versions_locked()
+
+    def apply_patch(self, ops):
+        """Применить список точечных правок атомарно.
+
+        Операции: add_tracks, remove_tracks, move_track, rename,
+        create_playlist, delete_playlist, like. Если в операции указан
+        version и он не совпадает с текущим, ничего не применяется и
+        поднимается VersionConflict. Некорректная операция - ValueError,
+        и тоже ничего не применяется. Возвращает (results, versions).
+        """
+        for op in ops:
+            _validate_op(op)
+
+        self._ensure_loaded()
+        with self._lock:
+            for op in ops:
+                target = LIKED_TARGET if op.get('op') == 'like' else str(op.get('playlist_id'))
+                expected = op.get('version')
+                if expected is not None and expected != self._current_version_locked(target):
+                    raise VersionConflict(target, expected, self._current_version_locked(target))
+
+            snapshot = self._snapshot_locked(ops)
+            store_ops = []
+            touched = []
+            results = []
+            try:
+                for op in ops:
+                    target, result = self._apply_op_locked(op, store_ops)
+                    results.append(result)
+                    if target not in touched:
+                        touched.append(target)
+            except Exception:
+                self._restore_locked(snapshot)
+                raise
+
+            for name, args in store_ops:
+                self._enqueue(name, *args)
+            self._bump_locked(touched)
+            return results, self._versions_locked(touched)
+
+    def _snapshot_locked(self, ops):
+        """Копия только затрагиваемых плейлистов, чтобы откатить память при ошибке в середине"""
+        playlist_ids = set()
+        for op in ops:
+            if op.get('op') == 'create_playlist':
+                playlist_ids.add(str((op.get('playlist') or {}).get('id')))
+            elif op.get('playlist_id') is not None:
+                playlist_ids.add(str(op['playlist_id']))
+
+        playlists = {}
+        for playlist_id in playlist_ids:
+            playlist = self._playlists.get(playlist_id)
+            if playlist is None:
+                playlists[playlist_id] = None
+            else:
+                playlists[playlist_id] = (dict(playlist, tracks=list(playlist['tracks'])),
+                                          Counter(self._playlist_keys[playlist_id]))
+
+        structural = any(op.get('op') in ('create_playlist', 'delete_playlist') for op in ops)
+        liked = None
+        if any(op.get('op') == 'like' for op in ops):
+            liked = (list(self._liked), Counter(self._liked_keys))
+        return playlists, (list(self._playlists) if structural else None), liked
+
+    def _restore_locked(self, snapshot):
+        playlists, order, liked = snapshot
+        for playlist_id, saved in playlists.items():
+            if saved is None:
+                self._playlists.pop(playlist_id, None)
+                self._playlist_keys.pop(playlist_id, None)
+            else:
+                self._playlists[playlist_id], self._playlist_keys[playlist_id] = saved
+        if order is not None:
+            self._playlists = OrderedDict((pid, self._playlists[pid]) for pid in order if pid in self._playlists)
+        if liked is not None:
+            self._liked, self._liked_keys = liked
+
+    def _get_playlist_locked(self, op):
+        playlist_id = str(_require(op, 'playlist_id'))
+        playlist = self._playlists.get(playlist_id)
+        if playlist is None:
+            raise LookupError(f"Playlist {playlist_id} not found")
+        return playlist_id, playlist
+
+    def _apply_op_locked(self, op, store_ops):
+        name = op.get('op')
+
+        if name == 'like':
+            track = _require(op, 'track')
+            key = track_key(track)
+            liked = op.get('liked', not self._liked_keys[key])
+            if liked and not self._liked_keys[key]:
+                self._liked.insert(0, track)
+                self._liked_keys[key] += 1
+                store_ops.append(('like_track', (track,)))
+            elif not liked and self._liked_keys[key]:
+                self._liked = [t for t in self._liked if track_key(t) != key]
+                del self._liked_keys[key]
+                store_ops.append(('unlike_track', key))
+            return LIKED_TARGET, {"op": name, "liked": bool(liked)}
+
+        if name == 'create_playlist':
+            playlist = _require(op, 'playlist')
+            playlist_id = str(_require(playlist, 'id'))
+            if playlist_id in self._playlists:
+                raise ValueError(f"Playlist {playlist_id} already exists")
+            self._put_playlist_locked(playlist)
+            store_ops.append(('upsert_playlists', ([playlist], None)))
+            return playlist_id, {"op": name, "playlist_id": playlist_id}
+
+        playlist_id, playlist = self._get_playlist_locked(op)
+        tracks = playlist['tracks']
+        keys = self._playlist_keys[playlist_id]
+
+        if name == 'add_tracks':
+            position = op.get('position', len(tracks))
+            _check_position(position, len(tracks) + 1)
+            added = []
+            for track in _require(op, 'tracks'):
+                key = track_key(track)
+                if keys[key]:
+                    continue
+                keys[key] += 1
+                added.append(track)
+            tracks[position:position] = added
+            if added:
+                store_ops.append(('insert_playlist_tracks', (playlist_id, position, added)))
+            return playlist_id, {"op": name, "added": len(added)}
+
+        if name == 'remove_tracks':
+            positions = []
+            for track in op.get('tracks') or []:
+                key = track_key(track)
+                if not keys[key]:
+                    continue
+                position = next(i for i, t in enumerate(tracks) if track_key(t) == key)
+                positions.append(position)
+                del tracks[position]
+                keys[key] -= 1
+            for position in sorted(set(op.get('positions') or []), reverse=True):
+                _check_position(position, len(tracks))
+                keys[track_key(tracks[position])] -= 1
+                del tracks[position]
+                positions.append(position)
+            store_ops.extend(('remove_playlist_track', (playlist_id, position)) for position in positions)
+            return playlist_id, {"op": name, "removed": len(positions)}
+
+        if name == 'move_track':
+            from_position = _require(op, 'from')
+            to_position = _require(op, 'to')
+            for position in (from_position, to_position):
+                _check_position(position, len(tracks))
+            tracks.insert(to_position, tracks.pop(from_position))
+            store_ops.append(('move_playlist_track', (playlist_id, from_position, to_position)))
+            return playlist_id, {"op": name}
+
+        if name == 'rename':
+            playlist['name'] = _require(op, 'name')
+            store_ops.append(('set_playlist_header', (playlist_id, dict(playlist))))
+            return playlist_id, {"op": name, "name": playlist['name']}
+
+        if name == 'delete_playlist':
+            del self._playlists[playlist_id]
+            del self._playlist_keys[playlist_id]
+            store_ops.append(('delete_playlist', (playlist_id,)))
+            return playlist_id, {"op": name}
+
+        raise ValueError(f"Unknown operation: {name}")
+
+    # --- сохраненные треки ---
+
+    def _set_saved_locked(self, data):
+        self._saved = list(data.get('saved_tracks') or [])
+        self._saved_keys = Counter(track_key(t) for t in self._saved)
+        self._saved_extra = {k: v for k, v in data.items() if k != 'saved_tracks'}
+
+    def load_saved_tracks(self):
+        self._ensure_loaded()
+        with self._lock:
+            return {**self._saved_extra, "saved_tracks": list(self._saved)}
+
+    def replace_saved_tracks(self, data):
+        self._ensure_loaded()
+        with self._lock:
+            self._set_saved_locked(data)
+            self._saved_revision += 1
+            self._enqueue('replace_saved_tracks', data)
+        return True
+
+    def is_saved(self, platform, track_id):
+        self._ensure_loaded()
+        with self._lock:
+            return self._saved_keys[(str(platform), str(track_id))] > 0
+
+    def get_saved_track(self, platform, track_id):
+        self._ensure_loaded()
+        key = (str(platform), str(track_id))
+        with self._lock:
+            if not self._saved_keys[key]:
+                return None
+            return next((t for t in self._saved if track_key(t) == key), None)
+
+    def add_saved_track(self, track):
+        """False, если трек уже сохранен"""
+        self._ensure_loaded()
+        key = track_key(track)
+        with self._lock:
+            if self._saved_keys[key]:
+                return False
+            self._saved.append(track)
+            self._saved_keys[key] += 1
+            self._saved_revision += 1
+            self._enqueue('add_saved_track', track)
+        return True
+
+    def remove_saved_track(self, platform, track_id):
+        self._ensure_loaded()
+        key = (str(platform), str(track_id))
+        with self._lock:
+            if not self._saved_keys[key]:
+                return False
+            for i, track in enumerate(self._saved):
+                if track_key(track) == key:
+                    self._saved.pop(i)
+                    break
+            self._saved_keys[key] -= 1
+            self._saved_revision += 1
+            self._enqueue('remove_saved_track', platform, track_id)
+        return True
+
+    # --- обслуживание ---
+
+    def counts(self):
+        self._ensure_loaded()
+        with self._lock:
+            return {
+                'playlists': len(self._playlists),
+                'playlist_tracks': sum(len(p['tracks']) for p in self._playlists.values()),
+                'liked': len(self._liked),
+                'saved': len(self._saved),
+                'pending_ops': len(self._pending),
+                **self.stats,
+                **self.store.journal_stats()
+            }
+
+    def clear(self):
+        # Ждем идущую запись, иначе она применит старые операции поверх очищенной базы
+        with self._flush_lock, self._lock:
+            self._pending = []
+            self._failed_flushes = 0
+            self._retry_at = 0
+            self._last_flush_error = None
+            self._first_pending_at = self._last_pending_at = None
+            self._set_playlists_locked({})
+            self._set_saved_locked({})
+            self._saved_revision += 1
+            self._loaded = True
+            self.store.clear()
+            self._bump_locked([LIKED_TARGET])
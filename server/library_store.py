@@ -0,0 +1,491 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+import json_codec
+
+
+# Временная позиция трека при перемещении внутри плейлиста
+PARKED_POSITION = 2 ** 62
+
+# WAL - журнал изменений: каждая транзакция дописывается в конец файла -wal.
+# Сжатие журнала в основной файл (checkpoint) делаем сами, в фоне, после
+# N транзакций или M байт журнала, а не на пути записи.
+CHECKPOINT_EVERY_COMMITS = 200
+CHECKPOINT_WAL_BYTES = 4 * 1024 * 1024
+
+
+def _dumps(value):
+    return json_codec.dumps(value)
+
+
+def _track_key(track):
+    return str(track.get('platform', '')), str(track.get('id', ''))
+
+
+class LibraryStore:
+    """Библиотека пользователя (плейлисты, избранное, сохраненные треки) в SQLite.
+
+    Треки хранятся построчно с индексом по (platform, id), поэтому проверки
+    и точечные изменения не требуют чтения и перезаписи всей библиотеки.
+    Сами объекты треков и плейлистов лежат как JSON и возвращаются в том
+    же виде, в каком их прислал клиент.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._conn = None
+        self._lock = threading.RLock()
+        self._commits_since_checkpoint = 0
+        self.checkpoints = 0
+
+    def _connect(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # FULL: коммит = одна дозапись в журнал + fsync, как и прежний fsync JSON-файла
+            conn.execute("PRAGMA synchronous=FULL")
+            conn.execute("PRAGMA wal_autocheckpoint=0")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                );
+                CREATE TABLE IF NOT EXISTS playlists (
+                    id TEXT PRIMARY KEY,
+                    position INTEGER NOT NULL,
+                    data TEXT NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS playlist_tracks (
+                    playlist_id TEXT NOT NULL,
+                    position INTEGER NOT NULL,
+                    platform TEXT NOT NULL,
+                    track_id TEXT NOT NULL,
+                    data TEXT NOT NULL,
+                    PRIMARY KEY (playlist_id, position)
+                );
+                CREATE INDEX IF NOT EXISTS idx_playlist_tracks_track
+                    ON playlist_tracks(playlist_id, platform, track_id);
+                CREATE TABLE IF NOT EXISTS liked (
+                    position INTEGER PRIMARY KEY,
+                    platform TEXT NOT NULL,
+                    track_id TEXT NOT NULL,
+                    data TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_liked_track ON liked(platform, track_id);
+                CREATE TABLE IF NOT EXISTS saved (
+                    position INTEGER PRIMARY KEY,
+                    platform TEXT NOT NULL,
+                    track_id TEXT NOT NULL,
+                    data TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_saved_track ON saved(platform, track_id);
+            """)
+            conn.commit()
+            self._conn = conn
+            print(f"[Library] Opened {self.db_path}")
+        return self._conn
+
+    def _run(self, name, *args):
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                result = getattr(self, f"_{name}")(conn, *args)
+            self._commits_since_checkpoint += 1
+            return result
+
+    def apply_batch(self, ops):
+        """Выполнить список операций [(name, args), ...] одной транзакцией"""
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                for name, args in ops:
+                    getattr(self, f"_{name}")(conn, *args)
+            self._commits_since_checkpoint += 1
+
+    # --- журнал ---
+
+    def _wal_size(self):
+        try:
+            return os.path.getsize(self.db_path + '-wal')
+        except OSError:
+            return 0
+
+    def maybe_checkpoint(self):
+        """Сжать журнал, если накопилось много транзакций или байт"""
+        if (self._commits_since_checkpoint >= CHECKPOINT_EVERY_COMMITS
+                or self._wal_size() >= CHECKPOINT_WAL_BYTES):
+            return self.checkpoint()
+        return False
+
+    def checkpoint(self):
+        """Перенести журнал в основной файл базы и обрезать его"""
+        with self._lock:
+            if self._conn is None:
+                return False
+            wal_size = self._wal_size()
+            busy, _, _ = self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+            if busy:
+                return False
+            self._commits_since_checkpoint = 0
+            self.checkpoints += 1
+        print(f"[Library] Compacted journal ({wal_size / 1024:.0f}KB)")
+        return True
+
+    def journal_stats(self):
+        return {
+            'wal_bytes': self._wal_size(),
+            'commits_since_checkpoint': self._commits_since_checkpoint,
+            'checkpoints': self.checkpoints
+        }
+
+    # --- meta ---
+
+    def _get_meta(self, conn, key, default=None):
+        row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return json_codec.loads(row[0]) if row else default
+
+    def _set_meta(self, conn, key, value):
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, _dumps(value)))
+
+    def get_meta(self, key, default=None):
+        with self._lock:
+            return self._get_meta(self._connect(), key, default)
+
+    # --- плейлисты и избранное ---
+
+    def load_playlists(self):
+        """{"playlists": [...], "liked_tracks": [...]} в исходном формате playlists.json"""
+        with self._lock:
+            conn = self._connect()
+            tracks_by_playlist = {}
+            for playlist_id, data in conn.execute(
+                "SELECT playlist_id, data FROM playlist_tracks ORDER BY playlist_id, position"
+            ):
+                tracks_by_playlist.setdefault(playlist_id, []).append(json_codec.loads(data))
+
+            playlists = []
+            for playlist_id, data in conn.execute("SELECT id, data FROM playlists ORDER BY position"):
+                playlist = json_codec.loads(data)
+                playlist['tracks'] = tracks_by_playlist.get(playlist_id, [])
+                playlists.append(playlist)
+
+            liked = [json_codec.loads(data) for (data,) in conn.execute("SELECT data FROM liked ORDER BY position")]
+            extra = self._get_meta(conn, 'playlists_extra', {})
+
+        return {**extra, "playlists": playlists, "liked_tracks": liked}
+
+    def _write_playlist(self, conn, playlist, position):
+        playlist_id = str(playlist.get('id'))
+        header = {k: v for k, v in playlist.items() if k != 'tracks'}
+        conn.execute(
+            "INSERT OR REPLACE INTO playlists (id, position, data) VALUES (?, ?, ?)",
+            (playlist_id, position, _dumps(header))
+        )
+        conn.execute("DELETE FROM playlist_tracks WHERE playlist_id = ?", (playlist_id,))
+        conn.executemany(
+            "INSERT INTO playlist_tracks (playlist_id, position, platform, track_id, data) VALUES (?, ?, ?, ?, ?)",
+            [(playlist_id, i, *_track_key(track), _dumps(track)) for i, track in enumerate(playlist.get('tracks') or [])]
+        )
+
+    def _write_liked(self, conn, liked_tracks):
+        conn.execute("DELETE FROM liked")
+        conn.executemany(
+            "INSERT INTO liked (position, platform, track_id, data) VALUES (?, ?, ?, ?)",
+            [(i, *_track_key(track), _dumps(track)) for i, track in enumerate(liked_tracks or [])]
+        )
+
+    def replace_playlists(self, data):
+        """Полная замена библиотеки плейлистов одной транзакцией"""
+        self._run('replace_playlists', data)
+        return True
+
+    def _replace_playlists(self, conn, data):
+        conn.execute("DELETE FROM playlists")
+        conn.execute("DELETE FROM playlist_tracks")
+        seen_ids = set()
+        for position, playlist in enumerate(data.get('playlists') or []):
+            playlist_id = str(playlist.get('id'))
+            if playlist_id in seen_ids:
+                # INSERT OR REPLACE оставит только последний плейлист с этим id
+                print(f"[Library] Duplicate playlist id '{playlist_id}' ('{playlist.get('name', '')}'), replacing earlier one")
+            seen_ids.add(playlist_id)
+            self._write_playlist(conn, playlist, position)
+        self._write_liked(conn, data.get('liked_tracks'))
+        self._set_meta(conn, 'playlists_extra', {
+            k: v for k, v in data.items() if k not in ('playlists', 'liked_tracks')
+        })
+
+    def upsert_playlists(self, playlists, liked_tracks=None):
+        """Заменить или добавить в конец указанные плейлисты; liked_tracks=None - не трогать избранное"""
+        self._run('upsert_playlists', playlists, liked_tracks)
+        return True
+
+    def _upsert_playlists(self, conn, playlists, liked_tracks=None):
+        next_position = conn.execute("SELECT COALESCE(MAX(position) + 1, 0) FROM playlists").fetchone()[0]
+        for playlist in playlists:
+            row = conn.execute("SELECT position FROM playlists WHERE id = ?", (str(playlist.get('id')),)).fetchone()
+            if row:
+                position = row[0]
+            else:
+                position = next_position
+                next_position += 1
+            self._write_playlist(conn, playlist, position)
+        if liked_tracks is not None:
+            self._write_liked(conn, liked_tracks)
+
+    def append_playlist_tracks(self, playlist_id, tracks):
+        """Дописать в плейлист треки, которых в нем еще нет.
+
+        Возвращает число добавленных треков или None, если плейлиста нет.
+        """
+        return self._run('append_playlist_tracks', playlist_id, tracks)
+
+    def _append_playlist_tracks(self, conn, playlist_id, tracks):
+        playlist_id = str(playlist_id)
+        if not conn.execute("SELECT 1 FROM playlists WHERE id = ?", (playlist_id,)).fetchone():
+            return None
+
+        position = conn.execute(
+            "SELECT COALESCE(MAX(position) + 1, 0) FROM playlist_tracks WHERE playlist_id = ?",
+            (playlist_id,)
+        ).fetchone()[0]
+        added = 0
+        for track in tracks:
+            platform, track_id = _track_key(track)
+            existing = conn.execute(
+                "SELECT data FROM playlist_tracks WHERE playlist_id = ? AND platform = ? AND track_id = ?",
+                (playlist_id, platform, track_id)
+            ).fetchall()
+            # Как и раньше, дубликатом считается только полностью совпадающий объект трека
+            if any(json_codec.loads(data) == track for (data,) in existing):
+                continue
+            conn.execute(
+                "INSERT INTO playlist_tracks (playlist_id, position, platform, track_id, data) VALUES (?, ?, ?, ?, ?)",
+                (playlist_id, position, platform, track_id, _dumps(track))
+            )
+            position += 1
+            added += 1
+        return added
+
+    # --- точечные операции над плейлистами (delta API) ---
+
+    def _shift_positions(self, conn, playlist_id, start, end, delta):
+        """Сдвинуть позиции [start, end) на delta; end=None - до конца плейлиста.
+
+        Сдвиг идет через отрицательные значения, чтобы не нарушать
+        уникальность (playlist_id, position) на промежуточных шагах.
+        """
+        condition = "playlist_id = ? AND position >= ?" + ("" if end is None else " AND position < ?")
+        params = [playlist_id, start] + ([] if end is None else [end])
+        conn.execute(f"UPDATE playlist_tracks SET position = -(position + ?) - 1 WHERE {condition}", [delta] + params)
+        conn.execute("UPDATE playlist_tracks SET position = -position - 1 WHERE playlist_id = ? AND position < 0", (playlist_id,))
+
+    def _insert_playlist_tracks(self, conn, playlist_id, position, tracks):
+        playlist_id = str(playlist_id)
+        self._shift_positions(conn, playlist_id, position, None, len(tracks))
+        conn.executemany(
+            "INSERT INTO playlist_tracks (playlist_id, position, platform, track_id, data) VALUES (?, ?, ?, ?, ?)",
+            [(playlist_id, position + i, *_track_key(track), _dumps(track)) for i, track in enumerate(tracks)]
+        )
+
+    def _remove_playlist_track(self, conn, playlist_id, position):
+        playlist_id = str(playlist_id)
+        conn.execute("DELETE FROM playlist_tracks WHERE playlist_id = ? AND position = ?", (playlist_id, position))
+        self._shift_positions(conn, playlist_id, position + 1, None, -1)
+
+    def _move_playlist_track(self, conn, playlist_id, from_position, to_position):
+        playlist_id = str(playlist_id)
+        if from_position == to_position:
+            return
+        conn.execute(
+            "UPDATE playlist_tracks SET position = ? WHERE playlist_id = ? AND position = ?",
+            (PARKED_POSITION, playlist_id, from_position)
+        )
+        if from_position < to_position:
+            self._shift_positions(conn, playlist_id, from_position + 1, to_position + 1, -1)
+        else:
+            self._shift_positions(conn, playlist_id, to_position, from_position, 1)
+        conn.execute(
+            "UPDATE playlist_tracks SET position = ? WHERE playlist_id = ? AND position = ?",
+            (to_position, playlist_id, PARKED_POSITION)
+        )
+
+    def _set_playlist_header(self, conn, playlist_id, header):
+        conn.execute(
+            "UPDATE playlists SET data = ? WHERE id = ?",
+            (_dumps({k: v for k, v in header.items() if k != 'tracks'}), str(playlist_id))
+        )
+
+    def _delete_playlist(self, conn, playlist_id):
+        conn.execute("DELETE FROM playlists WHERE id = ?", (str(playlist_id),))
+        conn.execute("DELETE FROM playlist_tracks WHERE playlist_id = ?", (str(playlist_id),))
+
+    def _like_track(self, conn, track):
+        # Новые избранные треки идут в начало списка, как в клиенте
+        conn.execute(
+            "INSERT INTO liked (position, platform, track_id, data) "
+            "VALUES ((SELECT COALESCE(MIN(position) - 1, 0) FROM liked), ?, ?, ?)",
+            (*_track_key(track), _dumps(track))
+        )
+
+    def _unlike_track(self, conn, platform, track_id):
+        conn.execute(
+            "DELETE FROM liked WHERE platform = ? AND track_id = ?",
+            (str(platform), str(track_id))
+        )
+
+    def counts(self):
+        with self._lock:
+            conn = self._connect()
+            return {
+                'playlists': conn.execute("SELECT COUNT(*) FROM playlists").fetchone()[0],
+                'playlist_tracks': conn.execute("SELECT COUNT(*) FROM playlist_tracks").fetchone()[0],
+                'liked': conn.execute("SELECT COUNT(*) FROM liked").fetchone()[0],
+                'saved': conn.execute("SELECT COUNT(*) FROM saved").fetchone()[0]
+            }
+
+    # --- сохраненные треки ---
+
+    def load_saved_tracks(self):
+        with self._lock:
+            conn = self._connect()
+            tracks = [json_codec.loads(data) for (data,) in conn.execute("SELECT data FROM saved ORDER BY position")]
+            extra = self._get_meta(conn, 'saved_extra', {})
+        return {**extra, "saved_tracks": tracks}
+
+    def replace_saved_tracks(self, data):
+        self._run('replace_saved_tracks', data)
+        return True
+
+    def _replace_saved_tracks(self, conn, data):
+        conn.execute("DELETE FROM saved")
+        conn.executemany(
+            "INSERT INTO saved (position, platform, track_id, data) VALUES (?, ?, ?, ?)",
+            [(i, *_track_key(track), _dumps(track)) for i, track in enumerate(data.get('saved_tracks') or [])]
+        )
+        self._set_meta(conn, 'saved_extra', {k: v for k, v in data.items() if k != 'saved_tracks'})
+
+    def get_saved_track(self, platform, track_id):
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT data FROM saved WHERE platform = ? AND track_id = ? ORDER BY position LIMIT 1",
+                (str(platform), str(track_id))
+            ).fetchone()
+        return json_codec.loads(row[0]) if row else None
+
+    def is_saved(self, platform, track_id):
+        with self._lock:
+            return self._connect().execute(
+                "SELECT 1 FROM saved WHERE platform = ? AND track_id = ? LIMIT 1",
+                (str(platform), str(track_id))
+            ).fetchone() is not None
+
+    def add_saved_track(self, track):
+        """False, если трек уже сохранен"""
+        return self._run('add_saved_track', track)
+
+    def _add_saved_track(self, conn, track):
+        platform, track_id = _track_key(track)
+        if conn.execute(
+            "SELECT 1 FROM saved WHERE platform = ? AND track_id = ? LIMIT 1", (platform, track_id)
+        ).fetchone():
+            return False
+        conn.execute(
+            "INSERT INTO saved (position, platform, track_id, data) "
+            "VALUES ((SELECT COALESCE(MAX(position) + 1, 0) FROM saved), ?, ?, ?)",
+            (platform, track_id, _dumps(track))
+        )
+        return True
+
+    def remove_saved_track(self, platform, track_id):
+        """Удалить первое вхождение трека; False, если его не было"""
+        return self._run('remove_saved_track', platform, track_id)
+
+    def _remove_saved_track(self, conn, platform, track_id):
+        removed = conn.execute(
+            "DELETE FROM saved WHERE position = "
+            "(SELECT position FROM saved WHERE platform = ? AND track_id = ? ORDER BY position LIMIT 1)",
+            (str(platform), str(track_id))
+        ).rowcount
+        return removed > 0
+
+    # --- миграция и обслуживание ---
+
+    def _read_migration_file(self, path, key):
+        """Данные JSON-файла для переноса; испорченный JSON считается пустым.
+
+        Ошибки доступа (OSError: файл занят другим процессом, нет прав)
+        пробрасываются - перенос откладывается до следующего запуска.
+        """
+        if not os.path.exists(path):
+            return None, None
+        with open(path, 'rb') as f:
+            raw = f.read()
+        try:
+            data = json.loads(raw.decode('utf-8'))
+            if not isinstance(data, dict) or not isinstance(data.get(key, []), list):
+                raise ValueError(f"unexpected format, '{key}' list expected")
+            return data, '.migrated'
+        except ValueError as e:
+            print(f"[Library] {path} is corrupt, importing it as empty: {e}")
+            return None, '.corrupt'
+
+    def migrate_from_json(self, playlists_file, saved_tracks_file):
+        """Одноразовый перенос playlists.json и saved_tracks.json в базу.
+
+        Оба файла сначала читаются, затем переносятся вместе с отметкой
+        migrated_at одной транзакцией. После коммита файлы переименовываются
+        в *.migrated (нечитаемые - в *.corrupt) и остаются резервной копией.
+        """
+        with self._lock:
+            conn = self._connect()
+            if self._get_meta(conn, 'migrated_at'):
+                return False
+
+            try:
+                playlists_data, playlists_suffix = self._read_migration_file(playlists_file, 'playlists')
+                saved_data, saved_suffix = self._read_migration_file(saved_tracks_file, 'saved_tracks')
+            except OSError as e:
+                # migrated_at не ставим: перенос повторится при следующем запуске
+                print(f"[Library] Migration postponed, cannot read JSON library: {e}")
+                return False
+
+            with conn:
+                if playlists_data is not None:
+                    self._replace_playlists(conn, playlists_data)
+                if saved_data is not None:
+                    self._replace_saved_tracks(conn, saved_data)
+                self._set_meta(conn, 'migrated_at', time.time())
+            self._commits_since_checkpoint += 1
+
+        migrated = {
+            'playlists': len((playlists_data or {}).get('playlists') or []),
+            'saved_tracks': len((saved_data or {}).get('saved_tracks') or [])
+        }
+        for path, suffix in ((playlists_file, playlists_suffix), (saved_tracks_file, saved_suffix)):
+            if suffix and os.path.exists(path):
+                try:
+                    os.replace(path, path + suffix)
+                except OSError as e:
+                    print(f"[Library] Could not rename {path}: {e}")
+
+        print(f"[Library] Migrated from JSON: {migrated}")
+        return True
+
+    def clear(self):
+        self._run('clear')
+
+    def _clear(self, conn):
+        for table in ('playlists', 'playlist_tracks', 'liked', 'saved'):
+            conn.execute(f"DELETE FROM {table}")
+        conn.execute("DELETE FROM meta WHERE key != 'migrated_at'")
+
+    def close(self):
+        self.checkpoint()
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
@@ -0,0 +1,87 @@
+import zlib
+import base64
+
+# Максимальный размер страницы для курсорной пагинации
+MAX_PAGE_SIZE = 500
+# Поля, которые проекция оставляет всегда: без них трек не идентифицировать
+IDENTITY_FIELDS = ('id', 'platform')
+
+
+class CursorError(ValueError):
+    """Некорректный курсор или limit"""
+
+
+class StaleCursorError(CursorError):
+    """Библиотека изменилась между запросами страниц"""
+
+
+def make_etag(kind, revision, query_string=b''):
+    """ETag зависит от ревизии данных и параметров представления"""
+    if isinstance(query_string, str):
+        query_string = query_string.encode('utf-8')
+    variant = zlib.crc32(query_string) if query_string else 0
+    return f"{kind}-{revision}-{variant:08x}"
+
+
+def encode_cursor(revision, offset):
+    raw = f"{revision}:{offset}".encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, revision):
+    """Смещение из курсора; курсор от другой ревизии недействителен"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8')
+        cursor_revision, offset = raw.rsplit(':', 1)
+        offset = int(offset)
+    except (ValueError, UnicodeError):
+        raise CursorError("Invalid cursor")
+
+    if offset < 0:
+        raise CursorError("Invalid cursor")
+    if cursor_revision != revision:
+        raise StaleCursorError("Library changed, restart pagination")
+    return offset
+
+
+def parse_limit(value, default=None):
+    if value is None or value == '':
+        return default
+    try:
+        limit = int(value)
+    except ValueError:
+        raise CursorError("Invalid limit")
+    if limit <= 0:
+        raise CursorError("Invalid limit")
+    return min(limit, MAX_PAGE_SIZE)
+
+
+def parse_fields(value):
+    """'id,title' -> кортеж полей; пусто - без проекции"""
+    if not value:
+        return None
+    fields = [f.strip() for f in value.split(',') if f.strip()]
+    if not fields:
+        return None
+    for field in IDENTITY_FIELDS:
+        if field not in fields:
+            fields.append(field)
+    return tuple(fields)
+
+
+def project_tracks(tracks, fields):
+    if not fields:
+        return tracks
+    return [{f: track[f] for f in fields if f in track} for track in tracks]
+
+
+def paginate(items, revision, cursor=None, limit=None):
+    """Срез списка по курсору; возвращает (страница, next_cursor)"""
+    offset = decode_cursor(cursor, revision) if cursor else 0
+    if limit is None:
+        return items[offset:], None
+
+    end = offset + limit
+    next_cursor = encode_cursor(revision, end) if end < len(items) else None
+    return items[offset:end], next_cursor
@@ -0,0 +1,69 @@
+import threading
+from collections import OrderedDict
+
+
+class LRUSet:
+    """Множество ограниченного размера с порядком последнего добавления.
+
+    Проверка вхождения, добавление и вытеснение самых старых элементов - O(1).
+    Повторное добавление элемента делает его самым свежим. Итерация идет
+    от старых к новым, поэтому список можно сохранить и восстановить.
+    """
+
+    def __init__(self, maxlen, items=()):
+        self.maxlen = maxlen
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self.update(items)
+
+    def add(self, item):
+        with self._lock:
+            self._add_locked(item)
+
+    # Совместимость с прежним deque(maxlen=...)
+    append = add
+
+    def update(self, items):
+        with self._lock:
+            for item in items:
+                self._add_locked(item)
+
+    extend = update
+
+    def _add_locked(self, item):
+        if item in self._items:
+            self._items.move_to_end(item)
+            return
+        self._items[item] = None
+        while len(self._items) > self.maxlen:
+            self._items.popitem(last=False)
+
+    def discard(self, item):
+        with self._lock:
+            self._items.pop(item, None)
+
+    def trim(self, keep):
+        """Оставить только keep самых свежих элементов; возвращает число удаленных"""
+        with self._lock:
+            removed = 0
+            while len(self._items) > keep:
+                self._items.popitem(last=False)
+                removed += 1
+            return removed
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def __contains__(self, item):
+        return item in self._items
+
+    def __len__(self):
+        return len(self._items)
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self._items))
+
+    def __repr__(self):
+        return f"LRUSet(maxlen={self.maxlen}, size={len(self._items)})"
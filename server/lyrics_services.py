@@ -1,6 +1,6 @@
 import os
 import json
-import requests
+from http_pool import http_pool
 import re
 import time
 from bs4 import BeautifulSoup
@@ -127,7 +127,7 @@ def search_genius_songs(title, artist=None):
             url = f"{GENIUS_BASE_URL}/search"
             params = {"q": query}
             
-            response = requests.get(url, headers=GENIUS_HEADERS, params=params, timeout=10)
+            response = http_pool.get(url, headers=GENIUS_HEADERS, params=params, timeout=10)
             
             if response.status_code != 200:
                 continue
@@ -255,7 +255,7 @@ def scrape_genius_lyrics(song_url):
             "Upgrade-Insecure-Requests": "1"
         }
         
-        response = requests.get(song_url, headers=headers, timeout=15)
+        response = http_pool.get(song_url, headers=headers, timeout=15)
         if response.status_code != 200:
             print(f"[Lyrics] HTTP error: {response.status_code}")
             return None
@@ -0,0 +1,183 @@
+import time
+import heapq
+import itertools
+import threading
+
+# Приоритеты предзагрузки: меньше - важнее
+PRIORITY_CURRENT = 0
+PRIORITY_NEXT = 1
+PRIORITY_QUEUE = 2
+PRIORITY_SHUFFLE = 3
+
+CONTEXT_PRIORITIES = {
+    'adjacent_tracks': PRIORITY_NEXT,
+    'url_refresh': PRIORITY_NEXT,
+    'batch_prefetch': PRIORITY_QUEUE,
+    'shuffle_start': PRIORITY_SHUFFLE,
+}
+
+PRELOAD_WORKERS = 2
+PRELOAD_MIN_INTERVAL = 0.3
+PRELOAD_RATE_LIMIT_BACKOFF = 5.0
+
+
+class PreloadJob:
+    __slots__ = ('track_id', 'priority', 'context', 'anchor_track_id', 'created_at', 'cancelled')
+
+    def __init__(self, track_id, priority, context, anchor_track_id):
+        self.track_id = track_id
+        self.priority = priority
+        self.context = context
+        self.anchor_track_id = anchor_track_id
+        self.created_at = time.time()
+        self.cancelled = False
+
+
+class PreloadScheduler:
+    """Единый планировщик предзагрузки с приоритетной очередью.
+
+    Вместо отдельного потока на каждый запрос работает фиксированный пул
+    воркеров. Задачи, привязанные к предыдущему текущему треку, отменяются
+    при его смене, а запуски извлечений ограничены по частоте.
+    """
+
+    def __init__(self, resolve_func, is_cached_func, workers=PRELOAD_WORKERS,
+                 min_interval=PRELOAD_MIN_INTERVAL, rate_limited_func=None):
+        self._resolve = resolve_func
+        self._is_cached = is_cached_func
+        self._rate_limited = rate_limited_func
+        self._workers_count = workers
+        self._min_interval = min_interval
+
+        self._heap = []
+        self._pending = {}
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self._workers = []
+        self._running = False
+        self._next_start = 0
+        self._current_track_id = None
+
+        self.stats = {
+            'submitted': 0,
+            'completed': 0,
+            'failed': 0,
+            'skipped_cached': 0,
+            'cancelled': 0
+        }
+
+    def start(self):
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+            for i in range(self._workers_count):
+                worker = threading.Thread(target=self._worker_loop, name=f"preload-{i}", daemon=True)
+                self._workers.append(worker)
+                worker.start()
+        print(f"[Preload] Scheduler started with {self._workers_count} workers")
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+
+    def submit(self, track_ids, current_track_id=None, context='adjacent_tracks'):
+        """Поставить треки в очередь; возвращает число новых задач"""
+        if not self._running:
+            self.start()
+
+        base_priority = CONTEXT_PRIORITIES.get(context, PRIORITY_QUEUE)
+        added = 0
+        with self._cond:
+            if current_track_id and current_track_id != self._current_track_id:
+                self._set_current_locked(current_track_id)
+
+            for track_id in track_ids:
+                priority = PRIORITY_CURRENT if track_id == current_track_id else base_priority
+                existing = self._pending.get(track_id)
+                if existing and existing.priority <= priority:
+                    continue
+                if existing:
+                    # Повышаем приоритет: старая запись в куче станет пустышкой
+                    existing.cancelled = True
+
+                job = PreloadJob(track_id, priority, context, current_track_id)
+                self._pending[track_id] = job
+                heapq.heappush(self._heap, (priority, next(self._counter), job))
+                self.stats['submitted'] += 1
+                added += 1
+
+            if added:
+                self._cond.notify_all()
+        return added
+
+    def set_current_track(self, track_id):
+        """Сменился текущий трек: отменяем задачи, привязанные к прежнему"""
+        with self._cond:
+            self._set_current_locked(track_id)
+
+    def _set_current_locked(self, track_id):
+        self._current_track_id = track_id
+        cancelled = 0
+        for job in list(self._pending.values()):
+            if job.anchor_track_id and job.anchor_track_id != track_id:
+                job.cancelled = True
+                del self._pending[job.track_id]
+                cancelled += 1
+        if cancelled:
+            self.stats['cancelled'] += cancelled
+            print(f"[Preload] Track changed to {track_id}, cancelled {cancelled} stale jobs")
+
+    def _next_job(self):
+        with self._cond:
+            while self._running:
+                while self._heap and self._heap[0][2].cancelled:
+                    heapq.heappop(self._heap)
+
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+
+                wait_time = self._next_start - time.time()
+                if wait_time > 0:
+                    self._cond.wait(wait_time)
+                    continue
+
+                _, _, job = heapq.heappop(self._heap)
+                self._pending.pop(job.track_id, None)
+
+                interval = self._min_interval
+                if self._rate_limited and self._rate_limited():
+                    interval = PRELOAD_RATE_LIMIT_BACKOFF
+                self._next_start = time.time() + interval
+                return job
+        return None
+
+    def _worker_loop(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+
+            try:
+                if self._is_cached(job.track_id):
+                    outcome = 'skipped_cached'
+                else:
+                    print(f"[Preload] Resolving {job.track_id} (priority {job.priority}, context: {job.context})")
+                    outcome = 'completed' if self._resolve(job.track_id, job.context) else 'failed'
+            except Exception as e:
+                outcome = 'failed'
+                print(f"[Preload] Error for track {job.track_id}: {e}")
+
+            with self._cond:
+                self.stats[outcome] += 1
+
+    def info(self):
+        with self._cond:
+            return {
+                'queued': len(self._pending),
+                'workers': self._workers_count,
+                'current_track_id': self._current_track_id,
+                **self.stats
+            }
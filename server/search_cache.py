@@ -0,0 +1,117 @@
+import re
+import time
+import threading
+import copy
+import functools
+from collections import OrderedDict
+
+SEARCH_CACHE_MAX_ENTRIES = 512
+
+# Время жизни результатов поиска для каждого провайдера (в секундах)
+SEARCH_CACHE_TTL = {
+    'youtube': 1800,
+    'soundcloud': 900,
+    'yandex_music': 900,
+    'youtube_playlists': 3600,
+    'soundcloud_playlists': 1800,
+}
+DEFAULT_SEARCH_TTL = 900
+
+_PUNCTUATION_RE = re.compile(r"[\s\-_–—.,:;!?\"'«»()\[\]{}|/\\]+")
+
+
+def normalize_query(query):
+    """'Artist - Song', ' artist song ' и 'ARTIST  song' дают один ключ"""
+    if not query:
+        return ""
+    return _PUNCTUATION_RE.sub(" ", str(query).casefold()).strip()
+
+
+class SearchCache:
+    """LRU-кэш результатов поиска с TTL на провайдера и счетчиками попаданий"""
+
+    def __init__(self, max_entries=SEARCH_CACHE_MAX_ENTRIES, ttl=None):
+        self.max_entries = max_entries
+        self.ttl = dict(SEARCH_CACHE_TTL)
+        if ttl:
+            self.ttl.update(ttl)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def make_key(self, provider, query, *extra):
+        return (provider, normalize_query(query)) + tuple(extra)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            value, expires_at = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        provider = key[0]
+        expires_at = time.time() + self.ttl.get(provider, DEFAULT_SEARCH_TTL)
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            size = len(self._entries)
+            self._entries.clear()
+            return size
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / total, 3) if total else 0.0
+            }
+
+
+search_cache = SearchCache()
+
+
+def cached_search(provider):
+    """Декоратор для функций вида search(query, *args) -> list.
+
+    Пустые результаты не кэшируются: сервисы возвращают [] и при ошибках.
+    Аргумент timeout не входит в ключ кэша. Вызывающий получает глубокую
+    копию, так что правка словарей треков не меняет кэш.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(query, *args, **kwargs):
+            key_kwargs = sorted((k, v) for k, v in kwargs.items() if k != 'timeout')
+            key = search_cache.make_key(provider, query, *args, *key_kwargs)
+            cached = search_cache.get(key)
+            if cached is not None:
+                return copy.deepcopy(cached)
+
+            results = func(query, *args, **kwargs)
+            if results:
+                search_cache.set(key, copy.deepcopy(results))
+            return results
+        return wrapper
+    return decorator
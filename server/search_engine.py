@@ -0,0 +1,132 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# Дедлайны по умолчанию для каждого провайдера (в секундах)
+DEFAULT_PROVIDER_TIMEOUTS = {
+    'youtube': 8.0,
+    'soundcloud': 5.0,
+    'yandex_music': 5.0,
+}
+DEFAULT_TIMEOUT = 6.0
+SEARCH_MAX_WORKERS = 6
+# Сколько провайдер может ждать свободного потока, прежде чем его снимут.
+# Собственный дедлайн провайдера отсчитывается от реального старта
+SEARCH_QUEUE_TIMEOUT = 10.0
+
+
+def block_meta(block):
+    """Метаданные блока (тайминг и статус) без самих результатов"""
+    return {
+        "elapsed": block["elapsed"],
+        "timed_out": block["timed_out"],
+        "error": block["error"],
+        "count": len(block["results"])
+    }
+
+
+class FederatedSearch:
+    """Параллельный поиск по нескольким провайдерам с дедлайном на каждого"""
+
+    def __init__(self, max_workers=SEARCH_MAX_WORKERS, timeouts=None):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="search")
+        self._providers = {}
+        self._timeouts = dict(DEFAULT_PROVIDER_TIMEOUTS)
+        if timeouts:
+            self._timeouts.update(timeouts)
+        self._lock = threading.Lock()
+
+    def register(self, name, func, timeout=None):
+        """Зарегистрировать провайдера: func(query, timeout) -> list.
+
+        timeout - дедлайн провайдера; его нужно передать в сетевые вызовы,
+        чтобы зависший запрос завершился, а не занимал поток пула.
+        """
+        with self._lock:
+            self._providers[name] = func
+            if timeout is not None:
+                self._timeouts[name] = float(timeout)
+
+    def set_timeout(self, name, timeout):
+        with self._lock:
+            self._timeouts[name] = float(timeout)
+
+    def get_timeout(self, name):
+        return self._timeouts.get(name, DEFAULT_TIMEOUT)
+
+    def providers(self):
+        with self._lock:
+            return list(self._providers.keys())
+
+    def _run_provider(self, name, func, query, timeout, state):
+        start = time.time()
+        state['started'] = start
+        results = func(query, timeout)
+        return results or [], time.time() - start
+
+    def iter_results(self, query, providers=None, timeouts=None):
+        """Генератор блоков результатов в порядке готовности провайдеров.
+
+        Каждый блок: {"provider", "results", "elapsed", "timed_out", "error"}.
+        Провайдер, не уложившийся в свой дедлайн, отдается пустым блоком с
+        timed_out=True и не задерживает остальных.
+        """
+        with self._lock:
+            selected = {
+                name: func for name, func in self._providers.items()
+                if providers is None or name in providers
+            }
+
+        start = time.time()
+        pending = {}
+        states = {}
+        limits = {}
+        for name, func in selected.items():
+            timeout = (timeouts or {}).get(name, self.get_timeout(name))
+            state = {'started': None}
+            future = self._executor.submit(self._run_provider, name, func, query, timeout, state)
+            pending[future] = name
+            states[future] = state
+            limits[future] = timeout
+
+        def deadline(future):
+            started = states[future]['started']
+            if started is None:
+                return start + SEARCH_QUEUE_TIMEOUT
+            return started + limits[future]
+
+        while pending:
+            now = time.time()
+            next_deadline = min(deadline(f) for f in pending)
+            done, _ = wait(list(pending), timeout=max(0, next_deadline - now), return_when=FIRST_COMPLETED)
+
+            for future in done:
+                name = pending.pop(future)
+                block = {"provider": name, "results": [], "elapsed": 0.0, "timed_out": False, "error": None}
+                try:
+                    results, elapsed = future.result()
+                    block["results"] = results
+                    block["elapsed"] = round(elapsed, 3)
+                except Exception as e:
+                    block["error"] = str(e)
+                    block["elapsed"] = round(time.time() - start, 3)
+                yield block
+
+            now = time.time()
+            for future in [f for f in pending if deadline(f) <= now]:
+                name = pending.pop(future)
+                # Снимается только еще не начавшаяся задача; запущенная завершится
+                # сама по таймауту, переданному в провайдера
+                queued = future.cancel()
+                yield {
+                    "provider": name,
+                    "results": [],
+                    "elapsed": round(now - start, 3),
+                    "timed_out": True,
+                    "error": (f"Not started within {SEARCH_QUEUE_TIMEOUT:.1f}s" if queued
+                              else f"Timed out after {limits[future]:.1f}s")
+                }
+
+    def shutdown(self):
+        """Снять задачи из очереди; запущенные провайдеры завершатся по своему таймауту"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -6,6 +6,9 @@ import re
 import time
 from flask import request, jsonify, redirect, Response, send_file
 import urllib.parse
+from search_cache import cached_search
+from http_pool import http_pool
+import json_codec
 
 SC_API_URL = "https://api-v2.soundcloud.com"
 SC_HEADERS = {
@@ -30,8 +33,7 @@ def save_soundcloud_client_id(client_id, settings_file=None):
         data = {'client_id': client_id}
         if settings_file:
             os.makedirs(os.path.dirname(settings_file), exist_ok=True)
-            with open(settings_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
+            json_codec.dump_file(data, settings_file)
         return True
     except Exception as e:
         print(f"[SC] Error saving client ID: {e}")
@@ -39,6 +41,7 @@ def save_soundcloud_client_id(client_id, settings_file=None):
 
 
 
+@cached_search('soundcloud_playlists')
 def search_soundcloud_playlists_fast(query, client_id=None, limit=20):
     """Быстрый поиск плейлистов на SoundCloud - только базовая информация"""
     if not client_id:
@@ -55,7 +58,7 @@ def search_soundcloud_playlists_fast(query, client_id=None, limit=20):
     
     try:
         print(f"[SC] Быстрый поиск плейлистов: '{query}'")
-        response = requests.get(url, params=params, headers=SC_HEADERS)
+        response = http_pool.get(url, params=params, headers=SC_HEADERS)
         
         if response.status_code != 200:
             print(f"[SC] Ошибка поиска плейлистов: {response.status_code}")
@@ -93,7 +96,7 @@ def search_soundcloud_playlists(query, client_id=None, limit=20):
     
     try:
         print(f"[SC] Поиск плейлистов: '{query}'")
-        response = requests.get(url, params=params, headers=SC_HEADERS)
+        response = http_pool.get(url, params=params, headers=SC_HEADERS)
         
         if response.status_code != 200:
             print(f"[SC] Ошибка поиска плейлистов: {response.status_code}")
@@ -214,7 +217,7 @@ def get_soundcloud_playlist_details(playlist_id, client_id):
     
     try:
         print(f"[SC] Загрузка полной информации о плейлисте: {playlist_id}")
-        response = requests.get(url, params=params, headers=SC_HEADERS)
+        response = http_pool.get(url, params=params, headers=SC_HEADERS)
         
         if response.status_code != 200:
             print(f"[SC] Ошибка загрузки плейлиста: {response.status_code}")
@@ -273,7 +276,7 @@ def get_soundcloud_playlist_details(playlist_id, client_id):
                         'client_id': client_id
                     }
                     
-                    response = requests.get(batch_url, params=params, headers=SC_HEADERS)
+                    response = http_pool.get(batch_url, params=params, headers=SC_HEADERS)
                     
                     if response.status_code == 200:
                         batch_tracks = response.json()
@@ -310,7 +313,8 @@ def get_soundcloud_playlist_details(playlist_id, client_id):
         print(f"[SC] Ошибка загрузки деталей плейлиста: {e}")
         return None
 
-def search_soundcloud(query, client_id=None):
+@cached_search('soundcloud')
+def search_soundcloud(query, client_id=None, timeout=None):
     if not client_id:
         return []
     
@@ -323,7 +327,7 @@ def search_soundcloud(query, client_id=None):
     }
     
     try:
-        r = requests.get(url, params=params, headers=SC_HEADERS)
+        r = http_pool.get(url, params=params, headers=SC_HEADERS, **({'timeout': timeout} if timeout else {}))
         if r.status_code != 200:
             return []
         
@@ -367,7 +371,7 @@ def get_soundcloud_stream_url(track_id, client_id=None):
         url = f"{SC_API_URL}/tracks/{track_id}"
         params = {"client_id": client_id}
         
-        r = requests.get(url, params=params, headers=SC_HEADERS)
+        r = http_pool.get(url, params=params, headers=SC_HEADERS)
         if r.status_code != 200:
             return None
         
@@ -393,7 +397,7 @@ def get_soundcloud_stream_url(track_id, client_id=None):
             return None
         
         stream_params = {"client_id": client_id}
-        sr = requests.get(stream_url, params=stream_params, headers=SC_HEADERS)
+        sr = http_pool.get(stream_url, params=stream_params, headers=SC_HEADERS)
         
         if sr.status_code != 200:
             return None
@@ -414,7 +418,7 @@ def get_soundcloud_stream_url_with_error_info(track_id, client_id=None):
         url = f"{SC_API_URL}/tracks/{track_id}"
         params = {"client_id": client_id}
         
-        r = requests.get(url, params=params, headers=SC_HEADERS)
+        r = http_pool.get(url, params=params, headers=SC_HEADERS)
         
         if r.status_code == 404:
             return None, "Трек не найден или удален"
@@ -465,7 +469,7 @@ def get_soundcloud_stream_url_with_error_info(track_id, client_id=None):
             return None, "Не удалось получить ссылку на поток"
         
         stream_params = {"client_id": client_id}
-        sr = requests.get(stream_url, params=stream_params, headers=SC_HEADERS)
+        sr = http_pool.get(stream_url, params=stream_params, headers=SC_HEADERS)
         
         if sr.status_code != 200:
             return None, "Ошибка получения прямой ссылки на аудиофайл"
@@ -491,7 +495,7 @@ def get_soundcloud_track_info(track_id, client_id=None):
         url = f"{SC_API_URL}/tracks/{track_id}"
         params = {"client_id": client_id}
         
-        r = requests.get(url, params=params, headers=SC_HEADERS)
+        r = http_pool.get(url, params=params, headers=SC_HEADERS)
         if r.status_code != 200:
             return None
         
@@ -542,7 +546,7 @@ def download_soundcloud_audio(track_id, client_id=None):
             'Referer': 'https://soundcloud.com/',
         }
         
-        response = requests.get(direct_url, headers=headers, stream=True, timeout=30)
+        response = http_pool.get(direct_url, headers=headers, stream=True, timeout=30)
         response.raise_for_status()
         
         total_size = int(response.headers.get('content-length', 0))
@@ -618,7 +622,7 @@ def get_track_full_info(track_id, client_id):
         url = f"{SC_API_URL}/tracks/{track_id}"
         params = {"client_id": client_id}
         
-        response = requests.get(url, params=params, headers=SC_HEADERS)
+        response = http_pool.get(url, params=params, headers=SC_HEADERS)
         if response.status_code == 200:
             return response.json()
         else:
@@ -747,7 +751,7 @@ def import_playlist(playlist_data, client_id):
                     'client_id': client_id
                 }
                 
-                response = requests.get(batch_url, params=params, headers=SC_HEADERS)
+                response = http_pool.get(batch_url, params=params, headers=SC_HEADERS)
                 
                 if response.status_code == 200:
                     batch_tracks = response.json()
@@ -808,7 +812,7 @@ def import_user_likes_by_id(user_id, username, client_id):
                     'linked_partitioning': 1
                 }
                 
-                response = requests.get(endpoint, params=params, headers=SC_HEADERS)
+                response = http_pool.get(endpoint, params=params, headers=SC_HEADERS)
                 
                 if response.status_code != 200:
                     break
@@ -879,7 +883,7 @@ def import_user_likes(user_data, client_id):
 
 def import_user_likes_by_username(username, client_id):
     user_url = f"{SC_API_URL}/resolve?url=https://soundcloud.com/{username}&client_id={client_id}"
-    response = requests.get(user_url, headers=SC_HEADERS)
+    response = http_pool.get(user_url, headers=SC_HEADERS)
     
     if response.status_code != 200:
         raise Exception(f"Could not resolve user: {response.status_code}")
@@ -908,7 +912,7 @@ def import_soundcloud_playlist(playlist_url, client_id):
             'client_id': client_id
         }
         
-        response = requests.get(resolve_url, params=params, headers=SC_HEADERS)
+        response = http_pool.get(resolve_url, params=params, headers=SC_HEADERS)
         
         if response.status_code != 200:
             raise Exception(f"Error resolving URL (status {response.status_code}). Make sure the URL is correct and the content is public.")
@@ -1038,7 +1042,7 @@ def setup_soundcloud_routes(app, SOUNDCLOUD_SETTINGS_FILE, FFMPEG_DIR):
                 'client_id': client_id
             }
             
-            response = requests.get(test_url, params=test_params, headers=SC_HEADERS, timeout=5)
+            response = http_pool.get(test_url, params=test_params, headers=SC_HEADERS, timeout=5)
             
             if response.status_code == 200:
                 return jsonify({
@@ -1202,7 +1206,7 @@ def setup_soundcloud_routes(app, SOUNDCLOUD_SETTINGS_FILE, FFMPEG_DIR):
                 }), 400
             
             result = import_soundcloud_playlist(playlist_url, client_id)
-            return jsonify(result)
+            return json_codec.json_response(result)
         except Exception as e:
             return jsonify({"error": str(e)}), 500
     
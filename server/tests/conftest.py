@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Модули сервера импортируют друг друга по имени, как при запуске из server/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,96 @@
+import re
+
+import pytest
+from flask import Flask
+
+from youtube_services import parse_byte_ranges, send_cached_file, MAX_BYTE_RANGES
+
+DATA = bytes(range(256)) * 4  # 1024 байта
+
+
+@pytest.mark.parametrize('header, expected', [
+    (None, None),
+    ('', None),
+    ('items=0-1', None),
+    ('bytes=0-99', [(0, 99)]),
+    ('bytes=1000-', [(1000, 1023)]),
+    ('bytes=-24', [(1000, 1023)]),
+    ('bytes=-5000', [(0, 1023)]),
+    ('bytes=1000-5000', [(1000, 1023)]),
+    ('bytes=0-9, 20-29', [(0, 9), (20, 29)]),
+    ('bytes=2000-3000', []),
+    ('bytes=2000-3000,0-0', [(0, 0)]),
+    ('bytes=-0', []),
+    ('bytes=10-5', None),
+    ('bytes=abc-5', None),
+    ('bytes=5', None),
+])
+def test_parse_byte_ranges(header, expected):
+    assert parse_byte_ranges(header, len(DATA)) == expected
+
+
+def test_too_many_ranges_fall_back_to_full_file():
+    header = 'bytes=' + ','.join(f'{i}-{i}' for i in range(MAX_BYTE_RANGES + 1))
+    assert parse_byte_ranges(header, len(DATA)) is None
+
+
+@pytest.fixture
+def audio_file(tmp_path):
+    path = tmp_path / 'track.mp3'
+    path.write_bytes(DATA)
+    return str(path)
+
+
+def send(audio_file, range_header=None):
+    app = Flask(__name__)
+    headers = {'Range': range_header} if range_header else {}
+    with app.test_request_context(headers=headers):
+        response = send_cached_file(audio_file, 'vid')
+        response.direct_passthrough = False
+        body = response.get_data()
+        response.close()
+    return response, body
+
+
+def test_single_range(audio_file):
+    response, body = send(audio_file, 'bytes=10-19')
+    assert response.status_code == 206
+    assert response.headers['Content-Range'] == 'bytes 10-19/1024'
+    assert body == DATA[10:20]
+    assert int(response.headers['Content-Length']) == len(body)
+
+
+def test_range_to_end_of_file(audio_file):
+    response, body = send(audio_file, 'bytes=1000-')
+    assert response.status_code == 206
+    assert body == DATA[1000:]
+
+
+def test_unsatisfiable_range(audio_file):
+    response, _ = send(audio_file, 'bytes=5000-6000')
+    assert response.status_code == 416
+    assert response.headers['Content-Range'] == 'bytes */1024'
+
+
+def test_multipart_byteranges(audio_file):
+    response, body = send(audio_file, 'bytes=0-3,-4')
+    assert response.status_code == 206
+    match = re.fullmatch(r'multipart/byteranges; boundary=(\w+)', response.headers['Content-Type'])
+    assert match
+    boundary = match.group(1).encode()
+    assert int(response.headers['Content-Length']) == len(body)
+
+    parts = body.split(b'--' + boundary)
+    assert parts[0] == b'' and parts[-1] == b'--\r\n'
+    payloads = []
+    for part in parts[1:-1]:
+        head, payload = part.split(b'\r\n\r\n', 1)
+        assert payload.endswith(b'\r\n')
+        payloads.append((head.split(b'Content-Range: ')[1], payload[:-2]))
+    assert payloads == [(b'bytes 0-3/1024', DATA[:4]), (b'bytes 1020-1023/1024', DATA[1020:])]
+
+
+def test_full_file_without_range(audio_file):
+    response, body = send(audio_file)
+    assert response.status_code == 200
+    assert body == DATA
@@ -0,0 +1,128 @@
+import pytest
+
+from library_store import LibraryStore
+from library_index import LibraryIndex
+
+
+def track(track_id):
+    return {'id': track_id, 'platform': 'youtube', 'title': f'Track {track_id}'}
+
+
+def track_ids(index, playlist_id='p1'):
+    playlist = next(p for p in index.load_playlists()['playlists'] if str(p['id']) == playlist_id)
+    return [t['id'] for t in playlist['tracks']]
+
+
+def failing_batch(ops):
+    raise OSError('disk full')
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = LibraryStore(str(tmp_path / 'library.db'))
+    yield store
+    store.close()
+
+
+@pytest.fixture
+def index(store):
+    # Большие задержки: в тестах очередь сбрасывается только явным flush()
+    index = LibraryIndex(store, flush_delay=60, flush_max_delay=60)
+    index.apply_patch([{'op': 'create_playlist',
+                        'playlist': {'id': 'p1', 'name': 'Mix', 'tracks': [track(1), track(2), track(3)]}}])
+    index.flush()
+    yield index
+    index.close()
+
+
+def test_add_move_remove(index):
+    results, versions = index.apply_patch([
+        {'op': 'add_tracks', 'playlist_id': 'p1', 'tracks': [track(4), track(1)], 'position': 0},
+        {'op': 'move_track', 'playlist_id': 'p1', 'from': 0, 'to': 3},
+        {'op': 'remove_tracks', 'playlist_id': 'p1', 'positions': [0]},
+    ])
+    assert results[0] == {'op': 'add_tracks', 'added': 1}
+    assert results[2] == {'op': 'remove_tracks', 'removed': 1}
+    assert track_ids(index) == [2, 3, 4]
+    assert versions['playlists']['p1'] == 2
+
+
+def test_version_conflict_applies_nothing(index):
+    from library_index import VersionConflict
+
+    with pytest.raises(VersionConflict):
+        index.apply_patch([{'op': 'rename', 'playlist_id': 'p1', 'name': 'New', 'version': 99}])
+    assert index.versions()['playlists']['p1'] == 1
+
+
+@pytest.mark.parametrize('op', [
+    'not an op',
+    {'op': 'unknown', 'playlist_id': 'p1'},
+    {'op': 'add_tracks', 'playlist_id': 'p1', 'tracks': 'abc'},
+    {'op': 'add_tracks', 'playlist_id': 'p1', 'tracks': ['abc']},
+    {'op': 'add_tracks', 'playlist_id': 'p1', 'tracks': [track(9)], 'position': True},
+    {'op': 'move_track', 'playlist_id': 'p1', 'from': True, 'to': 0},
+    {'op': 'move_track', 'playlist_id': 'p1', 'from': 0, 'to': '1'},
+    {'op': 'remove_tracks', 'playlist_id': 'p1', 'positions': [-1]},
+    {'op': 'rename', 'playlist_id': 'p1', 'name': 5},
+    {'op': 'like', 'track': 'abc'},
+])
+def test_malformed_op_rejected_before_applying(index, op):
+    before = index.versions()
+    with pytest.raises(ValueError):
+        index.apply_patch([{'op': 'add_tracks', 'playlist_id': 'p1', 'tracks': [track(9)]}, op])
+    assert index.versions() == before
+    assert track_ids(index) == [1, 2, 3]
+
+
+def test_out_of_range_position_rolls_back_batch(index):
+    before = index.versions()
+    with pytest.raises(ValueError):
+        index.apply_patch([
+            {'op': 'add_tracks', 'playlist_id': 'p1', 'tracks': [track(9)]},
+            {'op': 'move_track', 'playlist_id': 'p1', 'from': 0, 'to': 4},
+        ])
+    assert index.versions() == before
+    assert track_ids(index) == [1, 2, 3]
+    assert index.info()['pending_ops'] == 0
+
+
+def test_missing_playlist_is_lookup_error(index):
+    with pytest.raises(LookupError):
+        index.apply_patch([{'op': 'rename', 'playlist_id': 'nope', 'name': 'x'}])
+
+
+def test_flush_failure_keeps_ops_and_recovers(index, store, monkeypatch):
+    index.apply_patch([{'op': 'add_tracks', 'playlist_id': 'p1', 'tracks': [track(4)]}])
+    pending = index.info()['pending_ops']
+
+    with monkeypatch.context() as m:
+        m.setattr(store, 'apply_batch', failing_batch)
+        assert index.flush() == 0
+        assert index.flush() == 0
+
+    info = index.info()
+    assert info['flush_failing'] and info['failed_flushes'] == 2
+    assert info['last_flush_error'] == 'disk full'
+    assert info['pending_ops'] == pending
+
+    assert index.flush() == pending
+    info = index.info()
+    assert not info['flush_failing'] and info['pending_ops'] == 0
+    assert [t['id'] for t in store.load_playlists()['playlists'][0]['tracks']] == [1, 2, 3, 4]
+
+
+def test_repeated_flush_failures_switch_to_full_rewrite(index, store, monkeypatch):
+    import library_index
+
+    with monkeypatch.context() as m:
+        m.setattr(store, 'apply_batch', failing_batch)
+        for i in range(library_index.FLUSH_REWRITE_AFTER):
+            index.apply_patch([{'op': 'add_tracks', 'playlist_id': 'p1', 'tracks': [track(10 + i)]}])
+            index.flush()
+
+    assert index.stats['full_rewrites'] >= 1
+    assert index.flush() > 0
+    expected = [1, 2, 3] + [10 + i for i in range(library_index.FLUSH_REWRITE_AFTER)]
+    assert [t['id'] for t in store.load_playlists()['playlists'][0]['tracks']] == expected
+    assert store.get_meta('versions', {})['playlists']['p1'] == index.versions()['playlists']['p1']
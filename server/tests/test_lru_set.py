@@ -0,0 +1,42 @@
+from lru_set import LRUSet
+
+
+def test_evicts_oldest_over_maxlen():
+    items = LRUSet(3, ['a', 'b', 'c'])
+    items.add('d')
+    assert list(items) == ['b', 'c', 'd']
+    assert 'a' not in items
+    assert len(items) == 3
+
+
+def test_re_adding_refreshes_item():
+    items = LRUSet(3, ['a', 'b', 'c'])
+    items.add('a')
+    items.add('d')
+    assert list(items) == ['c', 'a', 'd']
+
+
+def test_trim_keeps_newest():
+    items = LRUSet(10, range(6))
+    assert items.trim(2) == 4
+    assert list(items) == [4, 5]
+    assert items.trim(5) == 0
+
+
+def test_deque_compatible_api():
+    items = LRUSet(2)
+    items.append('a')
+    items.extend(['b', 'c'])
+    assert list(items) == ['b', 'c']
+    items.discard('b')
+    items.discard('missing')
+    assert list(items) == ['c']
+    items.clear()
+    assert len(items) == 0
+
+
+def test_iteration_is_a_snapshot():
+    items = LRUSet(5, ['a', 'b'])
+    for item in items:
+        items.add(item + '!')
+    assert list(items) == ['a', 'b', 'a!', 'b!']
@@ -0,0 +1,100 @@
+import itertools
+import threading
+
+import pytest
+
+from wave_buffer import WaveBuffer
+
+
+class FakeRotor:
+    """fetch_func для буфера: выдает треки с возрастающими id"""
+
+    def __init__(self):
+        self.ids = itertools.count(1)
+        self.calls = []
+        self.gate = None
+
+    def __call__(self, count):
+        self.calls.append(count)
+        if self.gate is not None:
+            self.gate.wait(5)
+        return [{'id': str(next(self.ids))} for _ in range(count)]
+
+
+@pytest.fixture
+def rotor():
+    return FakeRotor()
+
+
+@pytest.fixture
+def buffer(rotor):
+    taken = []
+    buffer = WaveBuffer(rotor, size=6, low_water=3, on_take=taken.extend)
+    buffer.taken = taken
+    yield buffer
+    buffer.stop()
+
+
+def wait_for(predicate, timeout=5):
+    event = threading.Event()
+    for _ in range(int(timeout / 0.01)):
+        if predicate():
+            return True
+        event.wait(0.01)
+    return predicate()
+
+
+def test_take_waits_for_first_refill(buffer):
+    tracks = buffer.take(2)
+    assert [t['id'] for t in tracks] == ['1', '2']
+    assert buffer.taken == tracks
+    assert wait_for(lambda: buffer.info()['buffered'] == 4)
+
+
+def test_refills_below_low_water(buffer, rotor):
+    buffer.take(2)
+    buffer.take(2)
+    # Осталось 2 < low_water: буфер дозагружается до size
+    assert wait_for(lambda: buffer.info()['buffered'] == 6)
+    assert rotor.calls[0] == 6
+    assert rotor.calls[1] == 4
+
+
+def test_excluded_ids_are_skipped(buffer):
+    tracks = buffer.take(3, exclude_ids={'2', '3'})
+    assert [t['id'] for t in tracks] == ['1', '4', '5']
+    assert buffer.taken == tracks
+
+
+def test_clear_drops_buffered_and_in_flight_tracks(buffer, rotor):
+    buffer.take(1)
+    assert wait_for(lambda: buffer.info()['buffered'] == 5)
+
+    rotor.gate = threading.Event()
+    buffer.take(3)
+    assert wait_for(lambda: buffer.info()['fetching'])
+    buffer.clear()
+    assert buffer.info()['buffered'] == 0
+    rotor.gate.set()
+
+    # Ответ, начатый до clear, в буфер не попадает: следующий трек из новой загрузки
+    next_id = int(buffer.take(1)[0]['id'])
+    assert next_id > 6 + rotor.calls[1]
+    assert [t['id'] for t in buffer.taken[:4]] == ['1', '2', '3', '4']
+
+
+def test_empty_fetch_backs_off(rotor):
+    buffer = WaveBuffer(lambda count: [], size=4, low_water=2)
+    try:
+        assert buffer.take(1, wait=0.5) == []
+        info = buffer.info()
+        assert info['empty_fetches'] >= 1
+        assert info['fetches'] == info['empty_fetches']
+    finally:
+        buffer.stop()
+
+
+def test_stopped_buffer_returns_nothing(buffer, rotor):
+    buffer.stop()
+    assert buffer.take(1) == []
+    assert rotor.calls == []
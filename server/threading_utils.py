@@ -1,5 +1,6 @@
 import threading
 import time
+from concurrent.futures import Future
 from contextlib import contextmanager
 
 class TimedLock:
@@ -36,7 +37,54 @@ class TimedLock:
             if acquired:
                 self._lock.release()
 
+class SingleFlight:
+    """Объединение одновременных вызовов с одинаковым ключом в один.
+
+    Первый вызов выполняет функцию, остальные ждут его общий Future и
+    получают тот же результат (или то же исключение).
+    """
+    
+    def __init__(self, name="UnnamedSingleFlight"):
+        self.name = name
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self.shared_calls = 0
+    
+    def do(self, key, func, *args, timeout=None, **kwargs):
+        with self._lock:
+            future = self._inflight.get(key)
+            is_leader = future is None
+            if is_leader:
+                future = Future()
+                self._inflight[key] = future
+            else:
+                self.shared_calls += 1
+        
+        if not is_leader:
+            return future.result(timeout=timeout)
+        
+        try:
+            result = func(*args, **kwargs)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+    
+    def in_flight(self, key):
+        with self._lock:
+            return key in self._inflight
+
 # Безопасные версии существующих блокировок
 youtube_cache_lock = TimedLock("youtube_cache")
 current_playing_track_lock = TimedLock("current_playing_track")
-queued_tracks_lock = TimedLock("queued_tracks")
\ No newline at end of file
+queued_tracks_lock = TimedLock("queued_tracks")
+
+# Общие извлечения URL YouTube по video_id
+youtube_extract_flight = SingleFlight("youtube_extract")
+
+# Общие запросы прямых ссылок Яндекс.Музыки по track_id
+yandex_link_flight = SingleFlight("yandex_link")
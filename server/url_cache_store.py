@@ -0,0 +1,95 @@
+import os
+import time
+import sqlite3
+import threading
+
+
+class UrlCacheStore:
+    """Постоянный кэш прямых ссылок YouTube в SQLite.
+
+    Соединение открывается лениво при первом обращении, поэтому запуск
+    сервера не ждет чтения базы. Записи с истекшим сроком не отдаются.
+    """
+
+    FIELDS = ('url', 'timestamp', 'expires_at', 'format', 'ext', 'duration', 'title', 'uploader')
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS youtube_urls (
+                    video_id TEXT PRIMARY KEY,
+                    url TEXT NOT NULL,
+                    timestamp REAL NOT NULL,
+                    expires_at REAL NOT NULL,
+                    format TEXT,
+                    ext TEXT,
+                    duration REAL,
+                    title TEXT,
+                    uploader TEXT
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_youtube_urls_expires ON youtube_urls(expires_at)")
+            conn.commit()
+            self._conn = conn
+            print(f"[URLStore] Opened {self.db_path}")
+        return self._conn
+
+    def get(self, video_id, min_remaining=0):
+        with self._lock:
+            row = self._connect().execute(
+                f"SELECT {', '.join(self.FIELDS)} FROM youtube_urls WHERE video_id = ? AND expires_at > ?",
+                (video_id, time.time() + min_remaining)
+            ).fetchone()
+        if not row:
+            return None
+        return dict(zip(self.FIELDS, row))
+
+    def put(self, video_id, entry):
+        values = [entry.get(field) for field in self.FIELDS]
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                f"INSERT OR REPLACE INTO youtube_urls (video_id, {', '.join(self.FIELDS)}) "
+                f"VALUES (?, {', '.join('?' for _ in self.FIELDS)})",
+                [video_id] + values
+            )
+            conn.commit()
+
+    def delete(self, video_id):
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM youtube_urls WHERE video_id = ?", (video_id,))
+            conn.commit()
+
+    def prune_expired(self):
+        with self._lock:
+            conn = self._connect()
+            removed = conn.execute("DELETE FROM youtube_urls WHERE expires_at <= ?", (time.time(),)).rowcount
+            conn.commit()
+        return removed
+
+    def clear(self):
+        with self._lock:
+            conn = self._connect()
+            removed = conn.execute("DELETE FROM youtube_urls").rowcount
+            conn.commit()
+        return removed
+
+    def count(self):
+        with self._lock:
+            return self._connect().execute("SELECT COUNT(*) FROM youtube_urls").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
@@ -0,0 +1,171 @@
+import time
+import threading
+from collections import deque
+
+# Сколько готовых треков держать и с какого уровня начинать дозагрузку
+WAVE_BUFFER_SIZE = 15
+WAVE_BUFFER_LOW_WATER = 8
+# Сколько ждать дозагрузки, если буфер пуст в момент запроса
+WAVE_BUFFER_WAIT = 10.0
+# Пауза после пустого ответа ротора, удваивается до максимума
+WAVE_REFILL_BACKOFF = 2.0
+WAVE_REFILL_MAX_BACKOFF = 30.0
+
+
+class WaveBuffer:
+    """Буфер готовых треков волны с фоновой дозагрузкой.
+
+    fetch_func(count) -> список отформатированных треков: уже отфильтрованных
+    от повторов и гидратированных. Фоновый поток держит в буфере до size
+    треков и дозагружает их, когда остается меньше low_water, поэтому запрос
+    следующих треков обычно просто забирает их из очереди.
+
+    on_take(tracks) вызывается для треков, реально отданных клиенту; треки,
+    сброшенные из буфера, в него не попадают.
+    """
+
+    def __init__(self, fetch_func, size=WAVE_BUFFER_SIZE, low_water=WAVE_BUFFER_LOW_WATER, on_take=None):
+        self._fetch = fetch_func
+        self._on_take = on_take
+        self.size = size
+        self.low_water = low_water
+
+        self._tracks = deque()
+        self._cond = threading.Condition()
+        self._generation = 0
+        self._active = False
+        self._running = False
+        self._stopped = False
+        self._fetching = False
+        self._worker = None
+        self._backoff_until = 0
+        self._backoff = WAVE_REFILL_BACKOFF
+
+        self.stats = {'served': 0, 'fetches': 0, 'empty_fetches': 0, 'fetch_errors': 0, 'waits': 0}
+
+    def start(self):
+        """Включить дозагрузку (после запуска волны)"""
+        with self._cond:
+            if self._stopped:
+                return
+            self._active = True
+            if not self._running:
+                self._running = True
+                self._worker = threading.Thread(target=self._worker_loop, name="wave-buffer", daemon=True)
+                self._worker.start()
+            self._cond.notify_all()
+
+    def stop(self):
+        """Остановить поток насовсем (при выходе); повторно не запускается"""
+        with self._cond:
+            self._stopped = True
+            self._running = False
+            self._active = False
+            self._cond.notify_all()
+
+    def clear(self):
+        """Сбросить буфер: сменилась роторная сессия или настройки волны"""
+        with self._cond:
+            self._generation += 1
+            dropped = len(self._tracks)
+            self._tracks.clear()
+            self._backoff_until = 0
+            self._backoff = WAVE_REFILL_BACKOFF
+            self._cond.notify_all()
+        if dropped:
+            print(f"[WaveBuffer] Cleared {dropped} buffered tracks")
+
+    def take(self, count, exclude_ids=(), wait=WAVE_BUFFER_WAIT):
+        """Забрать до count треков; ждет только если буфер пуст"""
+        exclude_ids = set(exclude_ids)
+        deadline = time.time() + wait
+        result = []
+
+        with self._cond:
+            if self._stopped:
+                return result
+            if not self._active:
+                self.start()
+
+            while True:
+                while self._tracks and len(result) < count:
+                    track = self._tracks.popleft()
+                    if track.get('id') not in exclude_ids:
+                        result.append(track)
+
+                if result:
+                    break
+
+                remaining = deadline - time.time()
+                if remaining <= 0 or (not self._fetching and self._backoff_until > time.time()):
+                    break
+
+                self.stats['waits'] += 1
+                self._cond.notify_all()
+                self._cond.wait(remaining)
+
+            self.stats['served'] += len(result)
+            self._cond.notify_all()
+
+        if result and self._on_take:
+            try:
+                self._on_take(result)
+            except Exception as e:
+                print(f"[WaveBuffer] on_take error: {e}")
+        return result
+
+    def _needs_refill(self):
+        return self._active and len(self._tracks) < self.low_water and time.time() >= self._backoff_until
+
+    def _worker_loop(self):
+        while True:
+            with self._cond:
+                while self._running and not self._needs_refill():
+                    timeout = None
+                    if self._active and len(self._tracks) < self.low_water:
+                        timeout = max(0.1, self._backoff_until - time.time())
+                    self._cond.wait(timeout)
+                if not self._running:
+                    return
+
+                generation = self._generation
+                count = self.size - len(self._tracks)
+                self._fetching = True
+
+            tracks = []
+            failed = False
+            try:
+                tracks = self._fetch(count) or []
+            except Exception as e:
+                failed = True
+                print(f"[WaveBuffer] Refill error: {e}")
+
+            with self._cond:
+                self._fetching = False
+                self.stats['fetch_errors' if failed else 'fetches'] += 1
+                if generation == self._generation:
+                    known = {track.get('id') for track in self._tracks}
+                    for track in tracks:
+                        if track.get('id') not in known:
+                            self._tracks.append(track)
+                            known.add(track.get('id'))
+
+                    if tracks:
+                        self._backoff = WAVE_REFILL_BACKOFF
+                    else:
+                        self.stats['empty_fetches'] += 1
+                        self._backoff_until = time.time() + self._backoff
+                        self._backoff = min(self._backoff * 2, WAVE_REFILL_MAX_BACKOFF)
+                    print(f"[WaveBuffer] Refilled with {len(tracks)} tracks, buffered: {len(self._tracks)}")
+                self._cond.notify_all()
+
+    def info(self):
+        with self._cond:
+            return {
+                'buffered': len(self._tracks),
+                'size': self.size,
+                'low_water': self.low_water,
+                'active': self._active,
+                'fetching': self._fetching,
+                **self.stats
+            }
@@ -1,28 +1,76 @@
 import os
 import json
-import requests
-import tempfile
 import re
 import time
-from flask import request, jsonify, redirect, Response, send_file
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+from flask import request, jsonify, redirect, Response
 import urllib.parse
 from yandex_music import Client
 from yandex_music.exceptions import NetworkError, UnauthorizedError
+from search_cache import cached_search
+from audio_cache import serve_audio, parse_content_range, parse_range_header, get_audio_cache
+from threading_utils import yandex_link_flight
+from wave_buffer import WaveBuffer
+from lru_set import LRUSet
+from http_pool import http_pool
+import json_codec
 
 YM_SETTINGS_FILE = None  # Будет установлен при инициализации
 YM_CLIENT = None  # Глобальный клиент Яндекс.Музыки
 
+# Параллельная загрузка библиотеки: плейлисты и батчи треков в ограниченных пулах
+YM_PLAYLIST_WORKERS = 6
+YM_TRACK_BATCH_WORKERS = 4
+YM_PLAYLISTS_TIMEOUT = 90
+YM_BATCH_EXECUTOR = None
+YM_EXECUTOR_LOCK = threading.Lock()
+
+# Кэш метаданных треков для постраничной гидратации библиотеки
+YM_TRACK_META_CACHE = OrderedDict()
+YM_TRACK_META_CACHE_SIZE = 20000
+YM_TRACK_META_LOCK = threading.Lock()
+# Максимум треков за один запрос /api/yandex-music/tracks и страницу лайков
+YM_HYDRATE_PAGE_MAX = 500
+# Список ID лайков кэшируется ненадолго, чтобы страницы не запрашивали его заново
+YM_LIKED_IDS_TTL = 60
+YM_LIKED_IDS_CACHE = {'ids': None, 'time': 0}
+
+# Общий курсор и batchId ротора меняются и фоновым буфером волны, и запуском волны.
+# YM_ROTOR_LOCK - короткая блокировка полей сессии (держится без сетевых вызовов);
+# YM_ROTOR_REQUEST_LOCK выстраивает в очередь запросы к ротору, чтобы каждый
+# продолжал курсор предыдущего. Путь выдачи треков (/wave/next) ее не берет
+YM_ROTOR_LOCK = threading.RLock()
+YM_ROTOR_REQUEST_LOCK = threading.RLock()
+
+# Кэш прямых ссылок на аудио: ссылка, срок жизни и размер файла по треку.
+# Перемотка идет одним GET по сохраненной ссылке без tracks_download_info
+YM_DIRECT_LINK_TTL = 600
+YM_DIRECT_LINK_CACHE_SIZE = 500
+YM_DIRECT_LINK_CACHE = {}
+YM_DIRECT_LINK_LOCK = threading.Lock()
+# Статусы, при которых ссылка считается протухшей и запрашивается заново
+YM_EXPIRED_LINK_STATUSES = (401, 403, 404, 410)
+# Сохранять скачиваемые треки в дисковый аудиокэш
+YM_DOWNLOAD_USE_CACHE = True
+
 # Глобальные переменные для управления сессией роторы
 from collections import deque
 import time
 
+# Пределы истории волны: старые треки вытесняются, память не растет
+YM_USED_TRACKS_LIMIT = 5000
+YM_SEEN_CANDIDATES_LIMIT = 1200
+
 # Роторная сессия для волны (с настройками пользователя)
 YM_ROTOR_SESSION = {
     'session_id': None,
     'batch_id': None,
     'sequence_number': 0,
-    'used_track_ids': set(),  # Треки которые реально проигрывались
-    'seen_candidates': deque(maxlen=1200),  # LRU все треки из sequence (увеличено до 1200)
+    'used_track_ids': LRUSet(YM_USED_TRACKS_LIMIT),  # Треки которые реально проигрывались
+    'seen_candidates': LRUSet(YM_SEEN_CANDIDATES_LIMIT),  # LRU все треки из sequence
     'station_seed': None,
     'last_cursor': None,
     'last_feedback_time': 0,  # Время последнего успешного feedback
@@ -30,7 +78,10 @@ YM_ROTOR_SESSION = {
     'can_request_more': True,  # Можно ли запрашивать новые треки
     'consecutive_empty_requests': 0,  # Счетчик пустых запросов подряд
     'last_unique_count_history': deque(maxlen=4),  # История количества уникальных треков за последние 4 запроса
-    'current_settings': {}  # Текущие настройки волны
+    'current_settings': {},  # Текущие настройки волны
+    'station_name': None,
+    'station_id': None,
+    'restored': False  # Сессия восстановлена с диска и еще не проверена запросом треков
 }
 
 # Отдельная роторная сессия для рекомендаций (всегда с дефолтными настройками)
@@ -41,8 +92,23 @@ YM_RECOMMENDATIONS_SESSION = {
     'station_seed': None,
     'last_cursor': None,
     'last_feedback_time': 0,
+    'station_name': None,
+    'station_id': None,
+    'restored': False
 }
 
+# Снимок роторных сессий на диске: после перезапуска волна продолжается
+# без rotor_stations_dashboard, session/new и radioStarted
+YM_ROTOR_STATE_FILE = None
+YM_ROTOR_STATE_VERSION = 1
+YM_ROTOR_STATE_MAX_AGE = 6 * 3600
+YM_ROTOR_STATE_SAVE_INTERVAL = 5
+YM_ROTOR_STATE_SAVE = {'last_save': 0, 'timer': None}
+YM_ROTOR_STATE_SAVE_LOCK = threading.Lock()
+YM_ROTOR_PERSISTED_FIELDS = ('session_id', 'batch_id', 'sequence_number', 'station_seed',
+                             'last_cursor', 'station_name', 'station_id')
+YM_WAVE_SETTINGS_KEYS = ('mood', 'character')
+
 def get_yandex_music_token(settings_file=None):
     """Получить токен Яндекс.Музыки из файла настроек"""
     try:
@@ -62,8 +128,7 @@ def save_yandex_music_token(token, settings_file=None):
         data = {'token': token}
         if settings_file:
             os.makedirs(os.path.dirname(settings_file), exist_ok=True)
-            with open(settings_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
+            json_codec.dump_file(data, settings_file)
         return True
     except Exception as e:
         print(f"[YM] Error saving token: {e}")
@@ -77,6 +142,7 @@ def initialize_yandex_client(token):
             return False
             
         YM_CLIENT = Client(token)
+        clear_yandex_library_caches()
         # Проверяем валидность токена
         YM_CLIENT.account_status()
         print("[YM] Client initialized successfully")
@@ -90,7 +156,8 @@ def initialize_yandex_client(token):
         YM_CLIENT = None
         return False
 
-def search_yandex_music(query, limit=20):
+@cached_search('yandex_music')
+def search_yandex_music(query, limit=20, timeout=None):
     """Поиск треков в Яндекс.Музыке"""
     if not YM_CLIENT:
         print("[YM] Client not initialized")
@@ -98,7 +165,7 @@ def search_yandex_music(query, limit=20):
     
     try:
         print(f"[YM] Searching: '{query}'")
-        search_result = YM_CLIENT.search(query, type_='track')
+        search_result = YM_CLIENT.search(query, type_='track', **({'timeout': timeout} if timeout else {}))
         
         if not search_result or not search_result.tracks:
             print("[YM] No tracks found")
@@ -178,11 +245,82 @@ def format_yandex_track(track):
         print(f"[YM] Track object attributes: {dir(track)}")
         return None
 
-def get_yandex_track_download_info(track_id):
-    """Получить информацию для загрузки трека"""
+def get_yandex_track_download_info(track_id, force_refresh=False):
+    """Информация для загрузки трека из кэша прямых ссылок.
+
+    Одновременные запросы одного трека ждут одно общее разрешение ссылки.
+    """
     if not YM_CLIENT:
         return None
     
+    if not force_refresh:
+        with YM_DIRECT_LINK_LOCK:
+            cached = YM_DIRECT_LINK_CACHE.get(track_id)
+            if cached and cached['expires_at'] > time.time():
+                return dict(cached)
+    
+    download_info = yandex_link_flight.do(track_id, _resolve_yandex_download_info, track_id)
+    if not download_info:
+        return None
+    
+    with YM_DIRECT_LINK_LOCK:
+        previous = YM_DIRECT_LINK_CACHE.get(track_id)
+        if previous and previous.get('size') and not download_info.get('size'):
+            download_info['size'] = previous['size']
+        download_info['expires_at'] = time.time() + YM_DIRECT_LINK_TTL
+        YM_DIRECT_LINK_CACHE[track_id] = download_info
+        
+        if len(YM_DIRECT_LINK_CACHE) > YM_DIRECT_LINK_CACHE_SIZE:
+            now = time.time()
+            for key in [k for k, v in YM_DIRECT_LINK_CACHE.items() if v['expires_at'] <= now]:
+                del YM_DIRECT_LINK_CACHE[key]
+            while len(YM_DIRECT_LINK_CACHE) > YM_DIRECT_LINK_CACHE_SIZE:
+                oldest = min(YM_DIRECT_LINK_CACHE, key=lambda k: YM_DIRECT_LINK_CACHE[k]['expires_at'])
+                del YM_DIRECT_LINK_CACHE[oldest]
+        return dict(download_info)
+
+def invalidate_yandex_direct_link(track_id):
+    with YM_DIRECT_LINK_LOCK:
+        YM_DIRECT_LINK_CACHE.pop(track_id, None)
+
+def remember_yandex_content_length(track_id, upstream):
+    """Запомнить полный размер файла из ответа апстрима"""
+    size = None
+    if upstream.status_code == 206:
+        content_range = parse_content_range(upstream.headers.get('Content-Range'))
+        if content_range:
+            size = content_range[2]
+    elif upstream.status_code == 200 and upstream.headers.get('Content-Length'):
+        size = int(upstream.headers['Content-Length'])
+    
+    if size:
+        with YM_DIRECT_LINK_LOCK:
+            cached = YM_DIRECT_LINK_CACHE.get(track_id)
+            if cached:
+                cached['size'] = size
+
+def open_yandex_upstream(track_id, range_value=None):
+    """GET по прямой ссылке; протухшая ссылка один раз разрешается заново"""
+    headers = {'Range': range_value} if range_value else {}
+    
+    for attempt in range(2):
+        download_info = get_yandex_track_download_info(track_id, force_refresh=attempt > 0)
+        if not download_info:
+            return None
+        
+        upstream = http_pool.get(download_info['direct_link'], headers=headers, stream=True)
+        if upstream.status_code in YM_EXPIRED_LINK_STATUSES and attempt == 0:
+            print(f"[YM] Direct link for {track_id} rejected ({upstream.status_code}), resolving again")
+            upstream.close()
+            invalidate_yandex_direct_link(track_id)
+            continue
+        
+        remember_yandex_content_length(track_id, upstream)
+        return upstream
+    return None
+
+def _resolve_yandex_download_info(track_id):
+    """Получить информацию для загрузки трека"""
     try:
         # Разбираем ID трека
         if ':' in track_id:
@@ -220,129 +358,329 @@ def get_yandex_track_download_info(track_id):
         print(f"[YM] Error getting download info: {e}")
         return None
 
+def get_yandex_track_size(track_id):
+    """Полный размер файла трека: из аудиокэша или из кэша прямых ссылок.
+
+    К апстриму обращаемся только если размер еще ни разу не был виден.
+    """
+    cache = get_audio_cache()
+    entry = cache.lookup(f"yandex:{track_id}") if cache else None
+    if entry:
+        return entry['total']
+    
+    download_info = get_yandex_track_download_info(track_id)
+    if not download_info:
+        return None
+    if download_info.get('size'):
+        return download_info['size']
+    
+    upstream = open_yandex_upstream(track_id, 'bytes=0-0')
+    if upstream is None:
+        return None
+    upstream.close()
+    with YM_DIRECT_LINK_LOCK:
+        cached = YM_DIRECT_LINK_CACHE.get(track_id)
+        return cached.get('size') if cached else None
+
+def head_yandex_track(track_id, range_header=None):
+    """Ответ на HEAD: размер и Content-Range без скачивания тела"""
+    total = get_yandex_track_size(track_id)
+    if not total:
+        return jsonify({"error": "Track not found or unavailable"}), 404
+    
+    response = Response(status=200, mimetype='audio/mpeg')
+    requested = parse_range_header(range_header)
+    if requested:
+        start, end = requested
+        if start >= total:
+            return Response(status=416, headers={'Content-Range': f'bytes */{total}'})
+        end = total - 1 if end is None else min(end, total - 1)
+        response.status_code = 206
+        response.headers['Content-Range'] = f'bytes {start}-{end}/{total}'
+        response.headers['Content-Length'] = str(end - start + 1)
+    else:
+        response.headers['Content-Length'] = str(total)
+    response.headers['Accept-Ranges'] = 'bytes'
+    response.headers['Cache-Control'] = 'public, max-age=3600'
+    return response
+
 def stream_yandex_track(track_id):
     """Стримить трек Яндекс.Музыки"""
     try:
-        download_info = get_yandex_track_download_info(track_id)
-        if not download_info:
-            return jsonify({"error": "Track not found or unavailable"}), 404
-        
-        direct_link = download_info['direct_link']
-        
-        # Получаем информацию о Range запросе
         from flask import request
-        range_header = request.headers.get('Range')
-        
-        if range_header:
-            # Обработка Range запросов для поддержки перемотки
-            try:
-                # Сначала получаем размер файла
-                head_response = requests.head(direct_link, allow_redirects=True)
-                print(f"[YM] Stream response ready: {head_response.status_code}")
-                
-                if head_response.status_code == 200:
-                    content_length = int(head_response.headers.get('Content-Length', 0))
-                    print(f"[YM] Stream size: {content_length/1024/1024:.1f}MB")
-                else:
-                    print(f"[YM] Stream request failed: {head_response.status_code}")
-                    raise Exception("HEAD request failed")
-                
-                # Парсим Range заголовок
-                byte_start = 0
-                byte_end = content_length - 1
-                
-                range_match = range_header.replace('bytes=', '').split('-')
-                if range_match[0]:
-                    byte_start = int(range_match[0])
-                if range_match[1]:
-                    byte_end = int(range_match[1])
-                
-                # Запрашиваем нужную часть файла
-                headers = {'Range': f'bytes={byte_start}-{byte_end}'}
-                response = requests.get(direct_link, headers=headers, stream=True)
-                
-                def generate():
-                    try:
-                        for chunk in response.iter_content(chunk_size=8192):
-                            if chunk:
-                                yield chunk
-                    except (requests.exceptions.ChunkedEncodingError, requests.exceptions.ConnectionError, Exception) as e:
-                        print(f"[YM] Stream error for track {track_id}: {e}")
-                        # Не прерываем стриминг, просто логируем ошибку
-                        return
-                
-                response_headers = {
-                    'Content-Type': 'audio/mpeg',
-                    'Accept-Ranges': 'bytes',
-                    'Content-Length': str(byte_end - byte_start + 1),
-                    'Content-Range': f'bytes {byte_start}-{byte_end}/{content_length}',
-                    'Cache-Control': 'public, max-age=3600'
-                }
-                
-                return Response(generate(), status=206, headers=response_headers)
-            except Exception as e:
-                print(f"[YM] Range request error: {e}")
         
-        # Обычный запрос без Range
-        def generate():
-            try:
-                response = requests.get(direct_link, stream=True)
-                response.raise_for_status()
-                
-                for chunk in response.iter_content(chunk_size=8192):
-                    if chunk:
-                        yield chunk
-            except (requests.exceptions.ChunkedEncodingError, requests.exceptions.ConnectionError, Exception) as e:
-                print(f"[YM] Streaming error for track {track_id}: {e}")
-                # Не прерываем стриминг, просто логируем ошибку
-                return
-        
-        return Response(
-            generate(),
-            mimetype='audio/mpeg',
-            headers={
-                'Content-Type': 'audio/mpeg',
-                'Accept-Ranges': 'bytes',
-                'Cache-Control': 'public, max-age=3600'
-            }
+        if request.method == 'HEAD':
+            return head_yandex_track(track_id, request.headers.get('Range'))
+        
+        # Скачанные ранее участки отдаются с диска; размер файла берется из
+        # Content-Range апстрима или из кэша, поэтому HEAD-запрос не нужен.
+        # Прямая ссылка берется из кэша, так что перемотка - один GET
+        response = serve_audio(
+            f"yandex:{track_id}",
+            request.headers.get('Range'),
+            lambda range_value: open_yandex_upstream(track_id, range_value),
+            'audio/mpeg',
+            tag="YM",
+            missing_error=("Track not found or unavailable", 404)
         )
+        if isinstance(response, tuple):
+            return response
+        
+        response.headers['Cache-Control'] = 'public, max-age=3600'
+        return response
         
     except Exception as e:
         print(f"[YM] Error streaming track: {e}")
         return jsonify({"error": str(e)}), 500
 
-def download_yandex_track(track_id, filename=None):
-    """Скачать трек Яндекс.Музыки"""
+def _attachment_disposition(filename):
+    """Content-Disposition для имени файла с кириллицей (RFC 5987)"""
+    filename = re.sub(r'[\r\n"\\]', '_', filename)
+    try:
+        filename.encode('latin-1')
+        return f'attachment; filename="{filename}"'
+    except UnicodeEncodeError:
+        fallback = filename.encode('ascii', 'ignore').decode('ascii').strip() or 'track.mp3'
+        return f"attachment; filename=\"{fallback}\"; filename*=UTF-8''{urllib.parse.quote(filename)}"
+
+def download_yandex_track(track_id, filename=None, use_cache=YM_DOWNLOAD_USE_CACHE):
+    """Скачать трек Яндекс.Музыки.
+
+    Байты апстрима сразу уходят клиенту (память не растет с размером файла)
+    и параллельно пишутся в дисковый аудиокэш; уже скачанный трек отдается с диска.
+    """
     try:
-        download_info = get_yandex_track_download_info(track_id)
-        if not download_info:
-            return jsonify({"error": "Track not found or unavailable"}), 404
-        
-        direct_link = download_info['direct_link']
-        
         # Если имя файла не указано, генерируем его
         if not filename:
             filename = f"yandex_music_{track_id}.mp3"
         
-        # Скачиваем файл во временную директорию
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.mp3') as temp_file:
-            response = requests.get(direct_link)
-            response.raise_for_status()
-            
-            temp_file.write(response.content)
-            temp_file_path = temp_file.name
-        
-        return send_file(
-            temp_file_path,
-            as_attachment=True,
-            download_name=filename,
-            mimetype='audio/mpeg'
+        response = serve_audio(
+            f"yandex:{track_id}",
+            None,
+            lambda range_value: open_yandex_upstream(track_id, range_value),
+            'audio/mpeg',
+            tag="YM",
+            missing_error=("Track not found or unavailable", 404),
+            use_cache=use_cache
         )
+        if isinstance(response, tuple):
+            return response
+        
+        response.headers['Content-Disposition'] = _attachment_disposition(filename)
+        return response
         
     except Exception as e:
         print(f"[YM] Error downloading track: {e}")
         return jsonify({"error": str(e)}), 500
 
+def _rotor_token_fingerprint():
+    """Отпечаток токена: снимок сессии действителен только для того же аккаунта"""
+    token = getattr(YM_CLIENT, 'token', None)
+    if not token:
+        return None
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()[:16]
+
+def _rotor_session_snapshot(session):
+    return {field: session.get(field) for field in YM_ROTOR_PERSISTED_FIELDS}
+
+def save_rotor_state(force=False):
+    """Сохранить роторные сессии на диск (не чаще YM_ROTOR_STATE_SAVE_INTERVAL)"""
+    if not YM_ROTOR_STATE_FILE or not YM_CLIENT:
+        return False
+    
+    # Проверка частоты не трогает YM_ROTOR_LOCK: выдача треков не ждет сессию
+    with YM_ROTOR_STATE_SAVE_LOCK:
+        delay = YM_ROTOR_STATE_SAVE['last_save'] + YM_ROTOR_STATE_SAVE_INTERVAL - time.time()
+        if not force and delay > 0:
+            # Изменения пишутся одним отложенным сохранением
+            if YM_ROTOR_STATE_SAVE['timer'] is None:
+                timer = threading.Timer(delay, save_rotor_state, kwargs={'force': True})
+                timer.daemon = True
+                YM_ROTOR_STATE_SAVE['timer'] = timer
+                timer.start()
+            return False
+        
+        timer = YM_ROTOR_STATE_SAVE['timer']
+        if timer is not None:
+            timer.cancel()
+            YM_ROTOR_STATE_SAVE['timer'] = None
+        YM_ROTOR_STATE_SAVE['last_save'] = time.time()
+    
+    with YM_ROTOR_LOCK:
+        state = {
+            'version': YM_ROTOR_STATE_VERSION,
+            'saved_at': time.time(),
+            'account': _rotor_token_fingerprint(),
+            'wave': None,
+            'recommendations': None
+        }
+        if YM_ROTOR_SESSION['session_id']:
+            state['wave'] = {
+                **_rotor_session_snapshot(YM_ROTOR_SESSION),
+                'current_settings': dict(YM_ROTOR_SESSION['current_settings'] or {}),
+                'used_track_ids': list(YM_ROTOR_SESSION['used_track_ids']),
+                'seen_candidates': list(YM_ROTOR_SESSION['seen_candidates'])
+            }
+        if YM_RECOMMENDATIONS_SESSION['session_id']:
+            state['recommendations'] = _rotor_session_snapshot(YM_RECOMMENDATIONS_SESSION)
+    
+    try:
+        json_codec.dump_file(state, YM_ROTOR_STATE_FILE)
+        return True
+    except Exception as e:
+        print(f"[YM] Error saving rotor state: {e}")
+        return False
+
+def _valid_rotor_session(data):
+    """Проверка типов полей сохраненной сессии"""
+    if not isinstance(data, dict):
+        return False
+    if not isinstance(data.get('session_id'), str) or not data['session_id']:
+        return False
+    if not isinstance(data.get('station_seed'), str) or ':' not in data['station_seed']:
+        return False
+    if not isinstance(data.get('sequence_number'), int) or data['sequence_number'] < 0:
+        return False
+    for field in ('batch_id', 'last_cursor', 'station_name', 'station_id'):
+        if data.get(field) is not None and not isinstance(data[field], str):
+            return False
+    return True
+
+def _valid_track_id_list(value):
+    return isinstance(value, list) and all(isinstance(item, str) for item in value)
+
+def restore_rotor_state():
+    """Восстановить роторные сессии после перезапуска; снимок с ошибками отбрасывается"""
+    if not YM_ROTOR_STATE_FILE or not os.path.exists(YM_ROTOR_STATE_FILE):
+        return False
+    
+    try:
+        state = json_codec.load_file(YM_ROTOR_STATE_FILE)
+    except Exception as e:
+        print(f"[YM] Error reading rotor state: {e}")
+        clear_rotor_state()
+        return False
+    
+    reason = None
+    if not isinstance(state, dict) or state.get('version') != YM_ROTOR_STATE_VERSION:
+        reason = "unsupported version"
+    elif state.get('account') != _rotor_token_fingerprint():
+        reason = "different account"
+    elif not isinstance(state.get('saved_at'), (int, float)) or not 0 <= time.time() - state['saved_at'] <= YM_ROTOR_STATE_MAX_AGE:
+        reason = "too old"
+    if reason:
+        print(f"[YM] Discarding saved rotor state: {reason}")
+        clear_rotor_state()
+        return False
+    
+    restored = []
+    with YM_ROTOR_LOCK:
+        wave = state.get('wave')
+        if (_valid_rotor_session(wave)
+                and isinstance(wave.get('current_settings'), dict)
+                and set(wave['current_settings']) <= set(YM_WAVE_SETTINGS_KEYS)
+                and _valid_track_id_list(wave.get('used_track_ids'))
+                and _valid_track_id_list(wave.get('seen_candidates'))):
+            YM_ROTOR_SESSION.update({field: wave.get(field) for field in YM_ROTOR_PERSISTED_FIELDS})
+            YM_ROTOR_SESSION['current_settings'] = wave['current_settings']
+            YM_ROTOR_SESSION['used_track_ids'].clear()
+            YM_ROTOR_SESSION['used_track_ids'].update(wave['used_track_ids'])
+            YM_ROTOR_SESSION['seen_candidates'].clear()
+            YM_ROTOR_SESSION['seen_candidates'].update(wave['seen_candidates'])
+            YM_ROTOR_SESSION['restored'] = True
+            restored.append('wave')
+        elif wave is not None:
+            print("[YM] Saved wave session is invalid, ignoring")
+        
+        recommendations = state.get('recommendations')
+        if _valid_rotor_session(recommendations):
+            YM_RECOMMENDATIONS_SESSION.update({field: recommendations.get(field) for field in YM_ROTOR_PERSISTED_FIELDS})
+            YM_RECOMMENDATIONS_SESSION['restored'] = True
+            restored.append('recommendations')
+        elif recommendations is not None:
+            print("[YM] Saved recommendations session is invalid, ignoring")
+    
+    if restored:
+        print(f"[YM] Restored rotor sessions: {', '.join(restored)} "
+              f"(used_tracks={len(YM_ROTOR_SESSION['used_track_ids'])}, seen_candidates={len(YM_ROTOR_SESSION['seen_candidates'])})")
+    return bool(restored)
+
+def clear_rotor_state():
+    try:
+        if YM_ROTOR_STATE_FILE and os.path.exists(YM_ROTOR_STATE_FILE):
+            os.remove(YM_ROTOR_STATE_FILE)
+    except Exception as e:
+        print(f"[YM] Error removing rotor state: {e}")
+
+def reset_rotor_sessions():
+    """Забыть обе роторные сессии и историю волны"""
+    with YM_ROTOR_LOCK:
+        for session in (YM_ROTOR_SESSION, YM_RECOMMENDATIONS_SESSION):
+            session.update({field: None for field in YM_ROTOR_PERSISTED_FIELDS})
+            session['sequence_number'] = 0
+            session['restored'] = False
+        YM_ROTOR_SESSION['current_settings'] = {}
+        YM_ROTOR_SESSION['used_track_ids'].clear()
+        YM_ROTOR_SESSION['seen_candidates'].clear()
+    YM_WAVE_BUFFER.clear()
+
+def find_personal_station():
+    """Найти персональную станцию (Моя волна) через rotor_stations_dashboard"""
+    # Получаем список станций
+    rotor = YM_CLIENT.rotor_stations_dashboard()
+    personal_station = None
+    
+    print(f"[YM] Found {len(rotor.stations)} stations")
+    
+    # Ищем персональную станцию (Моя волна)
+    for station in rotor.stations:
+        if hasattr(station, 'station') and station.station:
+            station_obj = station.station
+    
+            if hasattr(station_obj, 'id') and station_obj.id:
+                station_id = station_obj.id
+    
+                # Проверяем разные варианты персональной станции
+                if (hasattr(station_id, 'type') and 
+                    (station_id.type == 'personal' or 
+                     station_id.type == 'user' or
+                     (hasattr(station_id, 'tag') and 'personal' in str(station_id.tag).lower()))):
+                    personal_station = station_obj
+                    print(f"[YM] Found personal station: {station_obj.name}")
+                    break
+    
+    # Если не нашли по типу, попробуем найти по названию
+    if not personal_station:
+        print("[YM] Trying to find station by name...")
+        for station in rotor.stations:
+            if hasattr(station, 'station') and station.station:
+                station_obj = station.station
+                station_name = getattr(station_obj, 'name', '').lower()
+                if 'волна' in station_name or 'personal' in station_name or 'моя' in station_name:
+                    personal_station = station_obj
+                    print(f"[YM] Found personal station by name: {station_obj.name}")
+                    break
+    
+    if not personal_station:
+        return None
+    
+    station_id = personal_station.id
+    return {
+        'seed': f"{station_id.type}:{station_id.tag}",
+        'name': personal_station.name,
+        'id': str(personal_station.id)
+    }
+
+def known_station(session):
+    """Станция из активной сессии; None, если ее нужно искать заново"""
+    if session['session_id'] and session.get('station_seed') and session.get('station_name'):
+        return {
+            'seed': session['station_seed'],
+            'name': session['station_name'],
+            'id': session.get('station_id') or session['station_seed']
+        }
+    return None
+
 def create_rotor_session(seed, reset_used_tracks=False, settings=None):
     """Использовать существующую сессию или создать новую только если ее нет"""
     global YM_ROTOR_SESSION
@@ -358,19 +696,13 @@ def create_rotor_session(seed, reset_used_tracks=False, settings=None):
         YM_ROTOR_SESSION['batch_id'] = None
         YM_ROTOR_SESSION['last_cursor'] = None
         # Частично очищаем seen_candidates (оставляем последние 200)
-        if len(YM_ROTOR_SESSION['seen_candidates']) > 200:
-            recent_candidates = list(YM_ROTOR_SESSION['seen_candidates'])[-200:]
-            YM_ROTOR_SESSION['seen_candidates'].clear()
-            YM_ROTOR_SESSION['seen_candidates'].extend(recent_candidates)
+        if YM_ROTOR_SESSION['seen_candidates'].trim(200):
             print("[YM] Partially cleared seen_candidates due to settings change")
     
     # НЕ очищаем used_tracks между запросами в одной сессии для лучшего разнообразия
     # Только при явном перезапуске сессии очищаем seen_candidates частично (оставляем последние 400)
-    if reset_used_tracks and len(YM_ROTOR_SESSION['seen_candidates']) > 400:
+    if reset_used_tracks and YM_ROTOR_SESSION['seen_candidates'].trim(400):
         # Оставляем только последние 400 треков из seen_candidates
-        recent_candidates = list(YM_ROTOR_SESSION['seen_candidates'])[-400:]
-        YM_ROTOR_SESSION['seen_candidates'].clear()
-        YM_ROTOR_SESSION['seen_candidates'].extend(recent_candidates)
         print("[YM] Partially cleared seen_candidates, kept last 400 entries")
     
     # Если уже есть активная сессия и настройки не изменились - используем её
@@ -382,8 +714,6 @@ def create_rotor_session(seed, reset_used_tracks=False, settings=None):
         return True
     
     try:
-        import requests
-        
         # Получаем токен из клиента
         token = YM_CLIENT.token
         base_url = "https://api.music.yandex.net"
@@ -439,7 +769,7 @@ def create_rotor_session(seed, reset_used_tracks=False, settings=None):
         }
         
         print(f"[YM] Creating new rotor session with payload: {session_payload}")
-        session_response = requests.post(
+        session_response = http_pool.post(
             f'{base_url}/rotor/session/new',
             headers=headers,
             json=session_payload
@@ -469,16 +799,19 @@ def create_rotor_session(seed, reset_used_tracks=False, settings=None):
             return False
         
         # Сохраняем данные сессии
-        YM_ROTOR_SESSION.update({
-            'session_id': radio_session_id,
-            'batch_id': batch_id,
-            'sequence_number': 0,
-            'station_seed': seed,
-            'last_cursor': None,
-            'current_settings': settings or {}
-        })
+        with YM_ROTOR_LOCK:
+            YM_ROTOR_SESSION.update({
+                'session_id': radio_session_id,
+                'batch_id': batch_id,
+                'sequence_number': 0,
+                'station_seed': seed,
+                'last_cursor': None,
+                'current_settings': settings or {},
+                'restored': False
+            })
         
         print(f"[YM] New rotor session created: {radio_session_id}")
+        YM_WAVE_BUFFER.clear()
         
         # Отправляем feedback о начале радио
         send_rotor_feedback('radioStarted', batch_id=batch_id)
@@ -499,8 +832,6 @@ def create_recommendations_rotor_session(seed):
         return True
     
     try:
-        import requests
-        
         # Получаем токен из клиента
         token = YM_CLIENT.token
         base_url = "https://api.music.yandex.net"
@@ -523,7 +854,7 @@ def create_recommendations_rotor_session(seed):
         }
         
         print(f"[YM] Creating new recommendations rotor session with default settings")
-        session_response = requests.post(
+        session_response = http_pool.post(
             f'{base_url}/rotor/session/new',
             headers=headers,
             json=session_payload
@@ -558,7 +889,8 @@ def create_recommendations_rotor_session(seed):
             'batch_id': batch_id,
             'sequence_number': 0,
             'station_seed': seed,
-            'last_cursor': None
+            'last_cursor': None,
+            'restored': False
         })
         
         print(f"[YM] New recommendations rotor session created: {radio_session_id}")
@@ -574,7 +906,6 @@ def send_rotor_feedback(event_type, track_id=None, batch_id=None, played_seconds
         if not YM_ROTOR_SESSION['session_id']:
             return False
         
-        import requests
         from datetime import datetime
         
         token = YM_CLIENT.token
@@ -626,7 +957,7 @@ def send_rotor_feedback(event_type, track_id=None, batch_id=None, played_seconds
         elif YM_ROTOR_SESSION['batch_id']:
             feedback_data['batchId'] = YM_ROTOR_SESSION['batch_id']
         
-        feedback_response = requests.post(
+        feedback_response = http_pool.post(
             f'{base_url}/rotor/session/{YM_ROTOR_SESSION["session_id"]}/feedback',
             headers=headers,
             json=feedback_data
@@ -656,8 +987,6 @@ def get_next_rotor_tracks(count=5):
             print("[YM] No active rotor session")
             return []
         
-        import requests
-        
         token = YM_CLIENT.token
         base_url = "https://api.music.yandex.net"
         
@@ -683,7 +1012,7 @@ def get_next_rotor_tracks(count=5):
         else:
             print("[YM] No cursor (first batch)")
         
-        tracks_response = requests.post(
+        tracks_response = http_pool.post(
             f'{base_url}/rotor/session/{YM_ROTOR_SESSION["session_id"]}/tracks',
             headers=headers,
             json=request_data
@@ -697,22 +1026,23 @@ def get_next_rotor_tracks(count=5):
         result_data = tracks_data.get('result', tracks_data)
         sequence = result_data.get('sequence', [])
         
-        # ВСЕГДА сохраняем новый курсор если он есть
-        if 'cursor' in result_data:
-            YM_ROTOR_SESSION['last_cursor'] = result_data['cursor']
-            print(f"[YM] Got new cursor")
-        else:
-            print(f"[YM] No cursor in response")
-            # Проверяем pumpkin для альтернативного курсора
-            if 'pumpkin' in result_data and isinstance(result_data['pumpkin'], dict):
-                if 'cursor' in result_data['pumpkin']:
-                    YM_ROTOR_SESSION['last_cursor'] = result_data['pumpkin']['cursor']
-                    print(f"[YM] Found cursor in pumpkin")
-        
-        # Обновляем batchId если есть
-        if 'batchId' in result_data:
-            YM_ROTOR_SESSION['batch_id'] = result_data['batchId']
-            print(f"[YM] Got new batchId")
+        with YM_ROTOR_LOCK:
+            # ВСЕГДА сохраняем новый курсор если он есть
+            if 'cursor' in result_data:
+                YM_ROTOR_SESSION['last_cursor'] = result_data['cursor']
+                print(f"[YM] Got new cursor")
+            else:
+                print(f"[YM] No cursor in response")
+                # Проверяем pumpkin для альтернативного курсора
+                if 'pumpkin' in result_data and isinstance(result_data['pumpkin'], dict):
+                    if 'cursor' in result_data['pumpkin']:
+                        YM_ROTOR_SESSION['last_cursor'] = result_data['pumpkin']['cursor']
+                        print(f"[YM] Found cursor in pumpkin")
+            
+            # Обновляем batchId если есть
+            if 'batchId' in result_data:
+                YM_ROTOR_SESSION['batch_id'] = result_data['batchId']
+                print(f"[YM] Got new batchId")
         
         # Обрабатываем все треки но НЕ добавляем в seen_candidates автоматически
         all_tracks = []
@@ -732,7 +1062,9 @@ def get_next_rotor_tracks(count=5):
                 all_tracks.append(track)
         
         print(f"[YM] Rotor returned {len(all_tracks)} tracks from sequence")
-        YM_ROTOR_SESSION['sequence_number'] += 1
+        with YM_ROTOR_LOCK:
+            YM_ROTOR_SESSION['sequence_number'] += 1
+        save_rotor_state()
         
         # Если курсора нет, отправляем feedback чтобы "разбудить" роторную систему
         if not YM_ROTOR_SESSION['last_cursor'] and all_tracks:
@@ -747,6 +1079,158 @@ def get_next_rotor_tracks(count=5):
         print(f"[YM] Error getting next rotor tracks: {e}")
         return []
 
+def fetch_wave_tracks(count=5):
+    """Следующая порция треков волны: запрос к ротору, фильтрация повторов и гидратация.
+
+    Вызывается фоновым буфером волны (YM_WAVE_BUFFER), а не на пути запроса.
+    YM_ROTOR_LOCK берется только на чтение и изменение полей сессии, не на сеть.
+    """
+    if not YM_CLIENT or not YM_ROTOR_SESSION['session_id']:
+        return []
+    
+    # Если у нас нет курсора, добавляем небольшую задержку перед запросом
+    if not YM_ROTOR_SESSION['last_cursor']:
+        time.sleep(0.5)  # Пауза 0.5 сек если нет курсора
+
+    # Получаем следующие треки из роторной сессии (БЕЗ фильтрации дубликатов в get_next_rotor_tracks).
+    # Запросы к ротору идут по очереди: каждый продолжает курсор предыдущего
+    with YM_ROTOR_REQUEST_LOCK:
+        raw_tracks = get_next_rotor_tracks(count * 2)  # Запрашиваем больше треков для фильтрации
+    if not raw_tracks:
+        print(f"[YM] No more tracks available from rotor session")
+        return []
+
+    # Фильтруем дубликаты используя только used_track_ids (реально проигранные треки).
+    # В историю треки попадают при выдаче из буфера (mark_wave_tracks_served),
+    # поэтому сброшенные из буфера треки не считаются проигранными
+    unique_raw_tracks = []
+    picked_ids = set()
+    seen_candidates = YM_ROTOR_SESSION['seen_candidates']
+
+    for track in raw_tracks:
+        if hasattr(track, 'id'):
+            track_id = str(track.id)
+            # Приоритетная фильтрация: только по used_track_ids (реально проигранные)
+            if track_id not in YM_ROTOR_SESSION['used_track_ids'] and track_id not in picked_ids:
+                # Вторичная фильтрация: по seen_candidates только при переполнении
+                if len(seen_candidates) < 800 or track_id not in seen_candidates:
+                    unique_raw_tracks.append(track)
+                    picked_ids.add(track_id)
+                    if len(unique_raw_tracks) >= count:
+                        break  # Как только набрали нужное количество, останавливаемся
+                else:
+                    print(f"[YM] Filtered seen candidate track ID: {track_id}")
+            else:
+                print(f"[YM] Filtered duplicate track ID: {track_id}")
+
+    # Если после строгой фильтрации получили мало треков, ослабляем фильтр
+    if len(unique_raw_tracks) < count // 2:
+        print(f"[YM] Got only {len(unique_raw_tracks)} after strict filtering, relaxing filter...")
+        for track in raw_tracks:
+            if hasattr(track, 'id') and len(unique_raw_tracks) < count:
+                track_id = str(track.id)
+                # Ослабленная фильтрация: только по used_track_ids
+                if track_id not in YM_ROTOR_SESSION['used_track_ids']:
+                    if track_id not in picked_ids:
+                        unique_raw_tracks.append(track)
+                        picked_ids.add(track_id)
+
+    # Обновляем историю количества уникальных треков
+    with YM_ROTOR_LOCK:
+        unique_count = len(unique_raw_tracks)
+        YM_ROTOR_SESSION['last_unique_count_history'].append(unique_count)
+        print(f"[YM] Unique tracks history: {list(YM_ROTOR_SESSION['last_unique_count_history'])}")
+
+        if not unique_raw_tracks:
+            YM_ROTOR_SESSION['consecutive_empty_requests'] += 1
+            print(f"[YM] All tracks from rotor were duplicates (consecutive empty: {YM_ROTOR_SESSION['consecutive_empty_requests']})")
+            return []
+        else:
+            YM_ROTOR_SESSION['consecutive_empty_requests'] = 0
+
+    # Получаем полную информацию о уникальных треках
+    track_ids = []
+    for track in unique_raw_tracks:
+        try:
+            if hasattr(track, 'albums') and track.albums and len(track.albums) > 0:
+                first_album = track.albums[0]
+                if hasattr(first_album, 'id'):
+                    album_id = first_album.id
+                elif isinstance(first_album, dict) and 'id' in first_album:
+                    album_id = first_album['id']
+                else:
+                    album_id = str(first_album)
+                track_ids.append(f"{track.id}:{album_id}")
+            else:
+                track_ids.append(str(track.id))
+        except Exception:
+            track_ids.append(str(track.id))
+
+    # Получаем детальную информацию о треках
+    formatted_tracks = []
+    if track_ids:
+        tracks_info = YM_CLIENT.tracks(track_ids)
+    
+        for track in tracks_info:
+            if track:
+                # Получаем обложку
+                thumbnail = None
+                if track.cover_uri:
+                    thumbnail = f"https://{track.cover_uri.replace('%%', '400x400')}"
+                elif track.albums and track.albums[0].cover_uri:
+                    thumbnail = f"https://{track.albums[0].cover_uri.replace('%%', '400x400')}"
+            
+                # Формируем исполнителей
+                artists = [artist.name for artist in track.artists] if track.artists else []
+            
+                formatted_track = {
+                    "id": str(track.id),
+                    "title": track.title or "Unknown Title",
+                    "artist": ", ".join(artists) if artists else "Unknown Artist",
+                    "uploader": ", ".join(artists) if artists else "Unknown Artist",
+                    "duration": track.duration_ms // 1000 if track.duration_ms else 0,
+                    "thumbnail": thumbnail,
+                    "platform": "yandex_music",
+                    "url": f"yandex_music:{track.id}",
+                    "feedback": None
+                }
+            
+                formatted_tracks.append(formatted_track)
+
+    print(f"[YM] Successfully loaded {len(formatted_tracks)} unique new wave tracks using persistent session")
+
+    # Защита от застревания: проверяем историю уникальных треков
+    with YM_ROTOR_LOCK:
+        history = list(YM_ROTOR_SESSION['last_unique_count_history'])
+        if len(history) >= 4:
+            total_unique = sum(history)
+            print(f"[YM] Last 4 requests unique counts: {history}, total: {total_unique}")
+        
+            # Если за последние 4 запроса получили меньше 4 уникальных треков - жесткая проблема
+            if total_unique < 4:
+                print(f"[YM] CRITICAL: Very low unique track yield ({total_unique} in last 4 requests)")
+            
+                # Частично очищаем seen_candidates (оставляем только последние 200)
+                if YM_ROTOR_SESSION['seen_candidates'].trim(200):
+                    print(f"[YM] Emergency cleanup: kept only last {len(YM_ROTOR_SESSION['seen_candidates'])} seen_candidates")
+            
+                # Очищаем историю для нового начала
+                YM_ROTOR_SESSION['last_unique_count_history'].clear()
+
+    return formatted_tracks
+
+def mark_wave_tracks_served(tracks):
+    """Треки отданы клиенту: только теперь они попадают в историю волны"""
+    for track in tracks:
+        track_id = str(track.get('id'))
+        YM_ROTOR_SESSION['used_track_ids'].add(track_id)
+        # ДОБАВЛЯЕМ в seen_candidates только когда трек РЕАЛЬНО используется
+        YM_ROTOR_SESSION['seen_candidates'].add(track_id)
+    if tracks:
+        save_rotor_state()
+
+YM_WAVE_BUFFER = WaveBuffer(fetch_wave_tracks, on_take=mark_wave_tracks_served)
+
 def get_recommendations_tracks(count=10):
     """Получить треки для рекомендаций из отдельной роторной сессии"""
     try:
@@ -754,8 +1238,6 @@ def get_recommendations_tracks(count=10):
             print("[YM] No active recommendations rotor session")
             return []
         
-        import requests
-        
         token = YM_CLIENT.token
         base_url = "https://api.music.yandex.net"
         
@@ -781,7 +1263,7 @@ def get_recommendations_tracks(count=10):
         else:
             print("[YM] No recommendations cursor (first batch)")
         
-        tracks_response = requests.post(
+        tracks_response = http_pool.post(
             f'{base_url}/rotor/session/{YM_RECOMMENDATIONS_SESSION["session_id"]}/tracks',
             headers=headers,
             json=request_data
@@ -824,6 +1306,7 @@ def get_recommendations_tracks(count=10):
         
         print(f"[YM] Recommendations returned {len(all_tracks)} tracks from sequence")
         YM_RECOMMENDATIONS_SESSION['sequence_number'] += 1
+        save_rotor_state()
         
         return all_tracks[:count]
         
@@ -856,13 +1339,14 @@ def get_yandex_track_info(track_id):
 def setup_yandex_music_routes(app, settings_file):
     """Настроить маршруты для Яндекс.Музыки"""
     print("[YM] Setting up Yandex Music routes...")
-    global YM_SETTINGS_FILE
+    global YM_SETTINGS_FILE, YM_ROTOR_STATE_FILE
     YM_SETTINGS_FILE = settings_file
+    YM_ROTOR_STATE_FILE = os.path.join(os.path.dirname(settings_file), "yandex_rotor_state.json")
     
     # Попытка автоматической инициализации клиента при запуске
     token = get_yandex_music_token(settings_file)
-    if token:
-        initialize_yandex_client(token)
+    if token and initialize_yandex_client(token):
+        restore_rotor_state()
     
     @app.route('/api/yandex-music/auth-status', methods=['GET'])
     def yandex_auth_status():
@@ -958,6 +1442,10 @@ def setup_yandex_music_routes(app, settings_file):
             if os.path.exists(YM_SETTINGS_FILE):
                 os.remove(YM_SETTINGS_FILE)
             
+            # Сессии ротора привязаны к аккаунту
+            reset_rotor_sessions()
+            clear_rotor_state()
+            
             return jsonify({
                 "success": True,
                 "message": "Logged out successfully"
@@ -977,7 +1465,7 @@ def setup_yandex_music_routes(app, settings_file):
         results = search_yandex_music(query)
         return jsonify(results)
     
-    @app.route('/api/yandex-music/stream', methods=['GET'])
+    @app.route('/api/yandex-music/stream', methods=['GET', 'HEAD'])
     def yandex_stream():
         track_id = request.args.get('id', '').strip()
         if not track_id:
@@ -992,7 +1480,8 @@ def setup_yandex_music_routes(app, settings_file):
             return jsonify({"error": "Track ID is required"}), 400
         
         filename = request.args.get('filename')
-        return download_yandex_track(track_id, filename)
+        use_cache = request.args.get('cache', '1').lower() not in ('0', 'false', 'no')
+        return download_yandex_track(track_id, filename, use_cache=use_cache)
     
     @app.route('/api/yandex-music/track-info', methods=['GET'])
     def yandex_track_info():
@@ -1012,8 +1501,10 @@ def setup_yandex_music_routes(app, settings_file):
             if not YM_CLIENT:
                 return jsonify({"error": "Not authenticated"}), 401
             
-            playlists = get_yandex_playlists()
-            return jsonify(playlists)
+            # hydrate=0: быстрые заголовки с track_ids, треки догружаются через /tracks
+            hydrate = request.args.get('hydrate', '1').lower() not in ('0', 'false', 'no')
+            playlists = get_yandex_playlists(hydrate=hydrate)
+            return json_codec.json_response(playlists)
             
         except Exception as e:
             print(f"[YM] Error in playlists endpoint: {e}")
@@ -1025,13 +1516,64 @@ def setup_yandex_music_routes(app, settings_file):
             if not YM_CLIENT:
                 return jsonify({"error": "Not authenticated"}), 401
             
+            # ids_only=1 - только список ID; limit/offset - страница с метаданными
+            if request.args.get('ids_only', '').lower() in ('1', 'true', 'yes'):
+                track_ids = get_yandex_liked_track_ids()
+                return json_codec.json_response({"track_ids": track_ids, "total": len(track_ids)})
+            
+            if 'limit' in request.args or 'offset' in request.args:
+                try:
+                    limit = min(int(request.args.get('limit', 100)), YM_HYDRATE_PAGE_MAX)
+                    offset = int(request.args.get('offset', 0))
+                except ValueError:
+                    return jsonify({"error": "Invalid limit or offset"}), 400
+                if limit <= 0 or offset < 0:
+                    return jsonify({"error": "Invalid limit or offset"}), 400
+                
+                track_ids = get_yandex_liked_track_ids()
+                page_ids = track_ids[offset:offset + limit]
+                next_offset = offset + limit if offset + limit < len(track_ids) else None
+                return jsonify({
+                    "tracks": hydrate_yandex_tracks(page_ids),
+                    "total": len(track_ids),
+                    "offset": offset,
+                    "next_offset": next_offset
+                })
+            
             tracks = get_yandex_liked_tracks()
-            return jsonify(tracks)
+            return json_codec.json_response(tracks)
             
         except Exception as e:
             print(f"[YM] Error in liked tracks endpoint: {e}")
             return jsonify({"error": str(e)}), 500
     
+    @app.route('/api/yandex-music/tracks', methods=['GET', 'POST'])
+    def yandex_tracks_metadata():
+        """Метаданные треков по списку ID (ленивая догрузка библиотеки)"""
+        try:
+            if not YM_CLIENT:
+                return jsonify({"error": "Not authenticated"}), 401
+            
+            if request.method == 'POST':
+                data = request.get_json(silent=True) or {}
+                track_ids = [str(track_id) for track_id in data.get('ids', [])]
+            else:
+                track_ids = [track_id for track_id in request.args.get('ids', '').split(',') if track_id]
+            
+            if not track_ids:
+                return jsonify({"error": "Track IDs are required"}), 400
+            if len(track_ids) > YM_HYDRATE_PAGE_MAX:
+                return jsonify({"error": f"Too many track IDs (max {YM_HYDRATE_PAGE_MAX})"}), 400
+            
+            tracks = hydrate_yandex_tracks(track_ids)
+            loaded = {_base_track_id(track['id']) for track in tracks}
+            missing = [track_id for track_id in track_ids if _base_track_id(track_id) not in loaded]
+            return jsonify({"tracks": tracks, "missing": missing})
+            
+        except Exception as e:
+            print(f"[YM] Error in tracks endpoint: {e}")
+            return jsonify({"error": str(e)}), 500
+    
     # Роут для очистки истории волны
     @app.route('/api/yandex-music/wave/clear-history', methods=['POST'])
     def clear_wave_history():
@@ -1041,6 +1583,7 @@ def setup_yandex_music_routes(app, settings_file):
             YM_ROTOR_SESSION['seen_candidates'].clear()
             YM_ROTOR_SESSION['last_unique_count_history'].clear()
             YM_ROTOR_SESSION['consecutive_empty_requests'] = 0
+            save_rotor_state(force=True)
             
             print(f"[YM] Wave history cleared: used_tracks={len(YM_ROTOR_SESSION['used_track_ids'])}, seen_candidates={len(YM_ROTOR_SESSION['seen_candidates'])}")
             
@@ -1077,81 +1620,63 @@ def setup_yandex_music_routes(app, settings_file):
             
             print(f"[YM] Starting wave with settings: {settings}")
             
-            # Получаем список станций
-            rotor = YM_CLIENT.rotor_stations_dashboard()
-            personal_station = None
-            
-            print(f"[YM] Found {len(rotor.stations)} stations")
-            
-            # Ищем персональную станцию (Моя волна)
-            for station in rotor.stations:
-                if hasattr(station, 'station') and station.station:
-                    station_obj = station.station
-                    
-                    if hasattr(station_obj, 'id') and station_obj.id:
-                        station_id = station_obj.id
-                        
-                        # Проверяем разные варианты персональной станции
-                        if (hasattr(station_id, 'type') and 
-                            (station_id.type == 'personal' or 
-                             station_id.type == 'user' or
-                             (hasattr(station_id, 'tag') and 'personal' in str(station_id.tag).lower()))):
-                            personal_station = station_obj
-                            print(f"[YM] Found personal station: {station_obj.name}")
-                            break
-            
-            # Если не нашли по типу, попробуем найти по названию
-            if not personal_station:
-                print("[YM] Trying to find station by name...")
-                for station in rotor.stations:
-                    if hasattr(station, 'station') and station.station:
-                        station_obj = station.station
-                        station_name = getattr(station_obj, 'name', '').lower()
-                        if 'волна' in station_name or 'personal' in station_name or 'моя' in station_name:
-                            personal_station = station_obj
-                            print(f"[YM] Found personal station by name: {station_obj.name}")
-                            break
-            
-            if not personal_station:
+            # Станция известна по текущей (или восстановленной с диска) сессии - dashboard не нужен
+            station = known_station(YM_ROTOR_SESSION) or find_personal_station()
+            if not station:
                 return jsonify({
                     "success": False,
                     "error": "Персональная станция (Моя волна) не найдена"
                 }), 404
             
-            # Создаем seed для станции
-            station_id = personal_station.id
-            seed = f"{station_id.type}:{station_id.tag}"
+            seed = station['seed']
             print(f"[YM] Using seed: {seed}")
             
-            # Создаем или используем существующую роторную сессию
-            # НИКОГДА не сбрасываем used_tracks, только создаем сессию если ее еще нет
-            if not create_rotor_session(seed, reset_used_tracks=False, settings=settings):
-                return jsonify({
-                    "success": False,
-                    "error": "Не удалось создать роторную сессию"
-                }), 500
+            with YM_ROTOR_REQUEST_LOCK:
+                # Треки, подготовленные буфером до перезапуска, сбрасываем:
+                # волна продолжается с треков, полученных здесь
+                YM_WAVE_BUFFER.clear()
+                
+                # Создаем или используем существующую роторную сессию
+                # НИКОГДА не сбрасываем used_tracks, только создаем сессию если ее еще нет
+                if not create_rotor_session(seed, reset_used_tracks=False, settings=settings):
+                    return jsonify({
+                        "success": False,
+                        "error": "Не удалось создать роторную сессию"
+                    }), 500
+                with YM_ROTOR_LOCK:
+                    YM_ROTOR_SESSION['station_name'] = station['name']
+                    YM_ROTOR_SESSION['station_id'] = station['id']
             
-            # Получаем первые треки из сессии
-            raw_tracks = get_next_rotor_tracks(count=10)
-            if not raw_tracks:
-                print("[YM] Wave start failed - no tracks from rotor session")
-                return jsonify({
-                    "success": False,
-                    "error": "Не удалось получить треки из волны"
-                }), 500
+                # Получаем первые треки из сессии
+                raw_tracks = get_next_rotor_tracks(count=10)
+                if not raw_tracks and YM_ROTOR_SESSION['restored']:
+                    # Восстановленная сессия могла истечь на сервере - создаем новую
+                    print("[YM] Restored rotor session returned no tracks, creating a new one")
+                    YM_ROTOR_SESSION['session_id'] = None
+                    if create_rotor_session(seed, reset_used_tracks=False, settings=settings):
+                        raw_tracks = get_next_rotor_tracks(count=10)
+                YM_ROTOR_SESSION['restored'] = False
+                save_rotor_state()
+                if not raw_tracks:
+                    print("[YM] Wave start failed - no tracks from rotor session")
+                    return jsonify({
+                        "success": False,
+                        "error": "Не удалось получить треки из волны"
+                    }), 500
 
-            # Фильтруем дубликаты и добавляем в глобальный список
-            unique_raw_tracks = []
-            for track in raw_tracks:
-                if hasattr(track, 'id'):
-                    track_id = str(track.id)
-                    if track_id not in YM_ROTOR_SESSION['used_track_ids']:
-                        unique_raw_tracks.append(track)
-                        YM_ROTOR_SESSION['used_track_ids'].add(track_id)
-                        # ДОБАВЛЯЕМ в seen_candidates только когда трек РЕАЛЬНО используется
-                        YM_ROTOR_SESSION['seen_candidates'].append(track_id)
-                    else:
-                        print(f"[YM] Wave start - filtered duplicate track ID: {track_id}")
+                # Фильтруем дубликаты и добавляем в глобальный список
+                unique_raw_tracks = []
+                with YM_ROTOR_LOCK:
+                    for track in raw_tracks:
+                        if hasattr(track, 'id'):
+                            track_id = str(track.id)
+                            if track_id not in YM_ROTOR_SESSION['used_track_ids']:
+                                unique_raw_tracks.append(track)
+                                YM_ROTOR_SESSION['used_track_ids'].add(track_id)
+                                # ДОБАВЛЯЕМ в seen_candidates только когда трек РЕАЛЬНО используется
+                                YM_ROTOR_SESSION['seen_candidates'].append(track_id)
+                            else:
+                                print(f"[YM] Wave start - filtered duplicate track ID: {track_id}")
 
             if not unique_raw_tracks:
                 print("[YM] Wave start failed - all tracks were duplicates")
@@ -1209,12 +1734,15 @@ def setup_yandex_music_routes(app, settings_file):
             
             print(f"[YM] Successfully loaded {len(formatted_tracks)} unique tracks for wave start")
             
+            # Следующие треки волны готовятся в фоне, пока играют первые
+            YM_WAVE_BUFFER.start()
+            
             return jsonify({
                 "success": True,
                 "tracks": formatted_tracks,
                 "stationInfo": {
-                    "name": personal_station.name,
-                    "id": str(personal_station.id)
+                    "name": station['name'],
+                    "id": station['id']
                 }
             })
             
@@ -1244,50 +1772,15 @@ def setup_yandex_music_routes(app, settings_file):
             
             print("[YM] Getting recommendations with default settings (separate from wave)")
             
-            # Получаем список станций
-            rotor = YM_CLIENT.rotor_stations_dashboard()
-            personal_station = None
-            
-            print(f"[YM] Found {len(rotor.stations)} stations")
-            
-            # Ищем персональную станцию (Моя волна)
-            for station in rotor.stations:
-                if hasattr(station, 'station') and station.station:
-                    station_obj = station.station
-                    
-                    if hasattr(station_obj, 'id') and station_obj.id:
-                        station_id = station_obj.id
-                        
-                        # Проверяем разные варианты персональной станции
-                        if (hasattr(station_id, 'type') and 
-                            (station_id.type == 'personal' or 
-                             station_id.type == 'user' or
-                             (hasattr(station_id, 'tag') and 'personal' in str(station_id.tag).lower()))):
-                            personal_station = station_obj
-                            print(f"[YM] Found personal station: {station_obj.name}")
-                            break
-            
-            # Если не нашли по типу, попробуем найти по названию
-            if not personal_station:
-                print("[YM] Trying to find station by name...")
-                for station in rotor.stations:
-                    if hasattr(station, 'station') and station.station:
-                        station_obj = station.station
-                        station_name = getattr(station_obj, 'name', '').lower()
-                        if 'волна' in station_name or 'personal' in station_name or 'моя' in station_name:
-                            personal_station = station_obj
-                            print(f"[YM] Found personal station by name: {station_obj.name}")
-                            break
-            
-            if not personal_station:
+            station = known_station(YM_RECOMMENDATIONS_SESSION) or find_personal_station()
+            if not station:
                 return jsonify({
                     "success": False,
                     "error": "Персональная станция (Моя волна) не найдена"
                 }), 404
             
             # Используем ОТДЕЛЬНУЮ роторную сессию для рекомендаций
-            station_id = personal_station.id
-            seed = f"{station_id.type}:{station_id.tag}"
+            seed = station['seed']
             print(f"[YM] Using seed for recommendations: {seed}")
             
             # Создаем отдельную сессию рекомендаций с дефолтными настройками
@@ -1296,10 +1789,19 @@ def setup_yandex_music_routes(app, settings_file):
                     "success": False,
                     "error": "Не удалось создать роторную сессию для рекомендаций"
                 }), 500
+            YM_RECOMMENDATIONS_SESSION['station_name'] = station['name']
+            YM_RECOMMENDATIONS_SESSION['station_id'] = station['id']
             
             # Получаем треки из ОТДЕЛЬНОЙ роторной сессии рекомендаций
             try:
                 sequence_tracks = get_recommendations_tracks(count=10)
+                if not sequence_tracks and YM_RECOMMENDATIONS_SESSION['restored']:
+                    print("[YM] Restored recommendations session returned no tracks, creating a new one")
+                    YM_RECOMMENDATIONS_SESSION['session_id'] = None
+                    if create_recommendations_rotor_session(seed):
+                        sequence_tracks = get_recommendations_tracks(count=10)
+                YM_RECOMMENDATIONS_SESSION['restored'] = False
+                save_rotor_state()
                 if not sequence_tracks:
                     return jsonify({
                         "success": False,
@@ -1372,8 +1874,8 @@ def setup_yandex_music_routes(app, settings_file):
                 "success": True,
                 "tracks": formatted_tracks,
                 "stationInfo": {
-                    "name": personal_station.name,
-                    "id": str(personal_station.id)
+                    "name": station['name'],
+                    "id": station['id']
                 }
             })
             
@@ -1411,147 +1913,20 @@ def setup_yandex_music_routes(app, settings_file):
             YM_ROTOR_SESSION['used_track_ids'].update(used_track_ids)
             print(f"[YM] Updated global used tracks: {len(YM_ROTOR_SESSION['used_track_ids'])} total")
 
-            # Если у нас нет курсора, добавляем небольшую задержку перед запросом
-            if not YM_ROTOR_SESSION['last_cursor']:
-                import time
-                time.sleep(0.5)  # Пауза 0.5 сек если нет курсора
-
-            # Получаем следующие треки из роторной сессии (БЕЗ фильтрации дубликатов в get_next_rotor_tracks)
-            raw_tracks = get_next_rotor_tracks(count * 2)  # Запрашиваем больше треков для фильтрации
-            if not raw_tracks:
-                print(f"[YM] No more tracks available from rotor session")
+            # Треки заранее загружены фоновым буфером - просто забираем их
+            tracks = YM_WAVE_BUFFER.take(count, exclude_ids=[str(track_id) for track_id in used_track_ids])
+            if not tracks:
+                print("[YM] No more tracks available from wave buffer")
                 return jsonify({
                     "success": True,
                     "tracks": [],
                     "message": "Новых треков пока нет, попробуйте позже"
                 })
-
-            # Фильтруем дубликаты используя только used_track_ids (реально проигранные треки)
-            unique_raw_tracks = []
-            seen_candidates_list = list(YM_ROTOR_SESSION['seen_candidates'])
-            
-            for track in raw_tracks:
-                if hasattr(track, 'id'):
-                    track_id = str(track.id)
-                    # Приоритетная фильтрация: только по used_track_ids (реально проигранные)
-                    if track_id not in YM_ROTOR_SESSION['used_track_ids']:
-                        # Вторичная фильтрация: по seen_candidates только при переполнении
-                        if len(YM_ROTOR_SESSION['seen_candidates']) < 800 or track_id not in seen_candidates_list:
-                            unique_raw_tracks.append(track)
-                            YM_ROTOR_SESSION['used_track_ids'].add(track_id)
-                            # ДОБАВЛЯЕМ в seen_candidates только когда трек РЕАЛЬНО используется
-                            YM_ROTOR_SESSION['seen_candidates'].append(track_id)
-                            if len(unique_raw_tracks) >= count:
-                                break  # Как только набрали нужное количество, останавливаемся
-                        else:
-                            print(f"[YM] Filtered seen candidate track ID: {track_id}")
-                    else:
-                        print(f"[YM] Filtered duplicate track ID: {track_id}")
-            
-            # Если после строгой фильтрации получили мало треков, ослабляем фильтр
-            if len(unique_raw_tracks) < count // 2:
-                print(f"[YM] Got only {len(unique_raw_tracks)} after strict filtering, relaxing filter...")
-                for track in raw_tracks:
-                    if hasattr(track, 'id') and len(unique_raw_tracks) < count:
-                        track_id = str(track.id)
-                        # Ослабленная фильтрация: только по used_track_ids
-                        if track_id not in YM_ROTOR_SESSION['used_track_ids']:
-                            if track not in unique_raw_tracks:
-                                unique_raw_tracks.append(track)
-                                YM_ROTOR_SESSION['used_track_ids'].add(track_id)
-                                # ДОБАВЛЯЕМ в seen_candidates только когда трек РЕАЛЬНО используется
-                                YM_ROTOR_SESSION['seen_candidates'].append(track_id)
-
-            # Обновляем историю количества уникальных треков
-            unique_count = len(unique_raw_tracks)
-            YM_ROTOR_SESSION['last_unique_count_history'].append(unique_count)
-            print(f"[YM] Unique tracks history: {list(YM_ROTOR_SESSION['last_unique_count_history'])}")
-
-            if not unique_raw_tracks:
-                YM_ROTOR_SESSION['consecutive_empty_requests'] += 1
-                print(f"[YM] All tracks from rotor were duplicates (consecutive empty: {YM_ROTOR_SESSION['consecutive_empty_requests']})")
-                return jsonify({
-                    "success": True,
-                    "tracks": [],
-                    "message": "Все новые треки уже были в плейлисте"
-                })
-            else:
-                YM_ROTOR_SESSION['consecutive_empty_requests'] = 0
-
-            # Получаем полную информацию о уникальных треках
-            track_ids = []
-            for track in unique_raw_tracks:
-                try:
-                    if hasattr(track, 'albums') and track.albums and len(track.albums) > 0:
-                        first_album = track.albums[0]
-                        if hasattr(first_album, 'id'):
-                            album_id = first_album.id
-                        elif isinstance(first_album, dict) and 'id' in first_album:
-                            album_id = first_album['id']
-                        else:
-                            album_id = str(first_album)
-                        track_ids.append(f"{track.id}:{album_id}")
-                    else:
-                        track_ids.append(str(track.id))
-                except Exception:
-                    track_ids.append(str(track.id))
-
-            # Получаем детальную информацию о треках
-            formatted_tracks = []
-            if track_ids:
-                tracks_info = YM_CLIENT.tracks(track_ids)
-                
-                for track in tracks_info:
-                    if track:
-                        # Получаем обложку
-                        thumbnail = None
-                        if track.cover_uri:
-                            thumbnail = f"https://{track.cover_uri.replace('%%', '400x400')}"
-                        elif track.albums and track.albums[0].cover_uri:
-                            thumbnail = f"https://{track.albums[0].cover_uri.replace('%%', '400x400')}"
-                        
-                        # Формируем исполнителей
-                        artists = [artist.name for artist in track.artists] if track.artists else []
-                        
-                        formatted_track = {
-                            "id": str(track.id),
-                            "title": track.title or "Unknown Title",
-                            "artist": ", ".join(artists) if artists else "Unknown Artist",
-                            "uploader": ", ".join(artists) if artists else "Unknown Artist",
-                            "duration": track.duration_ms // 1000 if track.duration_ms else 0,
-                            "thumbnail": thumbnail,
-                            "platform": "yandex_music",
-                            "url": f"yandex_music:{track.id}",
-                            "feedback": None
-                        }
-                        
-                        formatted_tracks.append(formatted_track)
-
-            print(f"[YM] Successfully loaded {len(formatted_tracks)} unique new wave tracks using persistent session")
-
-            # Защита от застревания: проверяем историю уникальных треков
-            history = list(YM_ROTOR_SESSION['last_unique_count_history'])
-            if len(history) >= 4:
-                total_unique = sum(history)
-                print(f"[YM] Last 4 requests unique counts: {history}, total: {total_unique}")
-                
-                # Если за последние 4 запроса получили меньше 4 уникальных треков - жесткая проблема
-                if total_unique < 4:
-                    print(f"[YM] CRITICAL: Very low unique track yield ({total_unique} in last 4 requests)")
-                    
-                    # Частично очищаем seen_candidates (оставляем только последние 200)
-                    if len(YM_ROTOR_SESSION['seen_candidates']) > 200:
-                        recent_candidates = list(YM_ROTOR_SESSION['seen_candidates'])[-200:]
-                        YM_ROTOR_SESSION['seen_candidates'].clear()
-                        YM_ROTOR_SESSION['seen_candidates'].extend(recent_candidates)
-                        print(f"[YM] Emergency cleanup: kept only last {len(recent_candidates)} seen_candidates")
-                    
-                    # Очищаем историю для нового начала
-                    YM_ROTOR_SESSION['last_unique_count_history'].clear()
-
+            
+            print(f"[YM] Served {len(tracks)} wave tracks from buffer")
             return jsonify({
                 "success": True,
-                "tracks": formatted_tracks
+                "tracks": tracks
             })
                 
         except Exception as e:
@@ -1603,6 +1978,7 @@ def setup_yandex_music_routes(app, settings_file):
                 # Добавляем в лайки
                 try:
                     YM_CLIENT.users_likes_tracks_add(track_id)
+                    invalidate_liked_track_ids()
                     print(f"[YM] Added track {track_id} to likes")
                 except Exception as e:
                     print(f"[YM] Error adding to likes: {e}")
@@ -1611,6 +1987,7 @@ def setup_yandex_music_routes(app, settings_file):
                 # Убираем из лайков (если был)
                 try:
                     YM_CLIENT.users_likes_tracks_remove(track_id)
+                    invalidate_liked_track_ids()
                 except:
                     pass  # Возможно, трек не был в лайках
                 print(f"[YM] Processed dislike for track {track_id}")
@@ -1637,49 +2014,226 @@ def setup_yandex_music_routes(app, settings_file):
     print("[YM] Yandex Music routes setup completed")
     return app
 
+def _get_batch_executor():
+    """Общий ограниченный пул для загрузки батчей треков"""
+    global YM_BATCH_EXECUTOR
+    with YM_EXECUTOR_LOCK:
+        if YM_BATCH_EXECUTOR is None:
+            YM_BATCH_EXECUTOR = ThreadPoolExecutor(max_workers=YM_TRACK_BATCH_WORKERS, thread_name_prefix="ym-tracks")
+        return YM_BATCH_EXECUTOR
+
+def _load_tracks_batch(batch_ids, batch_num, total_batches):
+    try:
+        print(f"[YM] Loading batch {batch_num}/{total_batches} ({len(batch_ids)} tracks)")
+        tracks = YM_CLIENT.tracks(batch_ids)
+        
+        if not tracks:
+            print(f"[YM] Batch {batch_num}: no tracks returned")
+            return []
+        
+        formatted_tracks = []
+        for track in tracks:
+            try:
+                formatted_track = format_yandex_track(track)
+                if formatted_track:
+                    formatted_tracks.append(formatted_track)
+            except Exception as e:
+                print(f"[YM] Error formatting track in batch: {e}")
+                continue
+        
+        print(f"[YM] Batch {batch_num}: loaded {len(formatted_tracks)} tracks")
+        return formatted_tracks
+        
+    except Exception as e:
+        print(f"[YM] Error loading batch {batch_num}: {e}")
+        return []
+
 def get_tracks_by_ids_batch(track_ids, batch_size=250):
-    """Получить полную информацию о треках по их ID батчами"""
+    """Получить полную информацию о треках по их ID батчами.
+
+    Батчи загружаются параллельно в общем пуле, порядок треков сохраняется.
+    """
     if not YM_CLIENT or not track_ids:
         return []
     
-    all_tracks = []
-    total_batches = (len(track_ids) + batch_size - 1) // batch_size
+    batches = [track_ids[i:i + batch_size] for i in range(0, len(track_ids), batch_size)]
+    total_batches = len(batches)
     
     print(f"[YM] Loading {len(track_ids)} tracks in {total_batches} batches of {batch_size}")
     
-    for i in range(0, len(track_ids), batch_size):
-        batch_ids = track_ids[i:i + batch_size]
-        batch_num = (i // batch_size) + 1
-        
-        try:
-            print(f"[YM] Loading batch {batch_num}/{total_batches} ({len(batch_ids)} tracks)")
-            tracks = YM_CLIENT.tracks(batch_ids)
-            
-            if tracks:
-                formatted_tracks = []
-                for track in tracks:
-                    try:
-                        formatted_track = format_yandex_track(track)
-                        if formatted_track:
-                            formatted_tracks.append(formatted_track)
-                    except Exception as e:
-                        print(f"[YM] Error formatting track in batch: {e}")
-                        continue
-                
-                all_tracks.extend(formatted_tracks)
-                print(f"[YM] Batch {batch_num}: loaded {len(formatted_tracks)} tracks")
-            else:
-                print(f"[YM] Batch {batch_num}: no tracks returned")
-                
-        except Exception as e:
-            print(f"[YM] Error loading batch {batch_num}: {e}")
-            continue
+    if total_batches == 1:
+        results = [_load_tracks_batch(batches[0], 1, 1)]
+    else:
+        executor = _get_batch_executor()
+        futures = [executor.submit(_load_tracks_batch, batch_ids, num + 1, total_batches)
+                   for num, batch_ids in enumerate(batches)]
+        results = [future.result() for future in futures]
     
+    all_tracks = [track for batch in results for track in batch]
     print(f"[YM] Total loaded: {len(all_tracks)} out of {len(track_ids)} tracks")
     return all_tracks
 
-def get_yandex_playlists():
-    """Получить пользовательские плейлисты из Яндекс.Музыки"""
+def _base_track_id(track_id):
+    return str(track_id).split(':')[0]
+
+def hydrate_yandex_tracks(track_ids):
+    """Метаданные треков в порядке track_ids; загруженные ранее берутся из кэша.
+
+    Не найденные в Яндекс.Музыке треки пропускаются, как в get_tracks_by_ids_batch.
+    """
+    found = {}
+    missing = []
+    with YM_TRACK_META_LOCK:
+        for track_id in track_ids:
+            key = _base_track_id(track_id)
+            if key in found:
+                continue
+            track = YM_TRACK_META_CACHE.get(key)
+            if track is not None:
+                YM_TRACK_META_CACHE.move_to_end(key)
+                found[key] = track
+            else:
+                found[key] = None
+                missing.append(track_id)
+    
+    if missing:
+        loaded = get_tracks_by_ids_batch(missing)
+        with YM_TRACK_META_LOCK:
+            for track in loaded:
+                key = _base_track_id(track['id'])
+                found[key] = track
+                YM_TRACK_META_CACHE[key] = track
+                YM_TRACK_META_CACHE.move_to_end(key)
+            while len(YM_TRACK_META_CACHE) > YM_TRACK_META_CACHE_SIZE:
+                YM_TRACK_META_CACHE.popitem(last=False)
+    
+    result = []
+    for track_id in track_ids:
+        track = found.get(_base_track_id(track_id))
+        if track is not None:
+            result.append(dict(track))
+    return result
+
+def clear_yandex_library_caches():
+    with YM_TRACK_META_LOCK:
+        YM_TRACK_META_CACHE.clear()
+    with YM_DIRECT_LINK_LOCK:
+        YM_DIRECT_LINK_CACHE.clear()
+    invalidate_liked_track_ids()
+
+def _load_yandex_playlist(playlist_short, i, total, hydrate=True):
+    """Загрузить один плейлист; None, если он недоступен.
+
+    При hydrate=False треки не запрашиваются: в ответе только track_ids.
+    """
+    playlist_name = getattr(playlist_short, 'title', f'Playlist {i+1}')
+    print(f"[YM] Processing playlist {i+1}/{total}: '{playlist_name}'")
+
+    # Проверяем наличие необходимых данных
+    if not hasattr(playlist_short, 'uid') or not hasattr(playlist_short, 'kind'):
+        print(f"[YM] Skipping playlist '{playlist_name}': missing uid or kind")
+        return None
+
+    # Получаем полную информацию о плейлисте используя правильный порядок параметров
+    try:
+        full_playlist = YM_CLIENT.users_playlists(playlist_short.kind, playlist_short.uid)
+    except Exception as playlist_error:
+        error_msg = str(playlist_error)
+        if 'playlist-not-found' in error_msg:
+            print(f"[YM] Playlist '{playlist_name}' not found or private - skipping")
+        elif 'playlistIdBindingError' in error_msg:
+            print(f"[YM] Playlist '{playlist_name}' has binding issues - skipping")
+        else:
+            print(f"[YM] Error accessing playlist '{playlist_name}': {error_msg}")
+        return None
+
+    if not full_playlist:
+        print(f"[YM] Empty playlist data for '{playlist_name}' - creating empty playlist")
+        # Создаем пустой плейлист
+        # Пытаемся получить обложку даже для пустого плейлиста
+        cover_uri = None
+        try:
+            if hasattr(playlist_short, 'cover') and playlist_short.cover:
+                if hasattr(playlist_short.cover, 'uri') and playlist_short.cover.uri:
+                    cover_uri = f"https://{playlist_short.cover.uri.replace('%%', '400x400')}"
+        except Exception as cover_error:
+            print(f"[YM] Error getting cover for empty playlist '{playlist_name}': {cover_error}")
+
+        formatted_playlist = {
+            "id": f"{playlist_short.uid}:{playlist_short.kind}",
+            "name": playlist_name,
+            "tracks": [],
+            "track_count": 0,
+            "description": getattr(playlist_short, 'description', '') or '',
+            "public": getattr(playlist_short, 'visibility', 'private') == 'public',
+            "cover": cover_uri
+        }
+        if not hydrate:
+            formatted_playlist["track_ids"] = []
+        print(f"[YM] Added empty playlist: '{playlist_name}'")
+        return formatted_playlist
+
+    # Собираем ID треков из плейлиста
+    track_ids = []
+    if hasattr(full_playlist, 'tracks') and full_playlist.tracks:
+        for track_short in full_playlist.tracks:
+            try:
+                if hasattr(track_short, 'track') and track_short.track:
+                    track = track_short.track
+                    # Получаем ID трека
+                    if hasattr(track, 'track_id') and track.track_id:
+                        track_ids.append(str(track.track_id))
+                    elif hasattr(track, 'id') and track.id:
+                        track_ids.append(str(track.id))
+            except Exception as e:
+                print(f"[YM] Error extracting track ID in playlist '{playlist_name}': {e}")
+                continue
+
+    # Загружаем полную информацию о треках батчами
+    tracks = []
+    if track_ids and hydrate:
+        print(f"[YM] Loading {len(track_ids)} tracks for playlist '{playlist_name}'")
+        tracks = hydrate_yandex_tracks(track_ids)
+
+    # Получаем обложку плейлиста
+    cover_uri = None
+    try:
+        if hasattr(full_playlist, 'cover') and full_playlist.cover:
+            if hasattr(full_playlist.cover, 'uri') and full_playlist.cover.uri:
+                cover_uri = f"https://{full_playlist.cover.uri.replace('%%', '400x400')}"
+        elif hasattr(playlist_short, 'cover') and playlist_short.cover:
+            if hasattr(playlist_short.cover, 'uri') and playlist_short.cover.uri:
+                cover_uri = f"https://{playlist_short.cover.uri.replace('%%', '400x400')}"
+        # Если нет обложки плейлиста, используем обложку первого трека
+        elif tracks and len(tracks) > 0 and tracks[0].get('thumbnail'):
+            cover_uri = tracks[0]['thumbnail']
+    except Exception as cover_error:
+        print(f"[YM] Error getting playlist cover for '{playlist_name}': {cover_error}")
+
+    # Создаем плейлист
+    formatted_playlist = {
+        "id": f"{playlist_short.uid}:{playlist_short.kind}",
+        "name": playlist_name,
+        "tracks": tracks,
+        "track_count": len(tracks) if hydrate else len(track_ids),
+        "description": getattr(full_playlist, 'description', '') or getattr(playlist_short, 'description', '') or '',
+        "public": getattr(full_playlist, 'visibility', getattr(playlist_short, 'visibility', 'private')) == 'public',
+        "cover": cover_uri
+    }
+    if not hydrate:
+        formatted_playlist["track_ids"] = track_ids
+
+    print(f"[YM] Successfully added playlist: '{playlist_name}' ({len(tracks)} tracks)")
+    return formatted_playlist
+
+def get_yandex_playlists(hydrate=True):
+    """Получить пользовательские плейлисты из Яндекс.Музыки.
+
+    Плейлисты загружаются параллельно (не больше YM_PLAYLIST_WORKERS
+    одновременно), порядок как в users_playlists_list. Недоступные или
+    не успевшие за YM_PLAYLISTS_TIMEOUT плейлисты пропускаются.
+    hydrate=False - только заголовки и track_ids, без метаданных треков.
+    """
     if not YM_CLIENT:
         print("[YM] Client not initialized")
         return []
@@ -1693,126 +2247,54 @@ def get_yandex_playlists():
             print("[YM] No playlists found")
             return []
         
-        print(f"[YM] Found {len(playlists_list)} playlists")
-        formatted_playlists = []
+        total = len(playlists_list)
+        print(f"[YM] Found {total} playlists")
         
-        for i, playlist_short in enumerate(playlists_list):
-            try:
-                playlist_name = getattr(playlist_short, 'title', f'Playlist {i+1}')
-                print(f"[YM] Processing playlist {i+1}/{len(playlists_list)}: '{playlist_name}'")
-                
-                # Проверяем наличие необходимых данных
-                if not hasattr(playlist_short, 'uid') or not hasattr(playlist_short, 'kind'):
-                    print(f"[YM] Skipping playlist '{playlist_name}': missing uid or kind")
-                    continue
-                
-                # Получаем полную информацию о плейлисте используя правильный порядок параметров
+        executor = ThreadPoolExecutor(max_workers=min(YM_PLAYLIST_WORKERS, total), thread_name_prefix="ym-playlist")
+        futures = [executor.submit(_load_yandex_playlist, playlist_short, i, total, hydrate)
+                   for i, playlist_short in enumerate(playlists_list)]
+        deadline = time.time() + YM_PLAYLISTS_TIMEOUT
+        
+        formatted_playlists = []
+        failed = 0
+        try:
+            for i, future in enumerate(futures):
+                playlist_name = getattr(playlists_list[i], 'title', f'Playlist {i+1}')
                 try:
-                    full_playlist = YM_CLIENT.users_playlists(playlist_short.kind, playlist_short.uid)
-                except Exception as playlist_error:
-                    error_msg = str(playlist_error)
-                    if 'playlist-not-found' in error_msg:
-                        print(f"[YM] Playlist '{playlist_name}' not found or private - skipping")
-                    elif 'playlistIdBindingError' in error_msg:
-                        print(f"[YM] Playlist '{playlist_name}' has binding issues - skipping")
-                    else:
-                        print(f"[YM] Error accessing playlist '{playlist_name}': {error_msg}")
+                    playlist = future.result(timeout=max(0, deadline - time.time()))
+                except FuturesTimeoutError:
+                    print(f"[YM] Playlist '{playlist_name}' timed out - skipping")
+                    failed += 1
                     continue
-                
-                if not full_playlist:
-                    print(f"[YM] Empty playlist data for '{playlist_name}' - creating empty playlist")
-                    # Создаем пустой плейлист
-                    # Пытаемся получить обложку даже для пустого плейлиста
-                    cover_uri = None
-                    try:
-                        if hasattr(playlist_short, 'cover') and playlist_short.cover:
-                            if hasattr(playlist_short.cover, 'uri') and playlist_short.cover.uri:
-                                cover_uri = f"https://{playlist_short.cover.uri.replace('%%', '400x400')}"
-                    except Exception as cover_error:
-                        print(f"[YM] Error getting cover for empty playlist '{playlist_name}': {cover_error}")
-
-                    formatted_playlist = {
-                        "id": f"{playlist_short.uid}:{playlist_short.kind}",
-                        "name": playlist_name,
-                        "tracks": [],
-                        "track_count": 0,
-                        "description": getattr(playlist_short, 'description', '') or '',
-                        "public": getattr(playlist_short, 'visibility', 'private') == 'public',
-                        "cover": cover_uri
-                    }
-                    formatted_playlists.append(formatted_playlist)
-                    print(f"[YM] Added empty playlist: '{playlist_name}'")
+                except Exception as e:
+                    print(f"[YM] Error processing playlist '{playlist_name}': {e}")
+                    failed += 1
                     continue
                 
-                # Собираем ID треков из плейлиста
-                track_ids = []
-                if hasattr(full_playlist, 'tracks') and full_playlist.tracks:
-                    for track_short in full_playlist.tracks:
-                        try:
-                            if hasattr(track_short, 'track') and track_short.track:
-                                track = track_short.track
-                                # Получаем ID трека
-                                if hasattr(track, 'track_id') and track.track_id:
-                                    track_ids.append(str(track.track_id))
-                                elif hasattr(track, 'id') and track.id:
-                                    track_ids.append(str(track.id))
-                        except Exception as e:
-                            print(f"[YM] Error extracting track ID in playlist '{playlist_name}': {e}")
-                            continue
-                
-                # Загружаем полную информацию о треках батчами
-                tracks = []
-                if track_ids:
-                    print(f"[YM] Loading {len(track_ids)} tracks for playlist '{playlist_name}'")
-                    tracks = get_tracks_by_ids_batch(track_ids)
-                
-                # Получаем обложку плейлиста
-                cover_uri = None
-                try:
-                    if hasattr(full_playlist, 'cover') and full_playlist.cover:
-                        if hasattr(full_playlist.cover, 'uri') and full_playlist.cover.uri:
-                            cover_uri = f"https://{full_playlist.cover.uri.replace('%%', '400x400')}"
-                    elif hasattr(playlist_short, 'cover') and playlist_short.cover:
-                        if hasattr(playlist_short.cover, 'uri') and playlist_short.cover.uri:
-                            cover_uri = f"https://{playlist_short.cover.uri.replace('%%', '400x400')}"
-                    # Если нет обложки плейлиста, используем обложку первого трека
-                    elif tracks and len(tracks) > 0 and tracks[0].get('thumbnail'):
-                        cover_uri = tracks[0]['thumbnail']
-                except Exception as cover_error:
-                    print(f"[YM] Error getting playlist cover for '{playlist_name}': {cover_error}")
-
-                # Создаем плейлист
-                formatted_playlist = {
-                    "id": f"{playlist_short.uid}:{playlist_short.kind}",
-                    "name": playlist_name,
-                    "tracks": tracks,
-                    "track_count": len(tracks),
-                    "description": getattr(full_playlist, 'description', '') or getattr(playlist_short, 'description', '') or '',
-                    "public": getattr(full_playlist, 'visibility', getattr(playlist_short, 'visibility', 'private')) == 'public',
-                    "cover": cover_uri
-                }
-                
-                formatted_playlists.append(formatted_playlist)
-                print(f"[YM] Successfully added playlist: '{playlist_name}' ({len(tracks)} tracks)")
-                
-            except Exception as e:
-                playlist_name = getattr(playlist_short, 'title', f'Playlist {i+1}')
-                print(f"[YM] Error processing playlist '{playlist_name}': {e}")
-                continue
+                if playlist:
+                    formatted_playlists.append(playlist)
+                else:
+                    failed += 1
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
         
-        print(f"[YM] Found {len(formatted_playlists)} playlists")
+        print(f"[YM] Found {len(formatted_playlists)} playlists ({failed} skipped)")
         return formatted_playlists
         
     except Exception as e:
         print(f"[YM] Error getting playlists: {e}")
         return []
 
-def get_yandex_liked_tracks():
-    """Получить любимые треки из Яндекс.Музыки"""
+def get_yandex_liked_track_ids():
+    """ID любимых треков в порядке Яндекс.Музыки (кэшируется на YM_LIKED_IDS_TTL)"""
     if not YM_CLIENT:
         print("[YM] Client not initialized")
         return []
     
+    cached_ids = YM_LIKED_IDS_CACHE['ids']
+    if cached_ids is not None and time.time() - YM_LIKED_IDS_CACHE['time'] < YM_LIKED_IDS_TTL:
+        return list(cached_ids)
+    
     try:
         print("[YM] Getting liked tracks list")
         liked_tracks = YM_CLIENT.users_likes_tracks()
@@ -1858,12 +2340,33 @@ def get_yandex_liked_tracks():
         
         print(f"[YM] Extracted {len(track_ids)} track IDs from liked tracks")
         
+        YM_LIKED_IDS_CACHE['ids'] = list(track_ids)
+        YM_LIKED_IDS_CACHE['time'] = time.time()
+        return track_ids
+        
+    except Exception as e:
+        print(f"[YM] Error getting liked tracks: {e}")
+        return []
+
+def invalidate_liked_track_ids():
+    YM_LIKED_IDS_CACHE['ids'] = None
+
+def get_yandex_liked_tracks():
+    """Получить любимые треки из Яндекс.Музыки"""
+    if not YM_CLIENT:
+        print("[YM] Client not initialized")
+        return []
+    
+    try:
+        # Полный список всегда берем свежим
+        invalidate_liked_track_ids()
+        track_ids = get_yandex_liked_track_ids()
         if not track_ids:
             print("[YM] No valid track IDs found in liked tracks")
             return []
         
         # Загружаем полную информацию о треках батчами
-        tracks = get_tracks_by_ids_batch(track_ids)
+        tracks = hydrate_yandex_tracks(track_ids)
         
         print(f"[YM] Successfully loaded {len(tracks)} out of {len(track_ids)} liked tracks")
         return tracks
@@ -1,27 +1,80 @@
-import os, time, threading, json, requests, tempfile, shutil
-from flask import Flask, request, jsonify, redirect, Response, stream_with_context, send_file, make_response
+import os, time, threading, json, tempfile, shutil
+import uuid
+import urllib.parse
+from collections import OrderedDict
+from flask import Flask, request, jsonify, redirect, Response, send_file
+from werkzeug.wsgi import wrap_file
 import yt_dlp
 from threading import Lock
+from search_cache import cached_search
+from url_cache_store import UrlCacheStore
+from preload_scheduler import PreloadScheduler
+from audio_cache import serve_audio
+from http_pool import http_pool
+import json_codec
 
 try:
-    from threading_utils import youtube_cache_lock, current_playing_track_lock, queued_tracks_lock
+    from threading_utils import youtube_cache_lock, current_playing_track_lock, queued_tracks_lock, youtube_extract_flight
     print("[YT] Using safe timed locks")
 except ImportError:
     # Fallback для обратной совместимости
     youtube_cache_lock = Lock()
     current_playing_track_lock = Lock()
     queued_tracks_lock = Lock()
+    youtube_extract_flight = None
     print("[YT] Using standard locks (fallback)")
 
-youtube_url_cache = {}
+# Порядок - давность использования: в начале записи, которые вытесняются первыми
+youtube_url_cache = OrderedDict()
 current_playing_track = None
 queued_tracks = set()
 
+# Срок жизни ссылки, если в URL нет параметра expire
+DEFAULT_URL_TTL = 3600
+# Запас до реального истечения ссылки googlevideo
+URL_EXPIRY_SAFETY_MARGIN = 300
+# Записи, которым осталось меньше этого, обновляются в фоне
+URL_REFRESH_WINDOW = 1200
+# Сколько держать в памяти предзагруженную, но не сыгранную ссылку и уже
+# использованную ссылку; копия на диске остается до реального expire
+PRELOADED_UNUSED_TTL = 1800
+USED_URL_TTL = 7200
+# Потолок числа записей youtube_url_cache в памяти
+URL_CACHE_MAX_ENTRIES = 2000
+
+# Постоянная копия youtube_url_cache на диске (инициализируется в setup_youtube_routes)
+url_cache_store = None
+
+# Общий планировщик предзагрузки (инициализируется в setup_youtube_routes)
+preload_scheduler = None
+
+def init_url_cache_store(cache_dir):
+    global url_cache_store
+    url_cache_store = UrlCacheStore(os.path.join(cache_dir, "youtube_urls.sqlite3"))
+    return url_cache_store
+
+# Результаты проверки cookie-файлов: path -> (mtime, size, valid)
+_cookie_validation_cache = {}
+
 def validate_cookies(cookie_file):
     if not os.path.exists(cookie_file):
         print(f"[YT_COOKIES] Cookie file not found: {cookie_file}")
         return False
     
+    try:
+        stat = os.stat(cookie_file)
+        cached = _cookie_validation_cache.get(cookie_file)
+        if cached and cached[0] == stat.st_mtime and cached[1] == stat.st_size:
+            return cached[2]
+        
+        valid = _read_and_validate_cookies(cookie_file)
+        _cookie_validation_cache[cookie_file] = (stat.st_mtime, stat.st_size, valid)
+        return valid
+    except Exception as e:
+        print(f"[YT_COOKIES] Error validating cookies: {e}")
+        return False
+
+def _read_and_validate_cookies(cookie_file):
     try:
         with open(cookie_file, 'r', encoding='utf-8') as f:
             content = f.read()
@@ -62,22 +115,110 @@ def update_queued_tracks(track_ids):
 
 
 def extract_audio_info(video_id, ffmpeg_dir=None, cookie_file=None):
-    strategies = [
-        ("with_cookies", extract_with_cookies),
-        ("visitor_data", extract_with_visitor_data),
-        ("minimal_headers", extract_with_minimal_headers),
-        ("mobile_headers", extract_with_mobile_headers)
-    ]
+    """Одновременные запросы одного video_id ждут одно общее извлечение"""
+    if youtube_extract_flight is None:
+        return run_extraction_strategies(video_id, ffmpeg_dir, cookie_file)
+    
+    if youtube_extract_flight.in_flight(video_id):
+        print(f"[YT] Joining in-flight extraction for {video_id}")
+    
+    return youtube_extract_flight.do(video_id, run_extraction_strategies, video_id, ffmpeg_dir, cookie_file)
+
+class StrategyScheduler:
+    """Порядок стратегий извлечения по накопленной статистике.
+
+    Для каждой стратегии хранится число успехов/ошибок и сглаженная
+    задержка. Первой пробуется стратегия с лучшим успехом, а стратегии,
+    провалившиеся несколько раз подряд, уходят на cool-down.
+    """
+    
+    FAILURE_THRESHOLD = 3
+    COOLDOWN_SECONDS = 300
+    RATE_LIMIT_WINDOW = 60
+    LATENCY_ALPHA = 0.3
+    
+    def __init__(self, strategies):
+        self._strategies = list(strategies)
+        self._lock = threading.Lock()
+        self._stats = {
+            name: {
+                'successes': 0,
+                'failures': 0,
+                'consecutive_failures': 0,
+                'avg_latency': None,
+                'cooldown_until': 0
+            }
+            for name, _ in self._strategies
+        }
+        self.last_rate_limit = 0
+    
+    def _score(self, name):
+        stats = self._stats[name]
+        # Сглаживание Лапласа: новая стратегия считается успешной наполовину
+        success_rate = (stats['successes'] + 1) / (stats['successes'] + stats['failures'] + 2)
+        latency = stats['avg_latency'] if stats['avg_latency'] is not None else 0
+        return (-success_rate, latency)
+    
+    def ordered(self):
+        """Стратегии в порядке попыток; стратегии на cool-down - в конце"""
+        now = time.time()
+        with self._lock:
+            index = {name: i for i, (name, _) in enumerate(self._strategies)}
+            ready = [s for s in self._strategies if self._stats[s[0]]['cooldown_until'] <= now]
+            cooling = [s for s in self._strategies if self._stats[s[0]]['cooldown_until'] > now]
+            ready.sort(key=lambda s: self._score(s[0]) + (index[s[0]],))
+            cooling.sort(key=lambda s: self._stats[s[0]]['cooldown_until'])
+            return ready, cooling
+    
+    def record_success(self, name, latency):
+        with self._lock:
+            stats = self._stats[name]
+            stats['successes'] += 1
+            stats['consecutive_failures'] = 0
+            stats['cooldown_until'] = 0
+            if stats['avg_latency'] is None:
+                stats['avg_latency'] = latency
+            else:
+                stats['avg_latency'] += self.LATENCY_ALPHA * (latency - stats['avg_latency'])
+    
+    def record_failure(self, name, rate_limited=False):
+        with self._lock:
+            stats = self._stats[name]
+            stats['failures'] += 1
+            stats['consecutive_failures'] += 1
+            if stats['consecutive_failures'] >= self.FAILURE_THRESHOLD:
+                stats['cooldown_until'] = time.time() + self.COOLDOWN_SECONDS
+                print(f"[YT] Strategy {name} on cool-down for {self.COOLDOWN_SECONDS}s")
+            if rate_limited:
+                self.last_rate_limit = time.time()
+    
+    def recently_rate_limited(self):
+        return time.time() - self.last_rate_limit < self.RATE_LIMIT_WINDOW
+    
+    def stats(self):
+        with self._lock:
+            return {name: dict(stats) for name, stats in self._stats.items()}
+
+def run_extraction_strategies(video_id, ffmpeg_dir=None, cookie_file=None):
+    ready, cooling = extraction_scheduler.ordered()
+    # Если все стратегии на cool-down, все равно пробуем их
+    strategies = ready or cooling
     
     last_error = None
     
     for strategy_name, strategy_func in strategies:
+        if strategy_name == "with_cookies" and (not cookie_file or not validate_cookies(cookie_file)):
+            continue
+        
         try:
             print(f"[YT] Trying strategy: {strategy_name}")
-            time.sleep(0.5)
+            if extraction_scheduler.recently_rate_limited():
+                time.sleep(0.5)
             
+            start_time = time.time()
             result = strategy_func(video_id, ffmpeg_dir, cookie_file)
             if result:
+                extraction_scheduler.record_success(strategy_name, time.time() - start_time)
                 print(f"[YT] Success with strategy: {strategy_name}")
                 return result
                 
@@ -87,10 +228,11 @@ def extract_audio_info(video_id, ffmpeg_dir=None, cookie_file=None):
             last_error = e
             
             if "429" in error_msg or "too many requests" in error_msg:
+                extraction_scheduler.record_failure(strategy_name, rate_limited=True)
                 print("[YT] Rate limit detected, sleeping...")
                 time.sleep(2)
-            elif "sign in" in error_msg or "bot" in error_msg:
-                continue
+            else:
+                extraction_scheduler.record_failure(strategy_name)
     
     raise Exception(f"All YouTube extraction strategies failed. Last error: {last_error}")
 
@@ -190,6 +332,13 @@ def extract_with_mobile_headers(video_id, ffmpeg_dir=None, cookie_file=None):
         info = ydl.extract_info(f"https://www.youtube.com/watch?v={video_id}", download=False)
         return process_youtube_info(info)
 
+extraction_scheduler = StrategyScheduler([
+    ("with_cookies", extract_with_cookies),
+    ("visitor_data", extract_with_visitor_data),
+    ("minimal_headers", extract_with_minimal_headers),
+    ("mobile_headers", extract_with_mobile_headers)
+])
+
 def process_youtube_info(info):
     if not info:
         raise Exception("extract_info returned None")
@@ -242,30 +391,10 @@ def download_youtube_audio(video_id, ffmpeg_dir=None, cookie_file=None):
     try:
         print(f"[YT_DL] Starting download for {video_id}")
         
-        strategies = [
-            ("with_cookies", extract_with_cookies),
-            ("visitor_data", extract_with_visitor_data), 
-            ("minimal_headers", extract_with_minimal_headers),
-            ("mobile_headers", extract_with_mobile_headers)
-        ]
-        
-        audio_info = None
-        last_error = None
-        
-        for strategy_name, strategy_func in strategies:
-            try:
-                print(f"[YT_DL] Trying download strategy: {strategy_name}")
-                audio_info = strategy_func(video_id, ffmpeg_dir, cookie_file)
-                if audio_info and audio_info.get('url'):
-                    print(f"[YT_DL] Success with strategy: {strategy_name}")
-                    break
-            except Exception as e:
-                print(f"[YT_DL] Strategy {strategy_name} failed: {e}")
-                last_error = e
-                time.sleep(0.5)
+        audio_info = extract_audio_info(video_id, ffmpeg_dir, cookie_file)
         
         if not audio_info or not audio_info.get('url'):
-            raise Exception(f"All download strategies failed. Last error: {last_error}")
+            raise Exception("All download strategies failed. No direct audio URL found")
         
         direct_url = audio_info['url']
         ext = audio_info.get('ext', 'm4a')
@@ -285,7 +414,7 @@ def download_youtube_audio(video_id, ffmpeg_dir=None, cookie_file=None):
             'Referer': 'https://www.youtube.com/',
         }
         
-        response = requests.get(direct_url, headers=headers, stream=True, timeout=30)
+        response = http_pool.get(direct_url, headers=headers, stream=True, timeout=30)
         response.raise_for_status()
         
         total_size = int(response.headers.get('content-length', 0))
@@ -344,7 +473,8 @@ def download_youtube_audio(video_id, ffmpeg_dir=None, cookie_file=None):
                 pass
         raise
 
-def search_youtube(query, ffmpeg_dir=None, cookie_file=None):
+@cached_search('youtube')
+def search_youtube(query, ffmpeg_dir=None, cookie_file=None, timeout=None):
     ydl_opts = {
         'format': 'bestaudio',
         'quiet': True,
@@ -356,6 +486,9 @@ def search_youtube(query, ffmpeg_dir=None, cookie_file=None):
         'ignoreerrors': True
     }
     
+    if timeout:
+        ydl_opts['socket_timeout'] = timeout
+    
     if ffmpeg_dir:
         ydl_opts['ffmpeg_location'] = ffmpeg_dir
     
@@ -388,6 +521,7 @@ def search_youtube(query, ffmpeg_dir=None, cookie_file=None):
             })
         return out
 
+@cached_search('youtube_playlists')
 def search_youtube_playlists(query, ffmpeg_dir=None, cookie_file=None, limit=20):
     """Поиск плейлистов на YouTube"""
     ydl_opts = {
@@ -629,34 +763,141 @@ def get_audio_duration(filepath, ffmpeg_dir=None):
         print(f"[Duration] Error: {e}")
         return 0
 
-def send_cached_file(filepath, video_id):
+SEND_CHUNK_SIZE = 64 * 1024
+# Больше диапазонов в одном запросе не обслуживаем - отдаем файл целиком
+MAX_BYTE_RANGES = 16
+
+def parse_byte_ranges(range_header, file_size):
+    """'bytes=0-99,-500' -> [(0, 99), (size-500, size-1)].
+
+    None - заголовок не разобран (отдаем файл целиком),
+    [] - ни один диапазон не попадает в файл (416).
+    """
+    if not range_header or not range_header.startswith('bytes='):
+        return None
+
+    specs = range_header[len('bytes='):].split(',')
+    if len(specs) > MAX_BYTE_RANGES:
+        return None
+
+    ranges = []
+    for spec in specs:
+        spec = spec.strip()
+        if '-' not in spec:
+            return None
+        first, last = spec.split('-', 1)
+        try:
+            if first:
+                start = int(first)
+                end = int(last) if last else file_size - 1
+            else:
+                # Суффикс: последние N байт
+                suffix = int(last)
+                if suffix <= 0:
+                    continue
+                start = max(file_size - suffix, 0)
+                end = file_size - 1
+        except ValueError:
+            return None
+
+        if start >= file_size:
+            continue
+        if end < start:
+            return None
+        ranges.append((start, min(end, file_size - 1)))
+    return ranges
+
+def iter_file_range(filepath, start, length, chunk_size=SEND_CHUNK_SIZE):
+    """Отдать length байт файла с позиции start блоками постоянного размера.
+
+    Файл открывается при первой итерации, поэтому неначатый ответ не держит дескриптор.
+    """
+    with open(filepath, 'rb') as f:
+        f.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = f.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+def _multipart_byteranges(filepath, ranges, file_size, mimetype, boundary):
+    """Части multipart/byteranges и итоговая длина тела"""
+    parts = []
+    total = 0
+    for start, end in ranges:
+        header = (
+            f"--{boundary}\r\n"
+            f"Content-Type: {mimetype}\r\n"
+            f"Content-Range: bytes {start}-{end}/{file_size}\r\n\r\n"
+        ).encode('ascii')
+        parts.append((header, start, end))
+        total += len(header) + (end - start + 1) + 2
+    closing = f"--{boundary}--\r\n".encode('ascii')
+    total += len(closing)
+
+    def generate():
+        with open(filepath, 'rb') as f:
+            for header, start, end in parts:
+                yield header
+                f.seek(start)
+                remaining = end - start + 1
+                while remaining > 0:
+                    chunk = f.read(min(SEND_CHUNK_SIZE, remaining))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    yield chunk
+                yield b"\r\n"
+        yield closing
+
+    return generate(), total
+
+def send_cached_file(filepath, video_id, mimetype='audio/mpeg'):
+    """Отдать локальный файл с поддержкой Range без чтения диапазона в память"""
     file_size = os.path.getsize(filepath)
-    range_header = request.headers.get('Range', None)
+    ranges = parse_byte_ranges(request.headers.get('Range'), file_size)
     
-    if range_header and range_header.startswith('bytes='):
-        byte_range = range_header.replace('bytes=', '').split('-')
-        start_byte = int(byte_range[0]) if byte_range[0] else 0
-        end_byte = int(byte_range[1]) if len(byte_range) > 1 and byte_range[1] else file_size - 1
-        
-        end_byte = min(end_byte, file_size - 1)
+    if ranges == []:
+        print(f"[SendFile] Unsatisfiable range for {video_id}: {request.headers.get('Range')}")
+        response = Response(status=416)
+        response.headers['Content-Range'] = f'bytes */{file_size}'
+    elif ranges and len(ranges) == 1:
+        start_byte, end_byte = ranges[0]
         content_length = end_byte - start_byte + 1
         
         print(f"[SendFile] Range req {video_id}: {start_byte}-{end_byte}/{file_size}")
-        with open(filepath, 'rb') as f:
+        f = None
+        if end_byte == file_size - 1:
+            # Диапазон до конца файла: сервер может отдать его через sendfile
+            f = open(filepath, 'rb')
             f.seek(start_byte)
-            data = f.read(content_length)
+            body = wrap_file(request.environ, f, SEND_CHUNK_SIZE)
+        else:
+            body = iter_file_range(filepath, start_byte, content_length)
         
-        response = make_response(data)
-        response.headers['Content-Type'] = 'audio/mpeg'
+        response = Response(body, status=206, mimetype=mimetype, direct_passthrough=True)
+        if f is not None:
+            # Файл закрывается и тогда, когда клиент отключился до чтения тела
+            response.call_on_close(f.close)
         response.headers['Accept-Ranges'] = 'bytes'
         response.headers['Content-Range'] = f'bytes {start_byte}-{end_byte}/{file_size}'
         response.headers['Content-Length'] = str(content_length)
-        response.status_code = 206
+    elif ranges:
+        print(f"[SendFile] Multi-range req {video_id}: {len(ranges)} ranges/{file_size}")
+        boundary = uuid.uuid4().hex
+        body, content_length = _multipart_byteranges(filepath, ranges, file_size, mimetype, boundary)
+        
+        response = Response(body, status=206, direct_passthrough=True)
+        response.headers['Content-Type'] = f'multipart/byteranges; boundary={boundary}'
+        response.headers['Accept-Ranges'] = 'bytes'
+        response.headers['Content-Length'] = str(content_length)
     else:
         print(f"[SendFile] Full req {video_id}: {file_size}b")
         response = send_file(
             filepath,
-            mimetype='audio/mpeg',
+            mimetype=mimetype,
             as_attachment=False,
             conditional=True
         )
@@ -667,106 +908,234 @@ def send_cached_file(filepath, video_id):
     response.headers['Access-Control-Allow-Origin'] = '*'
     return response
 
-def preload_tracks_async(track_ids, ffmpeg_dir=None, cookie_file=None, current_track_id=None, context='adjacent_tracks'):
-    if not track_ids:
-        return
+def preload_track(track_id, context=None, ffmpeg_dir=None, cookie_file=None):
+    """Задача планировщика: получить и закэшировать ссылку для одного трека"""
+    audio_info = extract_audio_info(track_id, ffmpeg_dir, cookie_file)
+
+    if audio_info and audio_info.get('url'):
+        if context == 'url_refresh':
+            # Обновление истекающей ссылки сохраняет состояние прежней записи
+            with youtube_cache_lock:
+                previous = youtube_url_cache.get(track_id, {})
+            store_cached_url(
+                track_id, audio_info,
+                preloaded=previous.get('preloaded', False),
+                used=previous.get('used', False),
+                context=previous.get('context')
+            )
+            print(f"[YT] Refreshed near-expiry URL for {track_id}")
+            return True
+        store_cached_url(track_id, audio_info, preloaded=True, context=context)
+        print(f"[Preload] Cached URL for {track_id}: {audio_info['url'][:100]}...")
+        return True
+
+    print(f"[Preload] Failed to get URL for {track_id}")
+    return False
+
+def init_preload_scheduler(ffmpeg_dir=None, cookie_file=None):
+    global preload_scheduler
+    if preload_scheduler is None:
+        preload_scheduler = PreloadScheduler(
+            resolve_func=lambda track_id, context: preload_track(track_id, context, ffmpeg_dir, cookie_file),
+            is_cached_func=lambda track_id: is_url_cached_and_valid(track_id, min_remaining=URL_REFRESH_WINDOW),
+            rate_limited_func=extraction_scheduler.recently_rate_limited
+        )
+        preload_scheduler.start()
+    return preload_scheduler
+
+def schedule_preload(track_ids, current_track_id=None, context='adjacent_tracks'):
+    if not track_ids or preload_scheduler is None:
+        return 0
+
+    added = preload_scheduler.submit(track_ids, current_track_id, context)
+    print(f"[Preload] Queued {added}/{len(track_ids)} tracks (context: {context})")
+    return added
+
+def notify_current_track(track_id):
+    if preload_scheduler is not None:
+        preload_scheduler.set_current_track(track_id)
+
+def get_url_expiry(url):
+    """Время истечения ссылки googlevideo из параметра expire (или None)"""
+    try:
+        parsed = urllib.parse.urlparse(url)
+        expire = urllib.parse.parse_qs(parsed.query).get('expire')
+        if expire:
+            return float(expire[0])
+        # Некоторые ссылки несут параметры в пути: /expire/1700000000/
+        parts = parsed.path.split('/')
+        if 'expire' in parts:
+            return float(parts[parts.index('expire') + 1])
+    except (ValueError, IndexError):
+        pass
+    return None
+
+def entry_expires_at(entry):
+    return entry.get('expires_at') or entry['timestamp'] + DEFAULT_URL_TTL
+
+def entry_remaining(entry, now=None):
+    return entry_expires_at(entry) - (now or time.time())
+
+def is_url_cached_and_valid(track_id, min_remaining=URL_EXPIRY_SAFETY_MARGIN):
+    return get_cached_url(track_id, min_remaining=min_remaining) is not None
+
+def get_cached_url(video_id, mark_used=False, min_remaining=URL_EXPIRY_SAFETY_MARGIN):
+    """Короткая критическая секция: вернуть копию записи кэша или None.
+
+    Запись считается валидной, пока до реального истечения ссылки
+    остается больше min_remaining секунд.
+    """
+    with youtube_cache_lock:
+        cached = youtube_url_cache.get(video_id)
+        if cached:
+            if entry_remaining(cached) <= min_remaining:
+                return None
+            
+            youtube_url_cache.move_to_end(video_id)
+            entry = dict(cached)
+            if mark_used:
+                cached['preloaded'] = False
+                cached['used'] = True
+            return entry
     
-    print(f"[Preload] Starting async preload for {len(track_ids)} tracks (context: {context})")
+    # Промах в памяти: ссылка могла сохраниться с прошлого запуска
+    stored = load_stored_url(video_id, min_remaining)
+    if not stored:
+        return None
+    
+    with youtube_cache_lock:
+        cached = youtube_url_cache.setdefault(video_id, stored)
+        youtube_url_cache.move_to_end(video_id)
+        trim_url_cache_locked()
+        entry = dict(cached)
+        if mark_used:
+            cached['preloaded'] = False
+            cached['used'] = True
+    print(f"[YT] Restored URL for {video_id} from disk cache")
+    return entry
+
+def clear_url_cache(persistent=True):
+    """Очистить кэш ссылок в памяти и (по умолчанию) на диске"""
+    with youtube_cache_lock:
+        cache_size = len(youtube_url_cache)
+        youtube_url_cache.clear()
     
-    for i, track_id in enumerate(track_ids):
+    if persistent and url_cache_store is not None:
         try:
-            if context == 'adjacent_tracks' and current_track_id:
-                # Безопасная проверка текущего трека с таймаутом
-                try:
-                    if hasattr(current_playing_track_lock, 'acquire_timeout'):
-                        with current_playing_track_lock.acquire_timeout(timeout=2):
-                            if current_playing_track:
-                                current_id = current_playing_track.split(':')[-1]
-                                if current_id != current_track_id:
-                                    print(f"[Preload] Stopping - track changed from {current_track_id} to {current_id}")
-                                    break
-                    else:
-                        with current_playing_track_lock:
-                            if current_playing_track:
-                                current_id = current_playing_track.split(':')[-1]
-                                if current_id != current_track_id:
-                                    print(f"[Preload] Stopping - track changed from {current_track_id} to {current_id}")
-                                    break
-                except Exception as e:
-                    print(f"[Preload] Error checking current track: {e}")
-                    continue
-            
-            # Безопасная проверка кэша с таймаутом
-            try:
-                if hasattr(youtube_cache_lock, 'acquire_timeout'):
-                    with youtube_cache_lock.acquire_timeout(timeout=2):
-                        cached = youtube_url_cache.get(track_id)
-                        if cached and (time.time() - cached['timestamp'] < 3000):
-                            print(f"[Preload] Skip {track_id} - already cached")
-                            continue
-                else:
-                    with youtube_cache_lock:
-                        cached = youtube_url_cache.get(track_id)
-                        if cached and (time.time() - cached['timestamp'] < 3000):
-                            print(f"[Preload] Skip {track_id} - already cached")
-                            continue
-            except Exception as e:
-                print(f"[Preload] Error checking cache: {e}")
-                continue
-            
-            print(f"[Preload] Getting URL for track {i+1}/{len(track_ids)}: {track_id} (context: {context})")
-            
-            audio_info = extract_audio_info(track_id, ffmpeg_dir, cookie_file)
-            
-            if audio_info and audio_info.get('url'):
-                # Безопасное сохранение в кэш с таймаутом
-                try:
-                    if hasattr(youtube_cache_lock, 'acquire_timeout'):
-                        with youtube_cache_lock.acquire_timeout(timeout=5):
-                            youtube_url_cache[track_id] = {
-                                "url": audio_info['url'],
-                                "timestamp": time.time(),
-                                "format": audio_info.get('format_name', 'unknown'),
-                                "duration": audio_info.get('duration', 0),
-                                "preloaded": True,
-                                "context": context
-                            }
-                    else:
-                        with youtube_cache_lock:
-                            youtube_url_cache[track_id] = {
-                                "url": audio_info['url'],
-                                "timestamp": time.time(),
-                                "format": audio_info.get('format_name', 'unknown'),
-                                "duration": audio_info.get('duration', 0),
-                                "preloaded": True,
-                                "context": context
-                            }
-                except Exception as e:
-                    print(f"[Preload] Error caching track {track_id}: {e}")
-                    continue
-                
-                print(f"[Preload] Cached URL for {track_id}: {audio_info['url'][:100]}...")
-            else:
-                print(f"[Preload] Failed to get URL for {track_id}")
-                
+            url_cache_store.clear()
         except Exception as e:
-            print(f"[Preload] Error for track {track_id}: {e}")
-        
-        delay = 0.3 if context == 'shuffle_start' else 0.5
-        time.sleep(delay)
+            print(f"[URLStore] Clear error: {e}")
+    return cache_size
+
+def load_stored_url(video_id, min_remaining=URL_EXPIRY_SAFETY_MARGIN):
+    if url_cache_store is None:
+        return None
+    try:
+        stored = url_cache_store.get(video_id, min_remaining)
+    except Exception as e:
+        print(f"[URLStore] Read error for {video_id}: {e}")
+        return None
+    if stored:
+        stored['preloaded'] = False
+        stored['used'] = False
+    return stored
+
+def store_cached_url(video_id, audio_info, preloaded=False, used=False, context=None):
+    now = time.time()
+    entry = {
+        "url": audio_info['url'],
+        "timestamp": now,
+        "expires_at": get_url_expiry(audio_info['url']) or now + DEFAULT_URL_TTL,
+        "format": audio_info.get('format_name', 'unknown'),
+        "ext": audio_info.get('ext'),
+        "duration": audio_info.get('duration', 0),
+        "title": audio_info.get('title'),
+        "uploader": audio_info.get('uploader'),
+        "preloaded": preloaded,
+        "used": used
+    }
+    if context:
+        entry["context"] = context
+    
+    with youtube_cache_lock:
+        youtube_url_cache[video_id] = entry
+        youtube_url_cache.move_to_end(video_id)
+        trim_url_cache_locked()
     
-    print(f"[Preload] Completed preloading session (context: {context})")
+    if url_cache_store is not None:
+        try:
+            url_cache_store.put(video_id, entry)
+        except Exception as e:
+            print(f"[URLStore] Write error for {video_id}: {e}")
+    return entry
+
+def trim_url_cache_locked():
+    """Вытеснить давно не использованные записи сверх URL_CACHE_MAX_ENTRIES (под youtube_cache_lock)"""
+    excess = len(youtube_url_cache) - URL_CACHE_MAX_ENTRIES
+    for _ in range(excess):
+        youtube_url_cache.popitem(last=False)
+    return max(excess, 0)
 
-def is_url_cached_and_valid(track_id, max_age_seconds=3600):
+def refresh_url_async(video_id, ffmpeg_dir=None, cookie_file=None):
+    """Обновить ссылку в фоне через пул планировщика предзагрузки"""
+    if youtube_extract_flight is not None and youtube_extract_flight.in_flight(video_id):
+        return
+    if preload_scheduler is None:
+        return
+    preload_scheduler.submit([video_id], context='url_refresh')
+
+def refresh_expiring_urls(ffmpeg_dir=None, cookie_file=None, track_ids=None):
+    """Обновить записи из очереди, срок которых скоро истекает"""
+    with queued_tracks_lock:
+        wanted = set(track_ids) if track_ids is not None else set(queued_tracks)
+    with current_playing_track_lock:
+        if current_playing_track and current_playing_track.startswith('youtube:'):
+            wanted.add(current_playing_track.split(':', 1)[1])
+    
+    now = time.time()
     with youtube_cache_lock:
-        cached = youtube_url_cache.get(track_id)
-        if not cached:
-            return False
+        expiring = [
+            video_id for video_id, entry in youtube_url_cache.items()
+            if video_id in wanted and entry_remaining(entry, now) < URL_REFRESH_WINDOW
+        ]
+    
+    for video_id in expiring:
+        refresh_url_async(video_id, ffmpeg_dir, cookie_file)
+    
+    if expiring:
+        print(f"[YT] Refreshing {len(expiring)} near-expiry URLs")
+    return len(expiring)
+
+def resolve_stream_url(video_id, ffmpeg_dir=None, cookie_file=None):
+    """Получить прямой URL: из кэша или свежим извлечением.
+
+    yt-dlp выполняется вне youtube_cache_lock; одновременные промахи по
+    одному video_id объединяются через extract_audio_info (singleflight),
+    а разные треки извлекаются параллельно.
+    """
+    cached = get_cached_url(video_id, mark_used=True)
+    if cached:
+        if cached.get('preloaded', False):
+            print(f"[YT] Using preloaded URL: {video_id}")
+        else:
+            print(f"[YT] Cache hit: {video_id}")
         
-        age = time.time() - cached['timestamp']
-        return age < max_age_seconds
+        if entry_remaining(cached) < URL_REFRESH_WINDOW:
+            refresh_url_async(video_id, ffmpeg_dir, cookie_file)
+        return cached['url']
+    
+    print(f"[YT] Cache miss for {video_id}, extracting fresh URL")
+    audio_info = extract_audio_info(video_id, ffmpeg_dir, cookie_file)
+    if not audio_info or not audio_info.get('url'):
+        return None
+    
+    store_cached_url(video_id, audio_info, used=True)
+    print(f"[YT] Got fresh URL for {video_id}: {audio_info['url'][:100]}...")
+    return audio_info['url']
 
 def setup_youtube_routes(app, FFMPEG_DIR, COOKIE_FILE, CACHE_DIR, SAVED_DIR, load_saved_tracks):
+    init_url_cache_store(CACHE_DIR)
+    init_preload_scheduler(FFMPEG_DIR, COOKIE_FILE)
     
     @app.route('/api/stream/youtube', methods=['GET'])
     def stream_youtube():
@@ -793,69 +1162,28 @@ def setup_youtube_routes(app, FFMPEG_DIR, COOKIE_FILE, CACHE_DIR, SAVED_DIR, loa
             return jsonify({"error": "Video ID is required"}), 400
         
         try:
-            with youtube_cache_lock:
-                now = time.time()
-                cached = youtube_url_cache.get(video_id)
+            def open_upstream(range_value):
+                direct_url = resolve_stream_url(video_id, FFMPEG_DIR, COOKIE_FILE)
+                if not direct_url:
+                    return None
                 
-                if cached and (now - cached['timestamp'] < 3600):
-                    direct_url = cached['url']
-                    was_preloaded = cached.get('preloaded', False)
-                    
-                    cached['preloaded'] = False
-                    cached['used'] = True
-                    
-                    if was_preloaded:
-                        print(f"[YT] Using preloaded URL: {video_id}")
-                    else:
-                        print(f"[YT] Cache hit: {video_id}")
-                else:
-                    print(f"[YT] Cache miss for {video_id}, extracting fresh URL")
-                    audio_info = extract_audio_info(video_id, FFMPEG_DIR, COOKIE_FILE)
-                    if not audio_info or not audio_info.get('url'):
-                        return jsonify({"error": "No direct audio URL found"}), 500
-                    
-                    direct_url = audio_info['url']
-                    
-                    youtube_url_cache[video_id] = {
-                        "url": direct_url,
-                        "timestamp": time.time(),
-                        "format": audio_info.get('format_name', 'unknown'),
-                        "duration": audio_info.get('duration', 0),
-                        "preloaded": False,
-                        "used": True
-                    }
-                    print(f"[YT] Got fresh URL for {video_id}: {direct_url[:100]}...")
-            
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-            }
-            
-            if 'Range' in request.headers:
-                headers['Range'] = request.headers['Range']
-            
-            response = requests.get(direct_url, headers=headers, stream=True)
-            
-            if response.status_code not in [200, 206]:
-                print(f"[YT] Proxy error: {response.status_code}")
-                return jsonify({"error": f"Upstream error: {response.status_code}"}), 500
-            
-            def generate():
-                try:
-                    for chunk in response.iter_content(chunk_size=8192):
-                        if chunk:
-                            yield chunk
-                except Exception as e:
-                    print(f"[YT] Stream error: {e}")
+                headers = {
+                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+                }
+                if range_value:
+                    headers['Range'] = range_value
+                return http_pool.get(direct_url, headers=headers, stream=True)
             
-            flask_response = Response(
-                stream_with_context(generate()),
-                status=response.status_code,
-                mimetype='audio/mp4'
+            # Уже скачанные участки отдаются с диска без обращения к YouTube
+            flask_response = serve_audio(
+                f"youtube:{video_id}",
+                request.headers.get('Range'),
+                open_upstream,
+                'audio/mp4',
+                tag="YT"
             )
-            
-            for header in ['Content-Length', 'Content-Range', 'Accept-Ranges']:
-                if header in response.headers:
-                    flask_response.headers[header] = response.headers[header]
+            if isinstance(flask_response, tuple):
+                return flask_response
             
             flask_response.headers['Access-Control-Allow-Origin'] = '*'
             flask_response.headers['Access-Control-Allow-Methods'] = 'GET, OPTIONS'
@@ -1006,7 +1334,7 @@ def setup_youtube_routes(app, FFMPEG_DIR, COOKIE_FILE, CACHE_DIR, SAVED_DIR, loa
                     "error": "Playlist not found or not accessible"
                 }), 404
             
-            return jsonify({
+            return json_codec.json_response({
                 "success": True,
                 "playlist": playlist
             })
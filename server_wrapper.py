@@ -79,7 +79,9 @@ def start_server(port):
         sys.path.insert(0, server_dir)
         
         # Делаем скрипт запускаемым в режиме внешнего модуля
-        from server.app import app
+        from server.app import init_server
+        # Перенос библиотеки, маршруты сервисов и фоновые потоки - как при прямом запуске
+        app = init_server()
         
         # Запускаем сервер на указанном порту
         app.run(host='0.0.0.0', port=port, debug=False, threaded=True)